@@ -0,0 +1,44 @@
+"""Add upload index for content-addressed storage
+
+Revision ID: 5e1b7c3a9d24
+Revises: c7e2b95d0f13
+Create Date: 2026-10-19 16:02:37.410528
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1b7c3a9d24'
+down_revision: Union[str, Sequence[str], None] = 'c7e2b95d0f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'upload',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('content_type', sa.String(), nullable=False),
+        sa.Column('url', sa.String(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('last_uploaded_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_upload_id'), 'upload', ['id'], unique=False)
+    op.create_index(op.f('ix_upload_sha256'), 'upload', ['sha256'], unique=True)
+    op.create_index(op.f('ix_upload_url'), 'upload', ['url'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_upload_url'), table_name='upload')
+    op.drop_index(op.f('ix_upload_sha256'), table_name='upload')
+    op.drop_index(op.f('ix_upload_id'), table_name='upload')
+    op.drop_table('upload')
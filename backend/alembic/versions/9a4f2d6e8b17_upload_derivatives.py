@@ -0,0 +1,35 @@
+"""Add image derivative columns to upload
+
+Revision ID: 9a4f2d6e8b17
+Revises: 5e1b7c3a9d24
+Create Date: 2026-10-19 17:21:09.552813
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4f2d6e8b17'
+down_revision: Union[str, Sequence[str], None] = '5e1b7c3a9d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('upload', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('upload', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('upload', sa.Column('blurhash', sa.String(), nullable=True))
+    op.add_column('upload', sa.Column('variants', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('upload', 'variants')
+    op.drop_column('upload', 'blurhash')
+    op.drop_column('upload', 'height')
+    op.drop_column('upload', 'width')
@@ -0,0 +1,31 @@
+"""Case-insensitive unique indexes on user.username and user.email
+
+Revision ID: a41d07e6c952
+Revises: 3f9c2a7d41b8
+Create Date: 2026-10-19 11:03:47.602115
+
+Fails if existing rows differ only by case; merge those accounts first.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41d07e6c952'
+down_revision: Union[str, Sequence[str], None] = '3f9c2a7d41b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_user_username_lower', 'user', [sa.text('lower(username)')], unique=True)
+    op.create_index('ix_user_email_lower', 'user', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_email_lower', table_name='user')
+    op.drop_index('ix_user_username_lower', table_name='user')
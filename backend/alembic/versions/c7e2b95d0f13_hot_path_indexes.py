@@ -0,0 +1,38 @@
+"""Indexes for hot queries: route_poi.poi_id, user.xp, POI location GiST
+
+Revision ID: c7e2b95d0f13
+Revises: a41d07e6c952
+Create Date: 2026-10-19 13:26:51.730914
+
+Found by the query plan suite (app/tests/perf). The GiST index is named
+as the initial revision's downgrade expects; databases built with
+metadata.create_all already have it, hence IF NOT EXISTS.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e2b95d0f13'
+down_revision: Union[str, Sequence[str], None] = 'a41d07e6c952'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_route_poi_poi_id'), 'route_poi', ['poi_id'], unique=False)
+    op.create_index(op.f('ix_user_xp'), 'user', ['xp'], unique=False)
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS idx_point_of_interest_location '
+        'ON point_of_interest USING gist (location)'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # idx_point_of_interest_location is left for 861a7610a375's downgrade to drop.
+    op.drop_index(op.f('ix_user_xp'), table_name='user')
+    op.drop_index(op.f('ix_route_poi_poi_id'), table_name='route_poi')
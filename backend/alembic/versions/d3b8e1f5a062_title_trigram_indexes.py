@@ -0,0 +1,39 @@
+"""Trigram indexes on POI and route titles for admin search
+
+Revision ID: d3b8e1f5a062
+Revises: 9a4f2d6e8b17
+Create Date: 2026-10-19 20:04:37.118406
+
+The admin lists search titles with ILIKE '%term%', which a btree can't
+serve; gin_trgm_ops can.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3b8e1f5a062'
+down_revision: Union[str, Sequence[str], None] = '9a4f2d6e8b17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_point_of_interest_title_trgm', 'point_of_interest', ['title'], unique=False,
+        postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'},
+    )
+    op.create_index(
+        'ix_route_title_trgm', 'route', ['title'], unique=False,
+        postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_route_title_trgm', table_name='route')
+    op.drop_index('ix_point_of_interest_title_trgm', table_name='point_of_interest')
@@ -0,0 +1,100 @@
+"""Catalog change versions, timestamps and tombstones for delta sync
+
+Revision ID: e6a2c4f81b39
+Revises: d3b8e1f5a062
+Create Date: 2026-10-19 21:12:05.604217
+
+Existing rows get a version each from the new sequence; from then on the
+triggers (the same definitions as app.db.sync.CATALOG_DDL, inlined here)
+stamp writes and record deletes.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a2c4f81b39'
+down_revision: Union[str, Sequence[str], None] = 'd3b8e1f5a062'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('point_of_interest', 'route', 'route_poi')
+LOCK_KEY = 0x63617467
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE SEQUENCE catalog_change_seq')
+    for table in TABLES:
+        op.add_column(table, sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+        op.add_column(table, sa.Column('change_version', sa.BigInteger(), nullable=True))
+        op.execute(f"UPDATE {table} SET change_version = nextval('catalog_change_seq')")
+        op.alter_column(table, 'change_version', nullable=False)
+        op.create_index(op.f(f'ix_{table}_change_version'), table, ['change_version'], unique=True)
+
+    op.create_table(
+        'catalog_tombstone',
+        sa.Column('change_version', sa.BigInteger(), server_default=sa.text("nextval('catalog_change_seq')"), nullable=False),
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('row_id', sa.Integer(), nullable=False),
+        sa.Column('poi_id', sa.Integer(), nullable=True),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('change_version'),
+    )
+
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION catalog_stamp() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock({LOCK_KEY});
+            NEW.change_version := nextval('catalog_change_seq');
+            IF TG_OP = 'UPDATE' THEN
+                NEW.created_at := OLD.created_at;
+                NEW.updated_at := now();
+            END IF;
+            RETURN NEW;
+        END
+        $$
+    """)
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION catalog_tombstones() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock({LOCK_KEY});
+            IF TG_TABLE_NAME = 'route_poi' THEN
+                INSERT INTO catalog_tombstone (table_name, row_id, poi_id)
+                SELECT TG_TABLE_NAME, route_id, poi_id FROM gone;
+            ELSE
+                INSERT INTO catalog_tombstone (table_name, row_id)
+                SELECT TG_TABLE_NAME, id FROM gone;
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    """)
+    for table in TABLES:
+        op.execute(
+            f"CREATE TRIGGER {table}_stamp BEFORE INSERT OR UPDATE ON {table} "
+            "FOR EACH ROW EXECUTE FUNCTION catalog_stamp()"
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_tombstones AFTER DELETE ON {table} "
+            "REFERENCING OLD TABLE AS gone FOR EACH STATEMENT EXECUTE FUNCTION catalog_tombstones()"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        op.execute(f'DROP TRIGGER {table}_tombstones ON {table}')
+        op.execute(f'DROP TRIGGER {table}_stamp ON {table}')
+    op.execute('DROP FUNCTION catalog_tombstones()')
+    op.execute('DROP FUNCTION catalog_stamp()')
+    op.drop_table('catalog_tombstone')
+    for table in TABLES:
+        op.drop_index(op.f(f'ix_{table}_change_version'), table_name=table)
+        op.drop_column(table, 'change_version')
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'created_at')
+    op.execute('DROP SEQUENCE catalog_change_seq')
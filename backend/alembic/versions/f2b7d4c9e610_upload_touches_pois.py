@@ -0,0 +1,55 @@
+"""Re-stamp POIs when their upload's derivatives change
+
+Revision ID: f2b7d4c9e610
+Revises: e6a2c4f81b39
+Create Date: 2026-10-19 23:40:12.318044
+
+Same definitions as app.db.sync.CATALOG_DDL. POIs whose images already
+have derivatives are re-stamped once, so clients that synced them before
+the derivatives were ready pick up the image info.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b7d4c9e610'
+down_revision: Union[str, Sequence[str], None] = 'e6a2c4f81b39'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_point_of_interest_historic_image_url'), 'point_of_interest', ['historic_image_url'], unique=False)
+    op.create_index(op.f('ix_point_of_interest_modern_image_url'), 'point_of_interest', ['modern_image_url'], unique=False)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION catalog_touch_images() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE point_of_interest SET updated_at = now()
+            WHERE historic_image_url = NEW.url OR modern_image_url = NEW.url;
+            RETURN NULL;
+        END
+        $$
+    """)
+    op.execute("""
+        CREATE TRIGGER upload_touch_pois AFTER UPDATE OF width, height, blurhash, variants ON upload
+        FOR EACH ROW
+        WHEN ((OLD.width, OLD.height, OLD.blurhash, OLD.variants) IS DISTINCT FROM
+              (NEW.width, NEW.height, NEW.blurhash, NEW.variants))
+        EXECUTE FUNCTION catalog_touch_images()
+    """)
+    op.execute("""
+        UPDATE point_of_interest SET updated_at = now()
+        WHERE historic_image_url IN (SELECT url FROM upload WHERE variants IS NOT NULL)
+           OR modern_image_url IN (SELECT url FROM upload WHERE variants IS NOT NULL)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER upload_touch_pois ON upload')
+    op.execute('DROP FUNCTION catalog_touch_images()')
+    op.drop_index(op.f('ix_point_of_interest_modern_image_url'), table_name='point_of_interest')
+    op.drop_index(op.f('ix_point_of_interest_historic_image_url'), table_name='point_of_interest')
@@ -1,7 +1,10 @@
-from typing import Generator
+import hmac
+import ipaddress
+import math
+from typing import List, Union
 
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import jwt
 from pydantic import ValidationError
 from sqlalchemy import select
@@ -9,22 +12,115 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
 from app.core import security
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.db.session import AsyncSessionLocal
+from app.core.ratelimit import TokenBucketLimiter
+from app.db.session import get_db, get_read_db, release_connection
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
 )
 
+# user id -> schemas.UserPrincipal, so steady-state auth costs no DB query.
+principal_cache = TTLCache(
+    maxsize=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS
+)
+# User ids whose cached principal was checked against the user row within
+# USER_CACHE_REVALIDATE_SECONDS.
+principal_checked = TTLCache(
+    maxsize=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_REVALIDATE_SECONDS
+)
 
-async def get_db() -> Generator:
-    async with AsyncSessionLocal() as session:
-        yield session
 
+def invalidate_user(user_id: int) -> None:
+    """
+    Drop a cached principal. Call after any write to the user row.
 
-async def get_current_user(
-    db: AsyncSession = Depends(get_db), token: str = Depends(reusable_oauth2)
-) -> models.User:
+    Only this process's cache is cleared; other workers notice the change
+    at their next check of token_version and is_active, within
+    USER_CACHE_REVALIDATE_SECONDS.
+    """
+    principal_cache.pop(user_id)
+    principal_checked.pop(user_id)
+
+
+# Every login attempt costs a full bcrypt verify, so floods are cut off
+# here before any DB or password work happens.
+login_ip_limiter = TokenBucketLimiter(
+    rate_per_minute=settings.LOGIN_RATE_LIMIT_IP_PER_MINUTE,
+    burst=settings.LOGIN_RATE_LIMIT_IP_BURST,
+    max_keys=settings.LOGIN_RATE_LIMIT_MAX_KEYS,
+)
+login_account_limiter = TokenBucketLimiter(
+    rate_per_minute=settings.LOGIN_RATE_LIMIT_ACCOUNT_PER_MINUTE,
+    burst=settings.LOGIN_RATE_LIMIT_ACCOUNT_BURST,
+    max_keys=settings.LOGIN_RATE_LIMIT_MAX_KEYS,
+)
+
+
+def _in_networks(address: str, networks: List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_address(request: Request) -> str:
+    """
+    The address a request came from. When the peer is one of
+    TRUSTED_PROXIES it is the rightmost X-Forwarded-For hop that is not
+    itself a trusted proxy: hops further left are whatever the client sent
+    and can be forged.
+    """
+    peer = request.client.host if request.client else "unknown"
+    proxies = [ipaddress.ip_network(proxy, strict=False) for proxy in settings.TRUSTED_PROXIES]
+    if not _in_networks(peer, proxies):
+        return peer
+    hops = [hop.strip() for value in request.headers.getlist("x-forwarded-for") for hop in value.split(",")]
+    hops = [hop for hop in hops if hop]
+    for hop in reversed(hops):
+        if not _in_networks(hop, proxies):
+            return hop
+    return hops[0] if hops else peer
+
+
+def require_metrics_access(request: Request) -> None:
+    """
+    Allow /metrics to METRICS_ALLOWED_NETWORKS and holders of METRICS_TOKEN.
+    """
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+            return
+    networks = [ipaddress.ip_network(network, strict=False) for network in settings.METRICS_ALLOWED_NETWORKS]
+    if not _in_networks(client_address(request), networks):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to read metrics")
+
+
+async def login_rate_limit(
+    request: Request, form_data: OAuth2PasswordRequestForm = Depends()
+) -> None:
+    retry_after = login_ip_limiter.hit(client_address(request))
+    if not retry_after:
+        retry_after = login_account_limiter.hit(form_data.username.lower())
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+async def get_principal(db: AsyncSession, token: str) -> schemas.UserPrincipal:
+    """
+    Resolve a bearer token to a principal, from the cache when possible.
+
+    A cached principal is re-checked against the user row's token_version
+    and is_active every USER_CACHE_REVALIDATE_SECONDS, so a password change
+    or deactivation in another process takes effect here within that
+    window; other fields may stay stale for up to USER_CACHE_TTL_SECONDS.
+    """
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -35,26 +131,60 @@ async def get_current_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    
-    result = await db.execute(select(models.User).where(models.User.id == int(token_data.sub)))
-    user = result.scalars().first()
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+    user_id = int(token_data.sub)
+    principal = principal_cache.get(user_id)
+    # A token of another version means the user changed since the entry
+    # was cached, here or elsewhere.
+    if principal is not None and token_data.ver is not None and token_data.ver != principal.token_version:
+        principal = None
+    if principal is not None and principal_checked.get(user_id) is None:
+        # Primary-key lookup of the two columns that revoke access.
+        result = await db.execute(
+            select(models.User.token_version, models.User.is_active).where(models.User.id == user_id)
+        )
+        if tuple(result.first() or ()) != (principal.token_version, principal.is_active):
+            principal = None
+        else:
+            principal_checked.set(user_id, True)
+            await release_connection(db)
+    if principal is None:
+        result = await db.execute(select(models.User).where(models.User.id == user_id))
+        user = result.scalars().first()
+        if not user:
+            principal_cache.pop(user_id)
+            raise HTTPException(status_code=404, detail="User not found")
+        principal = schemas.UserPrincipal.model_validate(user)
+        principal_cache.set(user_id, principal)
+        principal_checked.set(user_id, True)
+        # Don't keep the connection while the handler does non-DB work.
+        await release_connection(db)
+
+    if token_data.ver is not None and token_data.ver != principal.token_version:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+    return principal
+
+
+async def get_current_user(
+    db: AsyncSession = Depends(get_db), token: str = Depends(reusable_oauth2)
+) -> schemas.UserPrincipal:
+    return await get_principal(db, token)
 
 
 def get_current_active_user(
-    current_user: models.User = Depends(get_current_user),
-) -> models.User:
+    current_user: schemas.UserPrincipal = Depends(get_current_user),
+) -> schemas.UserPrincipal:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 
 def get_current_active_superuser(
-    current_user: models.User = Depends(get_current_active_user),
-) -> models.User:
+    current_user: schemas.UserPrincipal = Depends(get_current_active_user),
+) -> schemas.UserPrincipal:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=400, detail="The user doesn't have enough privileges"
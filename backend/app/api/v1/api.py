@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import auth, users, pois, routes, progress, files
+from app.api.v1.endpoints import auth, users, pois, routes, progress, files, profiles, image_proxy, sync, packs
 
 api_router = APIRouter()
 api_router.include_router(auth.router, tags=["auth"])
@@ -9,3 +9,7 @@ api_router.include_router(pois.router, prefix="/pois", tags=["pois"])
 api_router.include_router(routes.router, prefix="/routes", tags=["routes"])
 api_router.include_router(progress.router, prefix="/progress", tags=["progress"])
 api_router.include_router(files.router, prefix="/files", tags=["files"])
+api_router.include_router(image_proxy.router, prefix="/images", tags=["images"])
+api_router.include_router(sync.router, prefix="/sync", tags=["sync"])
+api_router.include_router(packs.router, prefix="/packs", tags=["packs"])
+api_router.include_router(profiles.router, prefix="/profiles", tags=["profiles"])
@@ -3,7 +3,8 @@ from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy import select, or_
+from sqlalchemy import func, select, or_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
@@ -14,31 +15,51 @@ from app.core.config import settings
 router = APIRouter()
 
 
-@router.post("/login/access-token", response_model=schemas.Token)
+@router.post(
+    "/login/access-token",
+    response_model=schemas.Token,
+    dependencies=[Depends(deps.login_rate_limit)],
+)
 async def login_access_token(
     db: AsyncSession = Depends(deps.get_db), form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests.
     """
-    # Find user by username
-    result = await db.execute(select(models.User).where(models.User.username == form_data.username))
+    # Find user by username or email in one lookup over the lower() indexes.
+    # A username match wins if the identity is also someone else's email.
+    identity = form_data.username.lower()
+    username_match = func.lower(models.User.username) == identity
+    result = await db.execute(
+        select(models.User)
+        .where(or_(username_match, func.lower(models.User.email) == identity))
+        .order_by(username_match.desc())
+        .limit(1)
+    )
     user = result.scalars().first()
-    
-    # If not found, try email
+
     if not user:
-        result = await db.execute(select(models.User).where(models.User.email == form_data.username))
-        user = result.scalars().first()
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
 
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    verified, new_hash = await security.verify_and_update_password(
+        form_data.password, user.hashed_password
+    )
+    if not verified:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-        
+
+    # Hash was made with outdated pwd_context parameters, upgrade it transparently.
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     return {
         "access_token": security.create_access_token(
-            user.id, expires_delta=access_token_expires
+            user.id,
+            expires_delta=access_token_expires,
+            token_version=user.token_version,
         ),
         "token_type": "bearer",
     }
@@ -53,30 +74,41 @@ async def register(
     """
     Create new user.
     """
-    # Check if user exists
-    result = await db.execute(select(models.User).where(models.User.email == user_in.email))
-    user = result.scalars().first()
-    if user:
-        raise HTTPException(
-            status_code=400,
-            detail="The user with this email already exists in the system.",
+    email = user_in.email.lower()
+    username = user_in.username.lower()
+
+    # Insert straight away and let the unique indexes catch duplicates.
+    result = await db.execute(
+        insert(models.User)
+        .values(
+            email=user_in.email,
+            username=user_in.username,
+            hashed_password=await security.hash_password(user_in.password),
+            is_active=True,
         )
-    
-    result = await db.execute(select(models.User).where(models.User.username == user_in.username))
+        .on_conflict_do_nothing()
+        .returning(models.User)
+    )
     user = result.scalars().first()
-    if user:
+
+    if not user:
+        # Only the conflict path pays for a lookup, to say which field clashed.
+        email_taken = func.lower(models.User.email) == email
+        result = await db.execute(
+            select(email_taken)
+            .where(or_(email_taken, func.lower(models.User.username) == username))
+            .order_by(email_taken.desc())
+            .limit(1)
+        )
+        if result.scalar():
+            raise HTTPException(
+                status_code=400,
+                detail="The user with this email already exists in the system.",
+            )
         raise HTTPException(
              status_code=400,
              detail="The user with this username already exists.",
         )
 
-    user = models.User(
-        email=user_in.email,
-        username=user_in.username,
-        hashed_password=security.get_password_hash(user_in.password),
-        is_active=True,
-    )
-    db.add(user)
     await db.commit()
-    await db.refresh(user)
     return user
@@ -1,38 +1,144 @@
+import tempfile
 from typing import Any
-import shutil
-import os
-import uuid
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
-from app import models
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Request, Response
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models, schemas
 from app.api import deps
+from app.core import images, uploads
+from app.core.config import settings
+from app.core.storage import decode_direct_upload_token, default_storage
 
 router = APIRouter()
 
-UPLOAD_DIR = "app/uploads"
 
-@router.post("/upload", response_model=dict)
+async def record_upload(db: AsyncSession, info: uploads.UploadInfo) -> bool:
+    """
+    Index a stored blob and queue its derivatives. Returns True if the
+    index row is new.
+    """
+    # New blobs get an index row; duplicates refresh last_uploaded_at so
+    # garbage collection gives them the same grace period as a new upload.
+    result = await db.execute(
+        insert(models.Upload)
+        .values(sha256=info.sha256, size=info.size, content_type=info.content_type, url=info.url)
+        .on_conflict_do_update(index_elements=["sha256"], set_={"last_uploaded_at": func.now()})
+        .returning(models.Upload.id, models.Upload.variants, literal_column("xmax = 0"))
+    )
+    upload_id, variants, inserted = result.one()
+    await db.commit()
+
+    # Thumbnails and WebP/AVIF copies are made off the request path.
+    if variants is None:
+        images.derivative_pipeline.schedule(upload_id, info.name)
+    return inserted
+
+
+def requested_upload(upload_in: schemas.UploadRequest) -> uploads.UploadInfo:
+    if upload_in.size > settings.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=str(uploads.UploadTooLarge(settings.MAX_UPLOAD_BYTES)))
+    extension = uploads.IMAGE_EXTENSIONS.get(upload_in.content_type)
+    if extension is None:
+        raise HTTPException(status_code=415, detail=str(uploads.UnsupportedUpload()))
+    return uploads.UploadInfo(upload_in.sha256, upload_in.size, upload_in.content_type, extension)
+
+
+@router.post("/upload", response_model=schemas.UploadResult)
 async def upload_file(
     file: UploadFile = File(...),
-    current_user: models.User = Depends(deps.get_current_active_superuser),
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Upload an image through the API. Only superusers.
+    Returns the URL to the uploaded file; identical images share one URL.
+    """
+    try:
+        info = await uploads.inspect_upload(file)
+        written = await uploads.store_upload(file, info)
+    except uploads.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except uploads.UnsupportedUpload as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Could not upload file: {e}")
+
+    await record_upload(db, info)
+    return {"url": info.url, "sha256": info.sha256, "size": info.size, "deduplicated": not written}
+
+
+@router.post("/presign", response_model=schemas.PresignedUpload)
+async def presign_upload(
+    upload_in: schemas.UploadRequest,
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
 ) -> Any:
     """
-    Upload a file. Only superusers.
-    Returns the URL to the uploaded file.
+    Start a direct upload. Only superusers.
+    PUT the bytes to `upload_url` with `headers`, then call /complete.
     """
-    if not os.path.exists(UPLOAD_DIR):
-        os.makedirs(UPLOAD_DIR)
+    info = requested_upload(upload_in)
+    presigned = {"url": info.url, "sha256": info.sha256}
+    if not await default_storage.exists(info.name):
+        put = await default_storage.presign_put(info.name, info.content_type, info.size, info.sha256)
+        presigned.update(upload_url=put.url, headers=put.headers, expires_in=put.expires_in)
+    return presigned
 
-    # Generate unique filename
-    file_ext = file.filename.split(".")[-1] if "." in file.filename else "png"
-    file_name = f"{uuid.uuid4()}.{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, file_name)
 
+@router.put("/direct/{token}", status_code=204, include_in_schema=False)
+async def direct_upload(token: str, request: Request) -> Response:
+    """
+    Target of local-storage presigned PUTs; the token is the credential.
+    """
+    claims = decode_direct_upload_token(token)
+    if claims is None:
+        raise HTTPException(status_code=403, detail="Upload URL is invalid or expired")
+
+    file = UploadFile(tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_CHUNK_SIZE))
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Could not upload file: {e}")
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > claims["size"]:
+                raise HTTPException(status_code=413, detail="Body is larger than the presigned size")
+            await file.write(chunk)
+        try:
+            info = await uploads.inspect_upload(file)
+        except uploads.UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except uploads.UnsupportedUpload as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        if info.name != claims["sub"]:
+            raise HTTPException(status_code=400, detail="Body does not match the presigned checksum or type")
+        await uploads.store_upload(file, info)
+    finally:
+        await file.close()
+    return Response(status_code=204)
+
+
+@router.post("/complete", response_model=schemas.UploadResult)
+async def complete_upload(
+    upload_in: schemas.UploadRequest,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Record a direct upload once its bytes are in storage. Only superusers.
+    """
+    info = requested_upload(upload_in)
+    stored = await default_storage.info(info.name)
+    if stored is None:
+        raise HTTPException(status_code=400, detail="Nothing was uploaded for this checksum")
+    if stored.sha256 is not None and stored.sha256 != info.sha256:
+        # Bytes under a name that isn't their hash can't be served.
+        await default_storage.delete(info.name)
+        raise HTTPException(status_code=400, detail="Stored object does not match its checksum")
+    kind = uploads.sniff_image_type(stored.head)
+    if kind is None or kind[0] != info.content_type:
+        await default_storage.delete(info.name)
+        raise HTTPException(status_code=415, detail=str(uploads.UnsupportedUpload()))
+    if stored.size != info.size:
+        raise HTTPException(status_code=400, detail="Size does not match the stored object")
 
-    # Return URL
-    # Assuming mounted at /static
-    return {"url": f"/static/{file_name}"}
+    inserted = await record_upload(db, info)
+    return {"url": info.url, "sha256": info.sha256, "size": info.size, "deduplicated": not inserted}
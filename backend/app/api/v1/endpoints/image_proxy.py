@@ -0,0 +1,53 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
+
+from app.core.config import settings
+from app.core.image_proxy import ImageProxyError, image_proxy, select_variant
+
+router = APIRouter()
+
+
+def accepted_formats(request: Request, format: Optional[str]) -> List[str]:
+    if format:
+        return [format]
+    accept = request.headers.get("accept", "")
+    return [fmt for fmt in settings.IMAGE_VARIANT_FORMATS if f"image/{fmt}" in accept]
+
+
+@router.get("/proxy")
+async def proxy_image(
+    request: Request,
+    url: str = Query(..., max_length=2048),
+    w: Optional[int] = Query(None, gt=0, le=4096),
+    format: Optional[str] = Query(None, pattern="^(webp|avif|jpeg)$"),
+) -> Response:
+    """
+    Serve a remote image from the local cache, fetching it on first use.
+    With `w`, the closest derivative in `format` (or the best the Accept
+    header allows) is served once generated; until then, the original.
+    """
+    if not settings.IMAGE_PROXY_ENABLED:
+        raise HTTPException(status_code=404, detail="Image proxy is disabled")
+    try:
+        entry = await image_proxy.get(url)
+    except ImageProxyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    variant = select_variant(entry.variants, w, accepted_formats(request, format))
+    if variant is None:
+        name, media_type, etag = entry.name, entry.content_type, entry.sha256
+    else:
+        name = variant["name"]
+        media_type = f"image/{variant['format']}"
+        etag = f"{entry.sha256}-w{variant['width']}.{variant['format']}"
+    headers = {
+        "Cache-Control": f"public, max-age={settings.IMAGE_PROXY_MAX_AGE}",
+        "ETag": f'"{etag}"',
+    }
+    if w is not None and format is None:
+        headers["Vary"] = "Accept"
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(image_proxy.path(name), media_type=media_type, headers=headers)
@@ -0,0 +1,49 @@
+import os
+from typing import Any, List
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+
+from app import schemas
+from app.core.config import settings
+from app.core.packs import read_manifest
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[schemas.OfflinePack])
+async def read_packs() -> Any:
+    """
+    Offline packs available for download, one per region.
+    """
+    manifest = await run_in_threadpool(read_manifest, settings.OFFLINE_PACK_DIR)
+    return [
+        {**entry, "url": f"{settings.API_V1_STR}/packs/{region}"}
+        for region, entry in sorted(manifest.items())
+    ]
+
+
+@router.get("/{region}")
+async def download_pack(request: Request, region: str) -> Response:
+    """
+    The region's pack as a SQLite file. Supports Range and If-Range, so an
+    interrupted download resumes; after a rebuild the ETag changes and a
+    resume with the old one gets the whole new file.
+    """
+    entry = (await run_in_threadpool(read_manifest, settings.OFFLINE_PACK_DIR)).get(region)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No pack for this region")
+    headers = {
+        # Revalidate: the pack behind this URL changes with the catalog.
+        "Cache-Control": "public, no-cache",
+        "ETag": f'"{entry["sha256"]}"',
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(
+        os.path.join(settings.OFFLINE_PACK_DIR, entry["file"]),
+        media_type="application/vnd.sqlite3",
+        filename=f"{region}-{entry['version']}.sqlite3",
+        headers=headers,
+    )
@@ -1,78 +1,156 @@
-from typing import Any, List
+from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from sqlalchemy import Select, and_, delete, func, insert, literal, select, true, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
 from geoalchemy2.shape import to_shape, from_shape
 from shapely.geometry import Point
 
 from app import models, schemas
 from app.api import deps
+from app.core import uploads
+from app.core.catalog import catalog_poi, catalog_poi_query
+from app.core.image_proxy import proxied_image
+from app.models.route import route_poi_association
+from app.web.pagination import contains
 
 router = APIRouter()
 
+
+def poi_to_schema(
+    poi: models.PointOfInterest, images: Optional[Dict[str, schemas.Image]] = None
+) -> schemas.PointOfInterest:
+    """
+    Build the response schema, converting the WKB location to lat/lon.
+    `images` (from uploads.load_images) adds derivative info per image URL;
+    images on allowed remote hosts point at the caching proxy.
+    """
+    point = to_shape(poi.location)
+    historic_url, modern_url = poi.historic_image_url, poi.modern_image_url
+    return schemas.PointOfInterest(
+        id=poi.id,
+        title=poi.title,
+        description=poi.description,
+        historic_image_url=historic_url,
+        modern_image_url=modern_url,
+        latitude=point.y,
+        longitude=point.x,
+        historic_image=(images and images.get(historic_url)) or proxied_image(historic_url),
+        modern_image=(images and images.get(modern_url)) or proxied_image(modern_url),
+    )
+
+
+def poi_columns(poi) -> List[ColumnElement]:
+    """
+    RETURNING list for writes to the point_of_interest table, with the
+    location as lat/lon.
+    """
+    return [
+        poi.c.id,
+        poi.c.title,
+        poi.c.description,
+        poi.c.historic_image_url,
+        poi.c.modern_image_url,
+        func.ST_Y(poi.c.location).label("latitude"),
+        func.ST_X(poi.c.location).label("longitude"),
+    ]
+
+
+def poi_row_to_schema(row: Any, prefix: str = "") -> schemas.PointOfInterest:
+    """
+    Response schema from a row shaped by poi_columns, its column names
+    optionally prefixed.
+    """
+    values = {name: getattr(row, prefix + name) for name in (
+        "id", "title", "description", "historic_image_url", "modern_image_url", "latitude", "longitude",
+    )}
+    return schemas.PointOfInterest(
+        **values,
+        historic_image=proxied_image(values["historic_image_url"]),
+        modern_image=proxied_image(values["modern_image_url"]),
+    )
+
+
+def image_refs(
+    rows, delta: int, historic: str = "historic_image_url", modern: str = "modern_image_url"
+) -> List[Select]:
+    """
+    (url, delta) changes for uploads.adjust_refs, one per image column of `rows`.
+    """
+    return [select(rows.c[column].label("url"), literal(delta).label("delta")) for column in (historic, modern)]
+
+
+def poi_filters(q: Optional[str], images: str) -> List[ColumnElement]:
+    """
+    WHERE clauses for the admin POI filters, shared by the list and bulk actions.
+    """
+    poi = models.PointOfInterest
+    clauses = []
+    if q:
+        clauses.append(contains(poi.title, q))
+    has_image = poi.historic_image_url.isnot(None) | poi.modern_image_url.isnot(None)
+    if images == "with":
+        clauses.append(has_image)
+    elif images == "without":
+        clauses.append(~has_image)
+    return clauses
+
+
+def bulk_selection(ids: Optional[List[int]], filters: Optional[List[ColumnElement]], id_column) -> ColumnElement:
+    """
+    WHERE clause for a bulk action: an explicit id list or a list filter
+    (an empty filter selects every row).
+    """
+    if (ids is None) == (filters is None):
+        raise HTTPException(status_code=400, detail="Select rows with either ids or filter")
+    if ids is not None:
+        return id_column.in_(ids)
+    return and_(true(), *filters)
+
+
 @router.get("/")
-async def read_pois(db: AsyncSession = Depends(deps.get_db)) -> Any:
+async def read_pois(db: AsyncSession = Depends(deps.get_read_db)) -> Any:
     # Fallback to RAW SQL to avoid ORM/GeoAlchemy crashes in this environment
-    from sqlalchemy import text
-    result = await db.execute(text("SELECT id, title, description, historic_image_url, modern_image_url, ST_X(location::geometry) as lon, ST_Y(location::geometry) as lat FROM point_of_interest"))
+    result = await db.execute(catalog_poi_query())
     rows = result.all()
-    
-    poi_list = []
-    for row in rows:
-        poi_list.append({
-            "id": row.id,
-            "title": row.title,
-            "description": row.description,
-            "historic_image_url": row.historic_image_url,
-            "modern_image_url": row.modern_image_url,
-            "latitude": row.lat,
-            "longitude": row.lon
-        })
-    return poi_list
+    await deps.release_connection(db)
+    return [catalog_poi(row) for row in rows]
+
 
 @router.post("/", response_model=schemas.PointOfInterest)
 async def create_poi(
     *,
     db: AsyncSession = Depends(deps.get_db),
     poi_in: schemas.PointOfInterestCreate,
-    current_user: models.User = Depends(deps.get_current_active_superuser),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
 ) -> Any:
     """
     Create new POI. Only superusers.
     """
-    # Create GIS point
-    # Note: geoalchemy2 handles WKT.
-    # WKT for Point is 'POINT(x y)' -> 'POINT(lon lat)'
-    wkt_location = f'POINT({poi_in.longitude} {poi_in.latitude})'
-    
-    poi = models.PointOfInterest(
-        title=poi_in.title,
-        description=poi_in.description,
-        historic_image_url=poi_in.historic_image_url,
-        modern_image_url=poi_in.modern_image_url,
-        location=wkt_location 
+    poi = models.PointOfInterest.__table__
+    # WKT for Point is 'POINT(lon lat)'; geoalchemy2 adds the SRID.
+    created = (
+        insert(poi)
+        .values(
+            title=poi_in.title,
+            description=poi_in.description,
+            historic_image_url=poi_in.historic_image_url,
+            modern_image_url=poi_in.modern_image_url,
+            location=f"POINT({poi_in.longitude} {poi_in.latitude})",
+        )
+        .returning(*poi_columns(poi))
+        .cte("created")
     )
-    db.add(poi)
+    result = await db.execute(select(created).add_cte(uploads.adjust_refs(image_refs(created, 1))))
+    row = result.one()
     await db.commit()
-    await db.refresh(poi)
-    
-    point = to_shape(poi.location)
-    
-    return schemas.PointOfInterest(
-        id=poi.id,
-        title=poi.title,
-        description=poi.description,
-        historic_image_url=poi.historic_image_url,
-        modern_image_url=poi.modern_image_url,
-        latitude=point.y,
-        longitude=point.x
-    )
+    return poi_row_to_schema(row)
 
 @router.get("/{poi_id}", response_model=schemas.PointOfInterest)
 async def read_poi(
     *,
-    db: AsyncSession = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_read_db),
     poi_id: int,
 ) -> Any:
     """
@@ -81,87 +159,127 @@ async def read_poi(
     poi = await db.get(models.PointOfInterest, poi_id)
     if not poi:
         raise HTTPException(status_code=404, detail="POI not found")
-        
-    point = to_shape(poi.location)
-    return schemas.PointOfInterest(
-        id=poi.id,
-        title=poi.title,
-        description=poi.description,
-        historic_image_url=poi.historic_image_url,
-        modern_image_url=poi.modern_image_url,
-        latitude=point.y,
-        longitude=point.x
-    )
+    images = await uploads.load_images(db, [poi.historic_image_url, poi.modern_image_url])
+    await deps.release_connection(db)
+
+    return poi_to_schema(poi, images)
+
 @router.put("/{poi_id}", response_model=schemas.PointOfInterest)
 async def update_poi(
     *,
     db: AsyncSession = Depends(deps.get_db),
     poi_id: int,
     poi_in: schemas.PointOfInterestUpdate,
-    current_user: models.User = Depends(deps.get_current_active_superuser),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
 ) -> Any:
     """
     Update POI. Only superusers.
     """
-    poi = await db.get(models.PointOfInterest, poi_id)
-    if not poi:
-        raise HTTPException(status_code=404, detail="POI not found")
-        
     update_data = poi_in.model_dump(exclude_unset=True)
     if "latitude" in update_data and "longitude" in update_data:
-        wkt_location = f'POINT({update_data["longitude"]} {update_data["latitude"]})'
-        poi.location = wkt_location
-        del update_data["latitude"]
-        del update_data["longitude"]
+        update_data["location"] = f'POINT({update_data.pop("longitude")} {update_data.pop("latitude")})'
     elif "latitude" in update_data or "longitude" in update_data:
-         raise HTTPException(status_code=400, detail="Must provide both latitude and longitude to update location")
-
-    for field, value in update_data.items():
-        setattr(poi, field, value)
+        raise HTTPException(status_code=400, detail="Must provide both latitude and longitude to update location")
 
-    db.add(poi)
-    await db.commit()
-    await db.refresh(poi)
-    
-    point = to_shape(poi.location)
-    
-    return schemas.PointOfInterest(
-        id=poi.id,
-        title=poi.title,
-        description=poi.description,
-        historic_image_url=poi.historic_image_url,
-        modern_image_url=poi.modern_image_url,
-        latitude=point.y,
-        longitude=point.x
+    poi = models.PointOfInterest.__table__
+    # The locked pre-update row supplies the image URLs being replaced.
+    old = (
+        select(poi.c.id, poi.c.historic_image_url, poi.c.modern_image_url)
+        .where(poi.c.id == poi_id)
+        .with_for_update()
+        .cte("old")
     )
+    updated = (
+        update(poi)
+        .where(poi.c.id == old.c.id)
+        # An empty update still returns the row.
+        .values(update_data or {"id": poi.c.id})
+        .returning(
+            *poi_columns(poi),
+            old.c.historic_image_url.label("old_historic_image_url"),
+            old.c.modern_image_url.label("old_modern_image_url"),
+        )
+        .cte("updated")
+    )
+    refs = uploads.adjust_refs(
+        image_refs(updated, 1) + image_refs(updated, -1, "old_historic_image_url", "old_modern_image_url")
+    )
+    result = await db.execute(select(updated).add_cte(refs))
+    row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="POI not found")
+    await db.commit()
+    return poi_row_to_schema(row)
 
 @router.delete("/{poi_id}", response_model=schemas.PointOfInterest)
 async def delete_poi(
     *,
     db: AsyncSession = Depends(deps.get_db),
     poi_id: int,
-    current_user: models.User = Depends(deps.get_current_active_superuser),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
 ) -> Any:
     """
     Delete POI. Only superusers.
+    Its route links go in the same statement.
     """
-    poi = await db.get(models.PointOfInterest, poi_id)
-    if not poi:
-        raise HTTPException(status_code=404, detail="POI not found")
-        
-    # We need to return schema, so capture state before delete or just ID return?
-    # Schema requires all fields.
-    point = to_shape(poi.location)
-    poi_schema = schemas.PointOfInterest(
-        id=poi.id,
-        title=poi.title,
-        description=poi.description,
-        historic_image_url=poi.historic_image_url,
-        modern_image_url=poi.modern_image_url,
-        latitude=point.y,
-        longitude=point.x
+    poi = models.PointOfInterest.__table__
+    links = route_poi_association
+    deleted = delete(poi).where(poi.c.id == poi_id).returning(*poi_columns(poi)).cte("deleted")
+    result = await db.execute(
+        select(deleted)
+        .add_cte(delete(links).where(links.c.poi_id == poi_id).cte("unlinked"))
+        .add_cte(uploads.adjust_refs(image_refs(deleted, -1)))
     )
-    
-    await db.delete(poi)
+    row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="POI not found")
+    await db.commit()
+    return poi_row_to_schema(row)
+
+@router.post("/bulk", response_model=schemas.BulkResult)
+async def bulk_pois(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    bulk_in: schemas.PointOfInterestBulk,
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Delete or move many POIs at once. Only superusers.
+    Runs as a single statement; nothing is loaded into the ORM.
+    """
+    poi = models.PointOfInterest.__table__
+    filters = poi_filters(bulk_in.filter.q, bulk_in.filter.images) if bulk_in.filter else None
+    selection = bulk_selection(bulk_in.ids, filters, poi.c.id)
+    unlinked = 0
+
+    if bulk_in.action == "move":
+        result = await db.execute(
+            update(poi)
+            .where(selection)
+            .values(location=func.ST_Translate(poi.c.location, bulk_in.offset_longitude, bulk_in.offset_latitude))
+            .returning(poi.c.id)
+        )
+        ids = result.scalars().all()
+    else:
+        # Locking the selection first keeps new route links from appearing
+        # between removing the links and removing the POIs.
+        target = select(poi.c.id).where(selection).with_for_update().cte("target")
+        links = route_poi_association
+        unlinked_rows = (
+            delete(links).where(links.c.poi_id.in_(select(target.c.id))).returning(links.c.poi_id).cte("unlinked")
+        )
+        deleted = (
+            delete(poi)
+            .where(poi.c.id.in_(select(target.c.id)))
+            .returning(poi.c.id, poi.c.historic_image_url, poi.c.modern_image_url)
+            .cte("deleted")
+        )
+        result = await db.execute(
+            select(deleted.c.id, select(func.count()).select_from(unlinked_rows).scalar_subquery().label("unlinked"))
+            .add_cte(uploads.adjust_refs(image_refs(deleted, -1)))
+        )
+        rows = result.all()
+        ids = [row.id for row in rows]
+        unlinked = rows[0].unlinked if rows else 0
     await db.commit()
-    return poi_schema
+    return {"action": bulk_in.action, "affected": len(ids), "ids": sorted(ids), "unlinked": unlinked}
@@ -0,0 +1,38 @@
+from typing import Any, List
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from app import schemas
+from app.api import deps
+from app.core import profiling
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[dict])
+async def read_profiles(
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    List stored request profiles, newest first. Only superusers.
+    """
+    return await run_in_threadpool(profiling.list_profiles)
+
+
+@router.get("/{name}")
+async def read_profile(
+    name: str,
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Get one profile: the pyinstrument HTML page or a cProfile text summary.
+    Only superusers.
+    """
+    path = profiling.profile_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if name.endswith(".html"):
+        return FileResponse(path, media_type="text/html")
+    return PlainTextResponse(await run_in_threadpool(profiling.render_pstats, path))
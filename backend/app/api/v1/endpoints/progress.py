@@ -1,7 +1,7 @@
 from typing import Any, List
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from sqlalchemy import exists, insert, literal, select, true, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
@@ -14,7 +14,7 @@ async def read_user_progress(
     db: AsyncSession = Depends(deps.get_db),
     skip: int = 0,
     limit: int = 100,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Retrieve current user's progress.
@@ -25,38 +25,42 @@ async def read_user_progress(
         .offset(skip)
         .limit(limit)
     )
-    return result.scalars().all()
+    progress = result.scalars().all()
+    await deps.release_connection(db)
+    return progress
 
 @router.post("/", response_model=schemas.UserProgress)
 async def create_progress(
     *,
     db: AsyncSession = Depends(deps.get_db),
     progress_in: schemas.UserProgressCreate,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Create/Start progress for a route.
     """
-    # Check if already exists
+    # Insert only if there is no progress for the route yet; no row back
+    # means there was.
+    progress = models.UserProgress.__table__
+    existing = exists().where(progress.c.user_id == current_user.id, progress.c.route_id == progress_in.route_id)
     result = await db.execute(
-        select(models.UserProgress)
-        .where(models.UserProgress.user_id == current_user.id)
-        .where(models.UserProgress.route_id == progress_in.route_id)
+        insert(progress)
+        .from_select(
+            ["user_id", "route_id", "status", "completed_points_count"],
+            select(
+                literal(current_user.id),
+                literal(progress_in.route_id),
+                literal(progress_in.status),
+                literal(progress_in.completed_points_count),
+            ).where(~existing),
+        )
+        .returning(progress)
     )
-    existing = result.scalars().first()
-    if existing:
+    row = result.first()
+    if not row:
         raise HTTPException(status_code=400, detail="Progress for this route already exists")
-
-    progress = models.UserProgress(
-        user_id=current_user.id,
-        route_id=progress_in.route_id,
-        status=progress_in.status,
-        completed_points_count=progress_in.completed_points_count
-    )
-    db.add(progress)
     await db.commit()
-    await db.refresh(progress)
-    return progress
+    return row
 
 @router.put("/{progress_id}", response_model=schemas.UserProgress)
 async def update_progress(
@@ -64,23 +68,35 @@ async def update_progress(
     db: AsyncSession = Depends(deps.get_db),
     progress_id: int,
     progress_in: schemas.UserProgressUpdate,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Update progress (e.g. status, count).
     """
-    progress = await db.get(models.UserProgress, progress_id)
-    if not progress:
+    progress = models.UserProgress.__table__
+    # The locked current row tells "not found" from "not yours" without a
+    # separate read: the update only applies to the owner's row.
+    current = (
+        select(progress.c.id, progress.c.user_id)
+        .where(progress.c.id == progress_id)
+        .with_for_update()
+        .cte("current")
+    )
+    updated = (
+        update(progress)
+        .where(progress.c.id == current.c.id, current.c.user_id == current_user.id)
+        # An empty update still returns the row.
+        .values(progress_in.model_dump(exclude_none=True) or {"id": progress.c.id})
+        .returning(progress)
+        .cte("updated")
+    )
+    result = await db.execute(
+        select(current.c.user_id.label("owner_id"), updated).select_from(current.outerjoin(updated, true()))
+    )
+    row = result.first()
+    if not row:
         raise HTTPException(status_code=404, detail="Progress not found")
-    if progress.user_id != current_user.id:
+    if row.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
-
-    if progress_in.status is not None:
-        progress.status = progress_in.status
-    if progress_in.completed_points_count is not None:
-        progress.completed_points_count = progress_in.completed_points_count
-    
-    db.add(progress)
     await db.commit()
-    await db.refresh(progress)
-    return progress
+    return row
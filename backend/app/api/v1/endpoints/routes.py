@@ -1,22 +1,91 @@
-from typing import Any, List
+from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from sqlalchemy import Select, delete, exists, func, insert, select, true, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.sql.elements import ColumnElement
 
 from app import models, schemas
 from app.api import deps
-from geoalchemy2.shape import to_shape
+from app.api.v1.endpoints.pois import bulk_selection, poi_columns, poi_row_to_schema, poi_to_schema
+from app.core import uploads
+from app.models.route import route_poi_association
+from app.web.pagination import contains
 
 router = APIRouter()
 
+
+def route_to_schema(
+    route: models.Route, images: Optional[Dict[str, schemas.Image]] = None
+) -> schemas.Route:
+    """
+    Build the response schema; `route.points` must already be loaded.
+    """
+    return schemas.Route(
+        id=route.id,
+        title=route.title,
+        description=route.description,
+        difficulty=route.difficulty,
+        reward_xp=route.reward_xp,
+        is_premium=route.is_premium,
+        points=[poi_to_schema(p, images) for p in route.points]
+    )
+
+
+def with_points(route_rows, points=None) -> Select:
+    """
+    SELECT over a route write's RETURNING CTE joined to the POIs of the
+    route (a subquery over poi_columns): one row per point, POI columns
+    prefixed "poi_", and one row without them for a route with no points.
+    """
+    if points is None:
+        return select(route_rows)
+    return select(route_rows, *[c.label("poi_" + c.key) for c in points.c]).select_from(
+        route_rows.outerjoin(points, true())
+    )
+
+
+def route_rows_to_schema(rows: List[Any]) -> schemas.Route:
+    """
+    Response schema from the rows of a with_points SELECT.
+    """
+    route = rows[0]
+    return schemas.Route(
+        id=route.id,
+        title=route.title,
+        description=route.description,
+        difficulty=route.difficulty,
+        reward_xp=route.reward_xp,
+        is_premium=route.is_premium,
+        points=[poi_row_to_schema(row, "poi_") for row in rows if getattr(row, "poi_id", None) is not None],
+    )
+
+
+def route_filters(q: Optional[str], difficulty: Optional[str], premium: str) -> List[ColumnElement]:
+    """
+    WHERE clauses for the admin route filters, shared by the list and bulk actions.
+    """
+    route = models.Route
+    clauses = []
+    if q:
+        clauses.append(contains(route.title, q))
+    if difficulty:
+        clauses.append(func.lower(route.difficulty) == difficulty.lower())
+    if premium != "any":
+        clauses.append(route.is_premium.is_(premium == "yes"))
+    return clauses
+
+
 @router.get("/")
-async def read_routes(db: AsyncSession = Depends(deps.get_db)) -> Any:
+async def read_routes(db: AsyncSession = Depends(deps.get_read_db)) -> Any:
     from sqlalchemy import text
     # Fetch routes
     result_routes = await db.execute(text("SELECT id, title, description, difficulty, reward_xp, is_premium FROM route"))
     routes_rows = result_routes.all()
+    await deps.release_connection(db)
     
     # Fetch all POIs (assoc)
     # Simple N+1 or fetch all and map in memory for MVP/Fix.
@@ -46,61 +115,47 @@ async def create_route(
     *,
     db: AsyncSession = Depends(deps.get_db),
     route_in: schemas.RouteCreate,
-    current_user: models.User = Depends(deps.get_current_active_superuser),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
 ) -> Any:
     """
     Create new route. Only superusers.
+    Unknown POI ids are ignored.
     """
-    route = models.Route(
-        title=route_in.title,
-        description=route_in.description,
-        difficulty=route_in.difficulty,
-        reward_xp=route_in.reward_xp,
-        is_premium=route_in.is_premium
+    route = models.Route.__table__
+    poi = models.PointOfInterest.__table__
+    links = route_poi_association
+    created = (
+        insert(route)
+        .values(
+            title=route_in.title,
+            description=route_in.description,
+            difficulty=route_in.difficulty,
+            reward_xp=route_in.reward_xp,
+            is_premium=route_in.is_premium,
+        )
+        .returning(route)
+        .cte("created")
     )
-    
+    points = None
     if route_in.poi_ids:
-        # Fetch POIs
-        result = await db.execute(select(models.PointOfInterest).where(models.PointOfInterest.id.in_(route_in.poi_ids)))
-        pois = result.scalars().all()
-        # Maintain order? For now, just add them. `in_` does not guarantee order.
-        # If strict order is needed, need to handle RoutePoint association manually or sort.
-        # For MVP we can assume simple association.
-        route.points = pois
-
-    db.add(route)
-    await db.commit()
-    await db.refresh(route, attribute_names=['points']) # refresh relationships
-    
-    points_schema = []
-    for p in route.points:
-        pt = to_shape(p.location)
-        points_schema.append(
-             schemas.PointOfInterest(
-                id=p.id,
-                title=p.title,
-                description=p.description,
-                historic_image_url=p.historic_image_url,
-                modern_image_url=p.modern_image_url,
-                latitude=pt.y,
-                longitude=pt.x
-            )
+        linked = (
+            insert(links)
+            .from_select(["route_id", "poi_id"], select(created.c.id, poi.c.id).where(poi.c.id.in_(route_in.poi_ids)))
+            .returning(links.c.poi_id)
+            .cte("linked")
         )
-
-    return schemas.Route(
-        id=route.id,
-        title=route.title,
-        description=route.description,
-        difficulty=route.difficulty,
-        reward_xp=route.reward_xp,
-        is_premium=route.is_premium,
-        points=points_schema
-    )
+        points = (
+            select(*poi_columns(poi)).select_from(poi.join(linked, linked.c.poi_id == poi.c.id)).subquery("points")
+        )
+    result = await db.execute(with_points(created, points))
+    rows = result.all()
+    await db.commit()
+    return route_rows_to_schema(rows)
 
 @router.get("/{route_id}", response_model=schemas.Route)
 async def read_route(
     *,
-    db: AsyncSession = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_read_db),
     route_id: int,
 ) -> Any:
     """
@@ -114,139 +169,154 @@ async def read_route(
     route = result.scalars().first()
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
+    images = await uploads.load_images(
+        db, [url for p in route.points for url in (p.historic_image_url, p.modern_image_url)]
+    )
+    await deps.release_connection(db)
 
-    points_schema = []
-    for p in route.points:
-        pt = to_shape(p.location)
-        points_schema.append(
-             schemas.PointOfInterest(
-                id=p.id,
-                title=p.title,
-                description=p.description,
-                historic_image_url=p.historic_image_url,
-                modern_image_url=p.modern_image_url,
-                latitude=pt.y,
-                longitude=pt.x
-            )
-        )
+    return route_to_schema(route, images)
 
-    return schemas.Route(
-        id=route.id,
-        title=route.title,
-        description=route.description,
-        difficulty=route.difficulty,
-        reward_xp=route.reward_xp,
-        is_premium=route.is_premium,
-        points=points_schema
-    )
 @router.put("/{route_id}", response_model=schemas.Route)
 async def update_route(
     *,
     db: AsyncSession = Depends(deps.get_db),
     route_id: int,
     route_in: schemas.RouteUpdate,
-    current_user: models.User = Depends(deps.get_current_active_superuser),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
 ) -> Any:
     """
     Update route. Only superusers.
+    `poi_ids`, when given, replaces the route's points.
     """
-    # Fetch route with points
-    result = await db.execute(
-        select(models.Route)
-        .options(selectinload(models.Route.points))
-        .where(models.Route.id == route_id)
-    )
-    route = result.scalars().first()
-    if not route:
-        raise HTTPException(status_code=404, detail="Route not found")
-
+    route = models.Route.__table__
+    poi = models.PointOfInterest.__table__
+    links = route_poi_association
     update_data = route_in.model_dump(exclude_unset=True)
-    
-    # Handle POI association update
-    if "poi_ids" in update_data:
-        poi_ids = update_data.pop("poi_ids")
-        if poi_ids is not None:
-             result_pois = await db.execute(select(models.PointOfInterest).where(models.PointOfInterest.id.in_(poi_ids)))
-             pois = result_pois.scalars().all()
-             route.points = pois
-
-    for field, value in update_data.items():
-        setattr(route, field, value)
-
-    db.add(route)
-    await db.commit()
-    await db.refresh(route, attribute_names=['points'])
-    
-    points_schema = []
-    for p in route.points:
-        pt = to_shape(p.location)
-        points_schema.append(
-             schemas.PointOfInterest(
-                id=p.id,
-                title=p.title,
-                description=p.description,
-                historic_image_url=p.historic_image_url,
-                modern_image_url=p.modern_image_url,
-                latitude=pt.y,
-                longitude=pt.x
-            )
-        )
+    poi_ids = update_data.pop("poi_ids", None)
 
-    return schemas.Route(
-        id=route.id,
-        title=route.title,
-        description=route.description,
-        difficulty=route.difficulty,
-        reward_xp=route.reward_xp,
-        is_premium=route.is_premium,
-        points=points_schema
+    updated = (
+        update(route)
+        .where(route.c.id == route_id)
+        # An empty update still returns the row.
+        .values(update_data or {"id": route.c.id})
+        .returning(route)
+        .cte("updated")
     )
+    if poi_ids is None:
+        points = (
+            select(*poi_columns(poi))
+            .select_from(poi.join(links, links.c.poi_id == poi.c.id))
+            .where(links.c.route_id == route_id)
+            .subquery("points")
+        )
+        statement = with_points(updated, points)
+    else:
+        # Links to keep stay untouched; only the difference is written.
+        unlinked = delete(links).where(
+            links.c.route_id.in_(select(updated.c.id)), links.c.poi_id.notin_(poi_ids)
+        ).cte("unlinked")
+        linked = (
+            pg_insert(links)
+            .from_select(["route_id", "poi_id"], select(updated.c.id, poi.c.id).where(poi.c.id.in_(poi_ids)))
+            .on_conflict_do_nothing()
+            .cte("linked")
+        )
+        points = select(*poi_columns(poi)).where(poi.c.id.in_(poi_ids)).subquery("points")
+        statement = with_points(updated, points).add_cte(unlinked).add_cte(linked)
+
+    result = await db.execute(statement)
+    rows = result.all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Route not found")
+    await db.commit()
+    return route_rows_to_schema(rows)
 
 @router.delete("/{route_id}", response_model=schemas.Route)
 async def delete_route(
     *,
     db: AsyncSession = Depends(deps.get_db),
     route_id: int,
-    current_user: models.User = Depends(deps.get_current_active_superuser),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
 ) -> Any:
     """
     Delete route. Only superusers.
+    Its POI links go in the same statement and come back as its points.
     """
-    # Fetch route with points to return schema
-    result = await db.execute(
-        select(models.Route)
-        .options(selectinload(models.Route.points))
-        .where(models.Route.id == route_id)
-    )
-    route = result.scalars().first()
-    if not route:
+    route = models.Route.__table__
+    poi = models.PointOfInterest.__table__
+    links = route_poi_association
+    unlinked = delete(links).where(links.c.route_id == route_id).returning(links.c.poi_id).cte("unlinked")
+    deleted = delete(route).where(route.c.id == route_id).returning(route).cte("deleted")
+    points = select(*poi_columns(poi)).select_from(poi.join(unlinked, unlinked.c.poi_id == poi.c.id)).subquery("points")
+    try:
+        result = await db.execute(with_points(deleted, points))
+    except IntegrityError:
+        # user_progress rows reference the route
+        raise HTTPException(status_code=409, detail="Route has user progress and can't be deleted")
+    rows = result.all()
+    if not rows:
         raise HTTPException(status_code=404, detail="Route not found")
+    await db.commit()
+    return route_rows_to_schema(rows)
+
+@router.post("/bulk", response_model=schemas.BulkResult)
+async def bulk_routes(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    bulk_in: schemas.RouteBulk,
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Delete, retag or change the difficulty of many routes at once. Only superusers.
+    Runs as a single statement; nothing is loaded into the ORM.
+    """
+    route = models.Route.__table__
+    f = bulk_in.filter
+    filters = route_filters(f.q, f.difficulty, f.premium) if f else None
+    selection = bulk_selection(bulk_in.ids, filters, route.c.id)
 
-    points_schema = []
-    for p in route.points:
-        pt = to_shape(p.location)
-        points_schema.append(
-             schemas.PointOfInterest(
-                id=p.id,
-                title=p.title,
-                description=p.description,
-                historic_image_url=p.historic_image_url,
-                modern_image_url=p.modern_image_url,
-                latitude=pt.y,
-                longitude=pt.x
+    if bulk_in.action == "delete":
+        # Routes users have progress on are kept (the progress rows reference
+        # them) and reported as skipped. The selection is locked so progress
+        # can't start on a route between the check and the delete.
+        in_use = exists().where(models.UserProgress.route_id == route.c.id)
+        selected = select(route.c.id, in_use.label("in_use")).where(selection).with_for_update(of=route).cte("selected")
+        target = select(selected.c.id).where(~selected.c.in_use)
+        links = route_poi_association
+        unlinked_rows = delete(links).where(links.c.route_id.in_(target)).returning(links.c.route_id).cte("unlinked")
+        deleted = delete(route).where(route.c.id.in_(target)).returning(route.c.id).cte("deleted")
+        result = await db.execute(
+            select(
+                selected.c.id,
+                selected.c.in_use,
+                select(func.count()).select_from(unlinked_rows).scalar_subquery().label("unlinked"),
+                select(func.count()).select_from(deleted).scalar_subquery().label("deleted"),
             )
         )
-    
-    route_schema = schemas.Route(
-        id=route.id,
-        title=route.title,
-        description=route.description,
-        difficulty=route.difficulty,
-        reward_xp=route.reward_xp,
-        is_premium=route.is_premium,
-        points=points_schema
-    )
+        rows = result.all()
+        await db.commit()
+        ids = sorted(row.id for row in rows if not row.in_use)
+        return {
+            "action": bulk_in.action,
+            "affected": rows[0].deleted if rows else 0,
+            "ids": ids,
+            "unlinked": rows[0].unlinked if rows else 0,
+            "skipped": sorted(row.id for row in rows if row.in_use),
+        }
 
-    await db.delete(route)
+    column, value = {
+        "set_premium": (route.c.is_premium, bulk_in.is_premium),
+        "set_difficulty": (route.c.difficulty, bulk_in.difficulty),
+    }[bulk_in.action]
+    if value is None:
+        raise HTTPException(status_code=400, detail=f"{bulk_in.action} needs {column.name}")
+    # Rows that already have the value aren't rewritten or counted.
+    result = await db.execute(
+        update(route)
+        .where(selection, column.is_distinct_from(value))
+        .values({column: value})
+        .returning(route.c.id)
+    )
+    ids = result.scalars().all()
     await db.commit()
-    return route_schema
+    return {"action": bulk_in.action, "affected": len(ids), "ids": sorted(ids)}
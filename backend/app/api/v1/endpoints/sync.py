@@ -0,0 +1,54 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import schemas
+from app.api import deps
+from app.core.catalog import catalog_poi, latest_catalog_version, read_catalog_changes
+from app.core.config import settings
+
+router = APIRouter()
+
+
+@router.get("/", response_model=schemas.CatalogChanges)
+async def read_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(settings.SYNC_PAGE_SIZE, ge=1, le=settings.SYNC_PAGE_SIZE),
+    db: AsyncSession = Depends(deps.get_read_db),
+) -> Any:
+    """
+    Catalog changes after version `since` (0 for everything): changed POIs,
+    routes and route points, and what was deleted. Store the returned
+    `version` and pass it as `since` next time.
+    """
+    reset = False
+    if since and since > await latest_catalog_version(db):
+        since, reset = 0, True
+    changes, more = await read_catalog_changes(db, since, limit)
+    await deps.release_connection(db)
+
+    response = {
+        "version": changes[-1][0] if changes else since,
+        "more": more,
+        "reset": reset,
+        "pois": [],
+        "routes": [],
+        "route_points": [],
+        "deleted": {"pois": [], "routes": [], "route_points": []},
+    }
+    deleted = response["deleted"]
+    for _, kind, row in changes:
+        if kind == "poi":
+            response["pois"].append(catalog_poi(row))
+        elif kind == "route":
+            response["routes"].append(row._asdict())
+        elif kind == "route_point":
+            response["route_points"].append(row._asdict())
+        elif row.table_name == "point_of_interest":
+            deleted["pois"].append(row.row_id)
+        elif row.table_name == "route":
+            deleted["routes"].append(row.row_id)
+        else:
+            deleted["route_points"].append((row.row_id, row.poi_id))
+    return response
@@ -1,7 +1,7 @@
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
@@ -16,34 +16,43 @@ async def read_users(
     db: AsyncSession = Depends(deps.get_db),
     skip: int = 0,
     limit: int = 100,
-    current_user: models.User = Depends(deps.get_current_active_superuser),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
 ) -> Any:
     """
     Retrieve users. Only superusers.
     """
     result = await db.execute(select(models.User).offset(skip).limit(limit))
-    return result.scalars().all()
+    users = result.scalars().all()
+    await deps.release_connection(db)
+    return users
 
 @router.delete("/{user_id}", response_model=schemas.User)
 async def delete_user(
     *,
     db: AsyncSession = Depends(deps.get_db),
     user_id: int,
-    current_user: models.User = Depends(deps.get_current_active_superuser),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
 ) -> Any:
     """
     Delete user. Only superusers.
     """
-    user = await db.get(models.User, user_id)
+    # Their progress rows are detached (user_id NULL) in the same statement,
+    # as the ORM delete of the `progress` backref used to do.
+    users = models.User.__table__
+    progress = models.UserProgress.__table__
+    deleted = delete(users).where(users.c.id == user_id).returning(users).cte("deleted")
+    detached = update(progress).where(progress.c.user_id == user_id).values(user_id=None).cte("detached")
+    result = await db.execute(select(deleted).add_cte(detached))
+    user = result.first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    await db.delete(user)
     await db.commit()
+    deps.invalidate_user(user_id)
     return user
 
 @router.get("/leaderboard", response_model=list[schemas.User])
 async def read_leaderboard(
-    db: AsyncSession = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_read_db),
     limit: int = 10,
 ) -> Any:
     """
@@ -52,12 +61,14 @@ async def read_leaderboard(
     result = await db.execute(
         select(models.User).order_by(models.User.xp.desc()).limit(limit)
     )
-    return result.scalars().all()
+    users = result.scalars().all()
+    await deps.release_connection(db)
+    return users
 
 
 @router.get("/me", response_model=schemas.User)
 async def read_user_me(
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Get current user.
@@ -70,38 +81,39 @@ async def update_user_me(
     *,
     db: AsyncSession = Depends(deps.get_db),
     user_in: schemas.UserUpdate,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Update own user.
+    Changing the password revokes every token issued before it.
     """
-    # Assuming update logic here. Since models.User is ORM, we can update attributes.
-    # But for async session, we might need to be careful with detached instances if not careful.
-    # current_user is attached to the session from `get_current_user` dependency IF the session is shared.
-    # But `get_current_user` uses `Depends(get_db)`, creating a NEW session generator if not handled as a singleton dependency (FastAPI handles it per request).
-    # Yes, `get_db` yields a session. `get_current_user` depends on `get_db`.
-    # FastAPI dependency system ensures the SAME `db` session is passed if we use the same dependency function signature?
-    # Actually, `get_current_user(db: AsyncSession = Depends(get_db))` gets a `db`.
-    # `update_user_me(db: AsyncSession = Depends(get_db))` also gets a `db`.
-    # They should be the SAME session instance within a request context in FastAPI.
-    
+    # current_user is a cached snapshot; the write goes straight to the row.
+    values = {}
     if user_in.password:
-        hashed_password = security.get_password_hash(user_in.password)
-        current_user.hashed_password = hashed_password
-    
+        values["hashed_password"] = await security.hash_password(user_in.password)
+        values["token_version"] = models.User.token_version + 1
+
     if user_in.username:
         # Check uniqueness if changed
         pass # Skipping strictly for MVP speed, but should implement.
 
     if user_in.bio:
-        current_user.bio = user_in.bio
+        values["bio"] = user_in.bio
 
     if user_in.email:
         # Check uniqueness
         pass
-    
-    # We need to add/merge if it's detached, but it should be attached.
-    db.add(current_user)
+
+    result = await db.execute(
+        update(models.User)
+        .where(models.User.id == current_user.id)
+        # An empty update still returns the row.
+        .values(values or {"id": models.User.id})
+        .returning(models.User)
+    )
+    user = result.scalars().first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     await db.commit()
-    await db.refresh(current_user)
-    return current_user
+    deps.invalidate_user(user.id)
+    return user
@@ -0,0 +1,68 @@
+"""
+Generate derivatives for uploads that have none (see app.core.images).
+
+    python -m app.backfill_derivatives              # all pending uploads
+    python -m app.backfill_derivatives --dry-run    # only report
+
+Derivative jobs run in the process that accepted the upload and are lost
+when it restarts, so an upload can be left with `variants IS NULL`. This
+re-runs the job for every such upload older than the grace period
+(younger ones may still have a job queued). Safe to run repeatedly, for
+example next to gc_uploads; an image that keeps failing is logged and
+tried again on the next run.
+"""
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy import text
+
+from app.core.images import derivative_pipeline
+from app.core.storage import default_storage
+from app.db.session import AsyncSessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PENDING_SQL = """
+SELECT id, url FROM upload
+WHERE variants IS NULL AND last_uploaded_at < now() - make_interval(secs => :grace)
+ORDER BY id
+"""
+
+
+async def backfill(grace: float, dry_run: bool) -> None:
+    if not derivative_pipeline.enabled:
+        raise SystemExit("Derivatives are disabled (Pillow missing or IMAGE_WORKERS = 0)")
+    async with AsyncSessionLocal() as db:
+        pending = (await db.execute(text(PENDING_SQL), {"grace": grace})).all()
+    logger.info("%d uploads without derivatives", len(pending))
+    if dry_run:
+        for row in pending:
+            logger.info("Would generate derivatives for %s", row.url)
+        return
+
+    # A few jobs per worker at a time keeps the pool busy without queueing
+    # the whole backlog in memory.
+    batch = derivative_pipeline.max_workers * 4
+    try:
+        for start in range(0, len(pending), batch):
+            for row in pending[start:start + batch]:
+                name = default_storage.name_from_url(row.url)
+                if name is None:
+                    logger.warning("Skipping %s: not in upload storage", row.url)
+                    continue
+                derivative_pipeline.schedule(row.id, name)
+            await derivative_pipeline.drain()
+    finally:
+        derivative_pipeline.shutdown()
+    stats = derivative_pipeline.stats()
+    logger.info("Generated %d, failed %d", stats["completed"], stats["failed"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grace-minutes", type=float, default=10.0)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.grace_minutes * 60, args.dry_run))
@@ -0,0 +1,56 @@
+"""
+Build the offline city packs served at /packs (see app.core.packs).
+
+    python -m app.build_packs              # bring packs up to date once
+    python -m app.build_packs --loop       # and again every OFFLINE_PACK_INTERVAL_SECONDS
+    python -m app.build_packs --force      # republish every region
+
+Run one instance per OFFLINE_PACK_DIR. A run reads only the catalog
+changes since the previous one; with none, it publishes nothing.
+"""
+import argparse
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.core.image_proxy import image_proxy
+from app.core.images import derivative_pipeline
+from app.core.packs import PackBuilder
+from app.db.session import AsyncSessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def build(loop: bool, force: bool) -> None:
+    builder = PackBuilder(settings.OFFLINE_PACK_DIR, settings.OFFLINE_PACK_REGIONS)
+    try:
+        if force:
+            builder.publish(force=True)
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    published = await builder.refresh(db)
+                logger.info("At catalog version %d; published %s", builder.version, ", ".join(published) or "nothing")
+                # Derivatives of newly proxied images, so the next run finds
+                # their thumbnails.
+                await image_proxy.drain()
+            except Exception:
+                if not loop:
+                    raise
+                logger.exception("Pack build failed")
+            if not loop:
+                break
+            await asyncio.sleep(settings.OFFLINE_PACK_INTERVAL_SECONDS)
+    finally:
+        builder.close()
+        await image_proxy.close()
+        derivative_pipeline.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--loop", action="store_true")
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(build(args.loop, args.force))
@@ -0,0 +1,105 @@
+"""
+The public catalog as the apps see it: the POI shape shared by GET /pois
+and /sync, and the change feed (app.db.sync) that /sync and the offline
+pack builder read.
+"""
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import TextClause, cast, func, literal, select, text
+from sqlalchemy.dialects.postgresql import JSONB, REGCLASS
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.core import uploads
+from app.core.image_proxy import proxied_image
+from app.db.sync import change_sequence
+from app.models.route import route_poi_association
+
+# The public catalog shape of a POI, shared by the list and delta sync.
+# Derivatives come from the upload index, joined per image column; callers
+# append their WHERE/ORDER BY.
+CATALOG_POI_SQL = """
+    SELECT p.id, p.title, p.description, p.historic_image_url, p.modern_image_url,
+           ST_X(p.location::geometry) AS lon, ST_Y(p.location::geometry) AS lat,
+           p.change_version,
+           hu.url AS h_url, hu.width AS h_width, hu.height AS h_height,
+           hu.blurhash AS h_blurhash, hu.variants AS h_variants,
+           mu.url AS m_url, mu.width AS m_width, mu.height AS m_height,
+           mu.blurhash AS m_blurhash, mu.variants AS m_variants
+    FROM point_of_interest p
+    LEFT JOIN upload hu ON hu.url = p.historic_image_url
+    LEFT JOIN upload mu ON mu.url = p.modern_image_url
+"""
+
+
+def catalog_poi_query(where: str = "") -> TextClause:
+    return text(CATALOG_POI_SQL + where).columns(h_variants=JSONB, m_variants=JSONB)
+
+
+def catalog_poi(row: Any) -> Dict[str, Any]:
+    """
+    JSON-ready POI from a CATALOG_POI_SQL row.
+    """
+    historic = uploads.image_schema(
+        row.h_url, row.h_width, row.h_height, row.h_blurhash, row.h_variants
+    ) or proxied_image(row.historic_image_url)
+    modern = uploads.image_schema(
+        row.m_url, row.m_width, row.m_height, row.m_blurhash, row.m_variants
+    ) or proxied_image(row.modern_image_url)
+    return {
+        "id": row.id,
+        "title": row.title,
+        "description": row.description,
+        "historic_image_url": row.historic_image_url,
+        "modern_image_url": row.modern_image_url,
+        "latitude": row.lat,
+        "longitude": row.lon,
+        "historic_image": historic.model_dump() if historic else None,
+        "modern_image": modern.model_dump() if modern else None,
+    }
+
+
+async def latest_catalog_version(db: AsyncSession) -> int:
+    """
+    The newest catalog version handed out (0 for an empty catalog).
+    """
+    sequence = cast(literal(change_sequence.name), REGCLASS)
+    return await db.scalar(select(func.coalesce(func.pg_sequence_last_value(sequence), 0)))
+
+
+async def read_catalog_changes(db: AsyncSession, since: int, limit: int) -> Tuple[List[Tuple[int, str, Any]], bool]:
+    """
+    Up to `limit` catalog changes after version `since`, oldest first, as
+    (version, kind, row) with kind one of poi, route, route_point or
+    tombstone; and whether more are waiting.
+
+    Each table is read with its own range scan on change_version; taking
+    limit + 1 rows from every table is enough to find the overall first
+    `limit`.
+    """
+    route = models.Route.__table__
+    links = route_poi_association
+    tombstone = models.CatalogTombstone.__table__
+    changes: List[Tuple[int, str, Any]] = []
+
+    result = await db.execute(
+        catalog_poi_query("WHERE p.change_version > :since ORDER BY p.change_version LIMIT :limit"),
+        {"since": since, "limit": limit + 1},
+    )
+    changes += [(row.change_version, "poi", row) for row in result]
+    queries = [
+        ("route", select(route).where(route.c.change_version > since).order_by(route.c.change_version)),
+        ("route_point", select(links).where(links.c.change_version > since).order_by(links.c.change_version)),
+    ]
+    # A client syncing from scratch has nothing to delete.
+    if since:
+        queries.append((
+            "tombstone",
+            select(tombstone).where(tombstone.c.change_version > since).order_by(tombstone.c.change_version),
+        ))
+    for kind, query in queries:
+        result = await db.execute(query.limit(limit + 1))
+        changes += [(row.change_version, kind, row) for row in result]
+
+    changes.sort(key=lambda change: change[0])
+    return changes[:limit], len(changes) > limit
@@ -0,0 +1,241 @@
+"""
+Negotiated compression of response bodies.
+
+JSON lists such as the POI catalog, the routes and the leaderboard shrink
+several-fold. The coding is the first of COMPRESSION_ENCODINGS the client
+accepts: zstd and br need their optional packages (zstandard, brotli) and
+are skipped without them, gzip is always available.
+
+- A body sent in one piece is compressed whole, unless it is smaller than
+  COMPRESSION_MIN_BYTES. When a shared cache could store the response (a
+  GET without Authorization, no private/no-store, no cookie), the result
+  is kept in an in-process TTLCache keyed by the coding and a hash of the
+  body, so the same catalog payload isn't compressed again per request.
+- A streamed body is compressed part by part, flushing after each one so
+  the client still receives data as the app produces it.
+- Responses that are already encoded, partial or not 200, of a type that
+  doesn't compress, or file responses (they advertise Accept-Ranges, and
+  static files have precompressed siblings) pass through untouched.
+
+Compressible responses get `Vary: Accept-Encoding`; a compressed one's
+ETag is made weak, since it no longer names the identity bytes.
+"""
+import gzip
+import hashlib
+import zlib
+from typing import Callable, Dict, NamedTuple, Optional, Sequence
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.static import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# Bodies at least this large are compressed on the thread pool instead of
+# the event loop.
+THREADPOOL_BYTES = 64 * 1024
+COMPRESSIBLE_TYPES = frozenset(
+    {"application/json", "application/javascript", "application/xml", "image/svg+xml"}
+)
+
+
+class GzipStream:
+    def __init__(self) -> None:
+        # wbits 31: gzip container
+        self._compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self) -> None:
+        self._compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdStream:
+    def __init__(self) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class Codec(NamedTuple):
+    compress: Callable[[bytes], bytes]
+    # New incremental compressor: compress(part) -> bytes, finish() -> bytes
+    stream: Callable[[], object]
+
+
+CODECS: Dict[str, Codec] = {
+    "gzip": Codec(lambda body: gzip.compress(body, settings.COMPRESSION_GZIP_LEVEL, mtime=0), GzipStream),
+}
+if brotli is not None:
+    CODECS["br"] = Codec(lambda body: brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY), BrotliStream)
+if zstandard is not None:
+    CODECS["zstd"] = Codec(
+        lambda body: zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compress(body), ZstdStream
+    )
+
+# (coding, sha256 of the body) -> compressed body
+compressed_body_cache = TTLCache(
+    maxsize=settings.COMPRESSION_CACHE_SIZE, ttl=settings.COMPRESSION_CACHE_TTL_SECONDS
+)
+
+
+def is_compressible(status: int, headers: Headers) -> bool:
+    if status != 200 or "content-encoding" in headers or "accept-ranges" in headers:
+        return False
+    media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type.endswith("+json") or media_type in COMPRESSIBLE_TYPES
+
+
+def is_shared_cacheable(scope: Scope, headers: Headers) -> bool:
+    if scope["method"] != "GET" or any(key == b"authorization" for key, _ in scope["headers"]):
+        return False
+    cache_control = headers.get("cache-control", "").lower()
+    return "private" not in cache_control and "no-store" not in cache_control and "set-cookie" not in headers
+
+
+def negotiate(header: Optional[str], encodings: Sequence[str]) -> Optional[str]:
+    """
+    First of `encodings` the Accept-Encoding header allows and this
+    process can produce.
+    """
+    accepted = accepted_encodings(header)
+    return next((coding for coding in encodings if coding in accepted and coding in CODECS), None)
+
+
+async def compress_body(coding: str, body: bytes, cacheable: bool) -> bytes:
+    key = None
+    if cacheable and len(body) <= settings.COMPRESSION_CACHE_MAX_BYTES:
+        key = (coding, hashlib.sha256(body).digest())
+        cached = compressed_body_cache.get(key)
+        if cached is not None:
+            return cached
+    compress = CODECS[coding].compress
+    compressed = await run_in_threadpool(compress, body) if len(body) >= THREADPOOL_BYTES else compress(body)
+    if key is not None:
+        compressed_body_cache.set(key, compressed)
+    return compressed
+
+
+def mark_encoded(headers: MutableHeaders, coding: str) -> None:
+    headers["content-encoding"] = coding
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["etag"] = "W/" + etag
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies with the best coding the client accepts;
+    see the module docstring for what is skipped and what is cached.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: Optional[int] = None) -> None:
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MIN_BYTES if minimum_size is None else minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        coding = negotiate(Headers(scope=scope).get("accept-encoding"), settings.COMPRESSION_ENCODINGS)
+        # The start message is held back until the first body part shows
+        # whether (and how) the body gets compressed.
+        held: Optional[Message] = None
+        stream = None
+        passthrough = False
+        total_in = total_out = 0
+
+        async def compressing_send(message: Message) -> None:
+            nonlocal held, stream, passthrough, total_in, total_out
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if not is_compressible(message["status"], headers):
+                    passthrough = True
+                    await send(message)
+                    return
+                headers.add_vary_header("Accept-Encoding")
+                held = message
+                return
+            if message["type"] != "http.response.body":
+                # e.g. http.response.pathsend: the server sends the file.
+                passthrough = True
+                if held is not None:
+                    await send(held)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if stream is None:
+                headers = MutableHeaders(scope=held)
+                declared = headers.get("content-length")
+                small = len(body) < self.minimum_size if not more_body else (
+                    declared is not None and declared.isdigit() and int(declared) < self.minimum_size
+                )
+                if coding is None or small:
+                    passthrough = True
+                    await send(held)
+                    await send(message)
+                    return
+                mark_encoded(headers, coding)
+                if not more_body:
+                    compressed = await compress_body(coding, body, is_shared_cacheable(scope, headers))
+                    headers["content-length"] = str(len(compressed))
+                    self.record(coding, len(body), len(compressed))
+                    await send(held)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                if "content-length" in headers:
+                    del headers["content-length"]
+                stream = CODECS[coding].stream()
+                await send(held)
+
+            chunk = stream.compress(body) if body else b""
+            if not more_body:
+                chunk += stream.finish()
+            total_in += len(body)
+            total_out += len(chunk)
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            if not more_body:
+                self.record(coding, total_in, total_out)
+
+        await self.app(scope, receive, compressing_send)
+
+    @staticmethod
+    def record(coding: str, size: int, compressed: int) -> None:
+        metrics.compression_input_bytes.inc(size, encoding=coding)
+        metrics.compression_output_bytes.inc(compressed, encoding=coding)
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Moscow Chrono Walker"
@@ -9,6 +9,121 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     API_V1_STR: str = "/api/v1"
 
+    # Database connection pool (applies to the primary and the replica)
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Requests holding connections longer than this are logged as warnings
+    DB_HOLD_WARN_SECONDS: float = 1.0
+    # A statement run this many times in one request is reported as a likely N+1
+    DB_REPEATED_STATEMENT_THRESHOLD: int = 5
+
+    # Optional read replica for catalog and leaderboard reads
+    READ_DATABASE_URL: Optional[str] = None
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_CHECK_INTERVAL_SECONDS: float = 5.0
+
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+
+    # Authenticated-principal cache (per process)
+    USER_CACHE_TTL_SECONDS: float = 30.0
+    USER_CACHE_MAX_SIZE: int = 10000
+    # How stale a cached principal's token_version/is_active may get when
+    # another process changes the user
+    USER_CACHE_REVALIDATE_SECONDS: float = 5.0
+
+    # Login flood protection (0 per minute disables a limiter)
+    LOGIN_RATE_LIMIT_IP_PER_MINUTE: float = 30.0
+    LOGIN_RATE_LIMIT_IP_BURST: int = 10
+    LOGIN_RATE_LIMIT_ACCOUNT_PER_MINUTE: float = 5.0
+    LOGIN_RATE_LIMIT_ACCOUNT_BURST: int = 5
+    LOGIN_RATE_LIMIT_MAX_KEYS: int = 100000
+    # Reverse proxies (addresses or networks, e.g. ["172.16.0.0/12"]) whose
+    # X-Forwarded-For is believed. Behind nginx every request comes from the
+    # proxy's address, so without this all clients share one IP bucket.
+    TRUSTED_PROXIES: List[str] = []
+
+    # Who may scrape /metrics: clients in these networks (by the address
+    # client_address resolves, so TRUSTED_PROXIES applies), or anyone sending
+    # "Authorization: Bearer <METRICS_TOKEN>"
+    METRICS_ALLOWED_NETWORKS: List[str] = ["127.0.0.1/32", "::1/128"]
+    METRICS_TOKEN: Optional[str] = None
+
+    # On-demand profiling of superuser requests (X-Profile: 1 or ?profile=1);
+    # enabled in docker-compose.yml for development
+    PROFILING_ENABLED: bool = False
+    PROFILE_DIR: str = "app/profiles"
+    PROFILE_MAX_FILES: int = 200
+    PROFILE_SAMPLE_INTERVAL: float = 0.001
+
+    # Uploads (served under /static)
+    UPLOAD_DIR: str = "app/uploads"
+    MAX_UPLOAD_BYTES: int = 20 * 1024 * 1024
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    # "local" (UPLOAD_DIR, served under /static) or "s3" (needs boto3)
+    STORAGE_BACKEND: str = "local"
+    S3_BUCKET: Optional[str] = None
+    S3_ENDPOINT_URL: Optional[str] = None  # MinIO/R2; None for AWS
+    S3_REGION: Optional[str] = None
+    S3_ACCESS_KEY_ID: Optional[str] = None
+    S3_SECRET_ACCESS_KEY: Optional[str] = None
+    S3_PUBLIC_URL: Optional[str] = None  # CDN or bucket URL objects are read from
+    # Lifetime of presigned direct-upload URLs
+    UPLOAD_PRESIGN_EXPIRE_SECONDS: int = 900
+    # Cache lifetime of files that aren't content-addressed (those are immutable)
+    STATIC_MAX_AGE: int = 3600
+    # nginx internal location aliasing UPLOAD_DIR, e.g. "/_uploads"; when set
+    # the body is sent by nginx via X-Accel-Redirect
+    STATIC_ACCEL_REDIRECT: Optional[str] = None
+    # Derivatives generated per upload (0 workers disables them)
+    IMAGE_WORKERS: int = 2
+    IMAGE_VARIANT_WIDTHS: List[int] = [160, 480, 960, 1600]
+    IMAGE_VARIANT_FORMATS: List[str] = ["webp", "avif"]
+    # Caching proxy for POI images on third-party hosts (/images/proxy)
+    IMAGE_PROXY_ENABLED: bool = True
+    IMAGE_PROXY_DIR: str = "app/image_cache"
+    IMAGE_PROXY_MAX_BYTES: int = 1024 * 1024 * 1024
+    IMAGE_PROXY_ALLOWED_HOSTS: List[str] = ["upload.wikimedia.org"]
+    IMAGE_PROXY_MAX_FETCHES: int = 8
+    IMAGE_PROXY_MAX_AGE: int = 7 * 24 * 3600
+
+    # Response compression: the first coding the client accepts (br and
+    # zstd only with the brotli / zstandard packages installed)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_ENCODINGS: List[str] = ["zstd", "br", "gzip"]
+    COMPRESSION_MIN_BYTES: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    # Compressed bodies of shared-cacheable GET responses, by body hash
+    COMPRESSION_CACHE_SIZE: int = 64
+    COMPRESSION_CACHE_TTL_SECONDS: float = 300.0
+    COMPRESSION_CACHE_MAX_BYTES: int = 8 * 1024 * 1024
+
+    # Admin templates: recheck files on every render (development only), and
+    # where compiled templates are cached (None: a per-user temp dir)
+    ADMIN_TEMPLATES_AUTO_RELOAD: bool = False
+    ADMIN_TEMPLATE_CACHE_DIR: Optional[str] = None
+
+    # Catalog delta sync (/sync): most changed rows returned per call
+    SYNC_PAGE_SIZE: int = 1000
+
+    # Offline city packs (python -m app.build_packs, served at /packs)
+    OFFLINE_PACK_DIR: str = "app/packs"
+    # Region name -> [min longitude, min latitude, max longitude, max latitude]
+    OFFLINE_PACK_REGIONS: Dict[str, List[float]] = {"moscow": [36.80, 55.14, 37.97, 56.02]}
+    # Thumbnails use the smallest derivative at least this wide, in the
+    # first format that has one
+    OFFLINE_PACK_THUMBNAIL_WIDTH: int = 160
+    OFFLINE_PACK_THUMBNAIL_FORMATS: List[str] = ["webp", "jpeg"]
+    # Pause between runs of `python -m app.build_packs --loop`
+    OFFLINE_PACK_INTERVAL_SECONDS: float = 300.0
+
     class Config:
         env_file = ".env"
 
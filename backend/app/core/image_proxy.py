@@ -0,0 +1,441 @@
+"""
+Caching proxy for images on third-party hosts.
+
+POI image fields often point at Wikimedia and similar hosts. Clients go
+through GET /images/proxy?url=... instead, and each remote image is
+fetched once:
+
+- Files live under IMAGE_PROXY_DIR as ab/cd/<sha256 of the URL>.<ext>.
+  Derivatives sit next to them, as for uploads, made by the same pipeline.
+- A SQLite index next to the files records every entry's size and last
+  access. Once the total passes IMAGE_PROXY_MAX_BYTES the least recently
+  used entries are evicted. SQLite is used because the index must survive
+  restarts and be shared by the workers on one host.
+- At most IMAGE_PROXY_MAX_FETCHES downloads run at once. Concurrent misses
+  for the same URL share one download.
+- Only http(s) URLs on IMAGE_PROXY_ALLOWED_HOSTS are fetched, redirects
+  included, so the proxy can't be pointed at internal services. Bodies get
+  the upload size limit and magic-byte check.
+
+Remote images are treated as immutable for their URL, which holds for
+Wikimedia's hashed paths. An entry is only refetched after eviction.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set
+from urllib.parse import quote, urlsplit
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from app import schemas
+from app.core.config import settings
+from app.core.images import DerivativePipeline, derivative_pipeline
+from app.core.storage import TEMP_PREFIX
+from app.core.uploads import sniff_image_type
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.sqlite3"
+# Refresh last access at most this often per entry, to keep hits read-only.
+TOUCH_INTERVAL = 60.0
+
+
+class ImageProxyError(Exception):
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class CacheEntry(NamedTuple):
+    key: str
+    url: str
+    name: str
+    content_type: str
+    # Original plus derivatives, in bytes
+    size: int
+    sha256: str
+    accessed_at: float
+    variants: List[Dict[str, Any]]
+
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def is_remote(url: Optional[str]) -> bool:
+    # Cheap pre-check before parsing: uploads and other local URLs are not.
+    return bool(url) and url[:8].lower().startswith(("http://", "https://"))
+
+
+def is_allowed(url: Optional[str], allowed_hosts: Iterable[str]) -> bool:
+    if not is_remote(url):
+        return False
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return False
+    host = parts.hostname.lower()
+    return any(host == allowed or host.endswith("." + allowed) for allowed in allowed_hosts)
+
+
+def proxy_url(url: str) -> str:
+    return f"{settings.API_V1_STR}/images/proxy?url={quote(url, safe='')}"
+
+
+_ALLOWED_HOSTS = frozenset(host.lower() for host in settings.IMAGE_PROXY_ALLOWED_HOSTS)
+
+
+@functools.lru_cache(maxsize=8192)
+def _proxied_image(url: str) -> Optional[schemas.Image]:
+    if not is_allowed(url, _ALLOWED_HOSTS):
+        return None
+    return schemas.Image(url=proxy_url(url))
+
+
+def proxied_image(url: Optional[str]) -> Optional[schemas.Image]:
+    """
+    Image schema pointing at the proxy for an allowed remote URL; None for
+    anything else. Sizes are requested with the proxy's `w` parameter.
+
+    Runs for every image of every serialized POI, so the answer is memoized
+    per URL and the instance shared: treat it as read-only.
+    """
+    if not settings.IMAGE_PROXY_ENABLED or not is_remote(url):
+        return None
+    return _proxied_image(url)
+
+
+def select_variant(
+    variants: Iterable[Dict[str, Any]], width: Optional[int], formats: Iterable[str]
+) -> Optional[Dict[str, Any]]:
+    """
+    The smallest derivative at least `width` wide (else the widest) in the
+    first of `formats` that has one; None to serve the original.
+    """
+    if width is None:
+        return None
+    for fmt in formats:
+        candidates = sorted((v for v in variants if v["format"] == fmt), key=lambda v: v["width"])
+        if candidates:
+            return next((v for v in candidates if v["width"] >= width), candidates[-1])
+    return None
+
+
+class CacheIndex:
+    """
+    SQLite index of cached files. Methods block; call them on the thread pool.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entry (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                name TEXT NOT NULL,
+                content_type TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                accessed_at REAL NOT NULL,
+                variants TEXT
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entry_accessed_at ON entry (accessed_at)")
+
+    def _entry(self, row: Optional[tuple]) -> Optional[CacheEntry]:
+        if row is None:
+            return None
+        *fields, variants = row
+        return CacheEntry(*fields, json.loads(variants) if variants else [])
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT key, url, name, content_type, size, sha256, accessed_at, variants FROM entry WHERE key = ?",
+                (key,),
+            ).fetchone()
+        return self._entry(row)
+
+    def put(self, entry: CacheEntry) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entry VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*entry[:-1], json.dumps(entry.variants) if entry.variants else None),
+            )
+
+    def set_variants(self, key: str, variants: List[Dict[str, Any]], added_size: int) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE entry SET variants = ?, size = size + ? WHERE key = ?",
+                (json.dumps(variants), added_size, key),
+            )
+
+    def touch(self, key: str, now: float) -> None:
+        with self._lock:
+            self._db.execute("UPDATE entry SET accessed_at = ? WHERE key = ?", (now, key))
+
+    def total_size(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT coalesce(sum(size), 0) FROM entry").fetchone()[0]
+
+    def pop_oldest(self, need_bytes: int, keep: str) -> List[CacheEntry]:
+        """
+        Remove least recently used entries, other than `keep`, until at
+        least `need_bytes` are freed; returns them.
+        """
+        columns = "key, url, name, content_type, size, sha256, accessed_at, variants"
+        with self._lock:
+            popped, freed = [], 0
+            cursor = self._db.execute(
+                f"SELECT {columns} FROM entry WHERE key <> ? ORDER BY accessed_at", (keep,)
+            )
+            for row in cursor:
+                popped.append(self._entry(row))
+                freed += row[4]
+                if freed >= need_bytes:
+                    break
+            cursor.close()
+            self._db.executemany("DELETE FROM entry WHERE key = ?", [(entry.key,) for entry in popped])
+        return popped
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class ImageProxy:
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        allowed_hosts: Iterable[str],
+        max_fetches: int,
+        derivatives: Optional[DerivativePipeline] = None,
+        timeout: float = 10.0,
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.allowed_hosts = [host.lower() for host in allowed_hosts]
+        self.max_fetches = max_fetches
+        self.derivatives = derivatives
+        self.timeout = timeout
+        self._index: Optional[CacheIndex] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._fetch_slots: Optional[asyncio.Semaphore] = None
+        # key -> the download in progress, shared by concurrent misses
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._total: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evicted = 0
+
+    def _open_index(self) -> CacheIndex:
+        os.makedirs(self.directory, exist_ok=True)
+        return CacheIndex(os.path.join(self.directory, INDEX_FILE))
+
+    async def _ensure_started(self) -> CacheIndex:
+        if self._index is None:
+            index = await run_in_threadpool(self._open_index)
+            if self._index is None:
+                self._index = index
+                self._total = await run_in_threadpool(index.total_size)
+            else:
+                index.close()
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                headers={"User-Agent": f"{settings.PROJECT_NAME} image proxy"},
+                limits=httpx.Limits(max_connections=self.max_fetches),
+                event_hooks={"request": [self._check_request]},
+            )
+            self._fetch_slots = asyncio.Semaphore(self.max_fetches)
+        return self._index
+
+    async def _check_request(self, request: httpx.Request) -> None:
+        # Runs for every hop, so a redirect can't leave the allowlist.
+        if not is_allowed(str(request.url), self.allowed_hosts):
+            raise ImageProxyError(403, f"Host {request.url.host} is not allowed")
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, *name.split("/"))
+
+    async def get(self, url: str) -> CacheEntry:
+        """
+        The cache entry for `url`, fetching it on a miss.
+        Raises ImageProxyError with the status code to answer with.
+        """
+        if not is_allowed(url, self.allowed_hosts):
+            raise ImageProxyError(403, "URL is not on an allowed image host")
+        index = await self._ensure_started()
+        key = cache_key(url)
+
+        entry = await run_in_threadpool(index.get, key)
+        if entry is not None and await run_in_threadpool(os.path.exists, self.path(entry.name)):
+            self.hits += 1
+            now = time.time()
+            if now - entry.accessed_at > TOUCH_INTERVAL:
+                await run_in_threadpool(index.touch, key, now)
+            return entry
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.get_running_loop().create_task(self._fetch(url, key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded: one waiter disconnecting must not cancel the download
+        # for the others.
+        return await asyncio.shield(task)
+
+    async def _fetch(self, url: str, key: str) -> CacheEntry:
+        async with self._fetch_slots:
+            try:
+                entry = await self._download(url, key)
+            except httpx.HTTPError as e:
+                logger.warning("Image proxy fetch of %s failed: %s", url, e)
+                raise ImageProxyError(502, "Could not fetch the image")
+        await run_in_threadpool(self._index.put, entry)
+        await self._grow(entry.size, entry.key)
+        if self.derivatives is not None and self.derivatives.enabled:
+            task = asyncio.get_running_loop().create_task(self._derive(entry))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return entry
+
+    async def _download(self, url: str, key: str) -> CacheEntry:
+        max_bytes = settings.MAX_UPLOAD_BYTES
+        shard = os.path.join(self.directory, key[:2], key[2:4])
+        await run_in_threadpool(os.makedirs, shard, exist_ok=True)
+        buffer = await run_in_threadpool(
+            tempfile.NamedTemporaryFile, dir=shard, prefix=TEMP_PREFIX, delete=False
+        )
+        try:
+            async with self._client.stream("GET", url) as response:
+                if response.status_code == 404:
+                    raise ImageProxyError(404, "Image not found at the origin")
+                if response.status_code != 200:
+                    raise ImageProxyError(502, f"Origin answered {response.status_code}")
+                length = response.headers.get("content-length")
+                if length and length.isdigit() and int(length) > max_bytes:
+                    raise ImageProxyError(413, f"Image exceeds the {max_bytes} byte limit")
+
+                digest = hashlib.sha256()
+                size = 0
+                kind = None
+                async for chunk in response.aiter_bytes(settings.UPLOAD_CHUNK_SIZE):
+                    if kind is None:
+                        kind = sniff_image_type(chunk)
+                        if kind is None:
+                            raise ImageProxyError(415, "Origin did not return a supported image")
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ImageProxyError(413, f"Image exceeds the {max_bytes} byte limit")
+                    digest.update(chunk)
+                    await run_in_threadpool(buffer.write, chunk)
+            if kind is None:
+                raise ImageProxyError(415, "Origin did not return a supported image")
+            await run_in_threadpool(buffer.close)
+            name = f"{key[:2]}/{key[2:4]}/{key}.{kind[1]}"
+            await run_in_threadpool(os.replace, buffer.name, self.path(name))
+        except BaseException:
+            await run_in_threadpool(_discard, buffer)
+            raise
+        return CacheEntry(key, url, name, kind[0], size, digest.hexdigest(), time.time(), [])
+
+    async def _derive(self, entry: CacheEntry) -> None:
+        try:
+            result = await self.derivatives.generate(self.path(entry.name), self.directory, entry.name)
+        except Exception:
+            logger.exception("Derivatives for proxied %s failed", entry.url)
+            return
+        added = sum(variant["size"] for variant in result["variants"])
+        await run_in_threadpool(self._index.set_variants, entry.key, result["variants"], added)
+        await self._grow(added, entry.key)
+
+    async def _grow(self, added: int, keep: str) -> None:
+        """
+        Account for `added` bytes and evict least recently used entries,
+        other than `keep`, until the cache fits.
+        """
+        self._total += added
+        if self._total > self.max_bytes:
+            # Other workers share the index; start from its figure.
+            self._total = await run_in_threadpool(self._index.total_size)
+        if self._total <= self.max_bytes:
+            return
+        evicted = await run_in_threadpool(self._index.pop_oldest, self._total - self.max_bytes, keep)
+        for entry in evicted:
+            await run_in_threadpool(self._remove_files, entry)
+            self._total -= entry.size
+            self.evicted += 1
+
+    def _remove_files(self, entry: CacheEntry) -> None:
+        path = self.path(entry.name)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(os.path.splitext(path)[0], ignore_errors=True)
+
+    async def drain(self) -> None:
+        """
+        Wait for downloads and derivative jobs (tests, shutdown).
+        """
+        pending = list(self._inflight.values()) + list(self._tasks)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evicted": self.evicted,
+            "inflight": len(self._inflight),
+            "bytes": self._total or 0,
+        }
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+
+def _discard(buffer: Any) -> None:
+    buffer.close()
+    try:
+        os.unlink(buffer.name)
+    except FileNotFoundError:
+        pass
+
+
+image_proxy = ImageProxy(
+    directory=settings.IMAGE_PROXY_DIR,
+    max_bytes=settings.IMAGE_PROXY_MAX_BYTES,
+    allowed_hosts=settings.IMAGE_PROXY_ALLOWED_HOSTS,
+    max_fetches=settings.IMAGE_PROXY_MAX_FETCHES,
+    derivatives=derivative_pipeline,
+)
@@ -0,0 +1,312 @@
+"""
+Image derivatives for uploads.
+
+Each new upload is handed to a process pool after the response is sent.
+The worker writes resized copies named ab/cd/<sha256>/w<width>.<format>
+for every IMAGE_VARIANT_WIDTHS entry
+no wider than the original and every IMAGE_VARIANT_FORMATS entry. It also
+computes a blurhash placeholder. Derivatives are re-encoded from pixels,
+so EXIF (GPS position, camera serials) never reaches them; orientation is
+applied first so nothing looks rotated. The original blob is left
+byte-for-byte intact because its name is its hash.
+
+With local storage the worker reads and writes UPLOAD_DIR in place;
+with object storage the blob is downloaded to a scratch directory and the
+variants are uploaded from there.
+
+Results are stored on the `upload` row and surface on POI responses. Pillow
+is optional: without it uploads still work and simply get no derivatives.
+IMAGE_VARIANT_FORMATS the Pillow build can't write (AVIF needs a recent
+build with libavif) are skipped with a warning. Jobs live only as long as
+the process that scheduled them; `python -m app.backfill_derivatives`
+picks up uploads a restart left without derivatives.
+"""
+import asyncio
+import logging
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import update
+
+from app import models
+from app.core.config import settings
+from app.core.storage import TEMP_PREFIX, Storage, default_storage
+from app.db.session import AsyncSessionLocal
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+BLURHASH_COMPONENTS = (4, 3)
+BLURHASH_SAMPLE_SIZE = 32
+_B83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+_SAVE_OPTIONS = {
+    "webp": {"quality": 80, "method": 4},
+    "avif": {"quality": 60},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+}
+
+
+def _b83(value: int, length: int) -> str:
+    return "".join(_B83[(value // 83 ** (length - 1 - i)) % 83] for i in range(length))
+
+
+def _srgb_to_linear(value: int) -> float:
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def encode_blurhash(pixels: List[tuple], width: int, height: int, x_components: int, y_components: int) -> str:
+    """
+    Blurhash (https://blurha.sh) of RGB `pixels` in row-major order.
+    Meant for a thumbnail of a few dozen pixels a side.
+    """
+    linear = [(_srgb_to_linear(r), _srgb_to_linear(g), _srgb_to_linear(b)) for r, g, b in pixels]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            norm = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                cy = cos_y[j][y]
+                for x in range(width):
+                    basis = cos_x[i][x] * cy
+                    pr, pg, pb = linear[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = norm / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _b83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(c) for factor in ac for c in factor)
+        quantised_max = max(0, min(82, int(actual_max * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+        result += _b83(quantised_max, 1)
+    else:
+        max_value = 1.0
+        result += _b83(0, 1)
+    result += _b83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        q = [
+            max(0, min(18, int(math.floor(math.copysign(abs(c / max_value) ** 0.5, c) * 9 + 9.5))))
+            for c in factor
+        ]
+        result += _b83(q[0] * 19 * 19 + q[1] * 19 + q[2], 2)
+    return result
+
+
+def supported_formats(formats: List[str]) -> List[str]:
+    """
+    The entries of `formats` this Pillow build can write.
+    """
+    Image.init()
+    return [
+        fmt for fmt in formats
+        if (features.check_module(fmt) if fmt in features.modules else fmt.upper() in Image.SAVE)
+    ]
+
+
+def _save(image: Any, path: str, fmt: str) -> int:
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=TEMP_PREFIX)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # No exif= argument: the derivative carries no metadata.
+            image.save(f, format=fmt.upper(), **_SAVE_OPTIONS.get(fmt, {}))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return os.path.getsize(path)
+
+
+def generate_derivatives(
+    source: str, directory: str, name: str, widths: List[int], formats: List[str]
+) -> Dict[str, Any]:
+    """
+    Process pool entry point. `name` is the blob's path relative to
+    `directory` (ab/cd/<sha>.<ext>); derivatives go to ab/cd/<sha>/ and are
+    returned with their names relative to `directory`.
+    """
+    base = os.path.splitext(name)[0]
+    out_dir = os.path.join(directory, base)
+    os.makedirs(out_dir, exist_ok=True)
+
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        transparent = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if transparent else "RGB")
+    width, height = image.size
+
+    sample = image.convert("RGB")
+    sample.thumbnail((BLURHASH_SAMPLE_SIZE, BLURHASH_SAMPLE_SIZE))
+    # tobytes() rather than getdata()/get_flattened_data(), which differ
+    # between Pillow versions.
+    data = sample.tobytes()
+    pixels = list(zip(data[0::3], data[1::3], data[2::3]))
+    blurhash = encode_blurhash(pixels, sample.width, sample.height, *BLURHASH_COMPONENTS)
+
+    variants = []
+    formats = list(formats)
+    # Plus one copy at full size (capped at the largest width), so even a
+    # small image has a stripped variant.
+    targets = sorted({w for w in widths if w < width} | {min(width, max(widths))})
+    for target in targets:
+        resized = image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+        for fmt in list(formats):
+            file_name = f"w{target}.{fmt}"
+            try:
+                size = _save(resized, os.path.join(out_dir, file_name), fmt)
+            except (OSError, KeyError, ValueError) as e:
+                # One encoder failing shouldn't cost the image its other formats.
+                logger.warning("Skipping %s variants of %s: %s", fmt, name, e)
+                formats.remove(fmt)
+                continue
+            variants.append(
+                {
+                    "name": f"{base}/{file_name}",
+                    "width": resized.width,
+                    "height": resized.height,
+                    "format": fmt,
+                    "size": size,
+                }
+            )
+    return {"width": width, "height": height, "blurhash": blurhash, "variants": variants}
+
+
+class DerivativePipeline:
+    """
+    Schedules derivative jobs on a process pool without blocking requests.
+
+    Resizing is CPU-bound Python/C work that holds the GIL in places, so it
+    runs in separate processes. Jobs are fire-and-forget asyncio tasks;
+    failures are logged and leave the upload without variants until
+    app.backfill_derivatives runs.
+    """
+
+    def __init__(self, max_workers: int, storage: Optional[Storage] = None) -> None:
+        self.max_workers = max_workers
+        self.storage = storage or default_storage
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.formats = supported_formats(settings.IMAGE_VARIANT_FORMATS) if Image is not None else []
+        skipped = [fmt for fmt in settings.IMAGE_VARIANT_FORMATS if fmt not in self.formats]
+        if Image is not None and skipped:
+            logger.warning("Pillow can't write %s; no such variants will be made", ", ".join(skipped))
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return Image is not None and self.max_workers > 0
+
+    def schedule(self, upload_id: int, name: str) -> Optional[asyncio.Task]:
+        if not self.enabled:
+            return None
+        task = asyncio.get_running_loop().create_task(self._run(upload_id, name))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def generate(self, source: str, directory: str, name: str) -> Dict[str, Any]:
+        """
+        Run generate_derivatives on the pool and wait for the result.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            generate_derivatives,
+            source,
+            directory,
+            name,
+            list(settings.IMAGE_VARIANT_WIDTHS),
+            self.formats,
+        )
+
+    async def _generate(self, name: str) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        directory = self.storage.local_directory
+        if directory is not None:
+            return await self.generate(os.path.join(directory, name), directory, name)
+
+        scratch = await loop.run_in_executor(None, tempfile.mkdtemp)
+        try:
+            source = os.path.join(scratch, *name.split("/"))
+            await loop.run_in_executor(None, os.makedirs, os.path.dirname(source))
+            await self.storage.download(name, source)
+            result = await self.generate(source, scratch, name)
+            for variant in result["variants"]:
+                await self.storage.save_path(
+                    variant["name"], os.path.join(scratch, variant["name"]), f"image/{variant['format']}"
+                )
+            return result
+        finally:
+            await loop.run_in_executor(None, shutil.rmtree, scratch, True)
+
+    async def _run(self, upload_id: int, name: str) -> None:
+        try:
+            result = await self._generate(name)
+            for variant in result["variants"]:
+                variant["url"] = self.storage.url(variant.pop("name"))
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(models.Upload)
+                    .where(models.Upload.id == upload_id)
+                    .values(
+                        width=result["width"],
+                        height=result["height"],
+                        blurhash=result["blurhash"],
+                        variants=result["variants"],
+                    )
+                )
+                await db.commit()
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception("Derivatives for %s failed", name)
+
+    async def drain(self) -> None:
+        """
+        Wait for scheduled jobs (tests, shutdown).
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "max_workers": self.max_workers,
+            "pending": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+derivative_pipeline = DerivativePipeline(max_workers=settings.IMAGE_WORKERS)
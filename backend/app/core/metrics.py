@@ -0,0 +1,182 @@
+"""
+Minimal Prometheus text-format metrics.
+
+Values live in this process only; with several uvicorn workers each one
+exposes its own numbers and Prometheus aggregates them per instance.
+"""
+import bisect
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+_registry: List["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[List["Metric"]] = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        (_registry if registry is None else registry).append(self)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[List[Metric]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(labels[n] for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+        registry: Optional[List[Metric]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[n] for n in self.labelnames)
+        counts = self._values.get(key)
+        if counts is None:
+            counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        label_names = self.labelnames + ("le",)
+        for key, counts in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(label_names, key + (_format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(counts[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class GaugeCallback(Metric):
+    """
+    Gauge whose samples are read from a callback at scrape time, for state
+    that already lives elsewhere (pool sizes, hasher queue, limiters).
+    The callback yields (label values, value) pairs.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Iterable[Tuple[LabelValues, float]]],
+        labelnames: Sequence[str] = (),
+        registry: Optional[List[Metric]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        self.callback = callback
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self.callback():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# Request-level metrics recorded by RequestMetricsMiddleware.
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route"),
+)
+db_queries_per_request = Histogram(
+    "db_queries_per_request",
+    "Number of SQL statements executed per request.",
+    ("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+db_time_per_request = Histogram(
+    "db_query_seconds_per_request",
+    "Total SQL execution time per request.",
+    ("method", "route"),
+)
+db_hold_per_request = Histogram(
+    "db_connection_hold_seconds_per_request",
+    "Total time pooled connections were checked out per request.",
+    ("method", "route"),
+)
+db_repeated_statements = Counter(
+    "db_repeated_statement_requests_total",
+    "Requests that ran one statement at least DB_REPEATED_STATEMENT_THRESHOLD times (likely N+1).",
+    ("method", "route"),
+)
+
+# Recorded by CompressionMiddleware.
+compression_input_bytes = Counter(
+    "http_compression_input_bytes_total",
+    "Response body bytes before compression.",
+    ("encoding",),
+)
+compression_output_bytes = Counter(
+    "http_compression_output_bytes_total",
+    "Response body bytes sent compressed.",
+    ("encoding",),
+)
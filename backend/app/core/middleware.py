@@ -0,0 +1,245 @@
+import logging
+import time
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders, QueryParams
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.profiling import ProfilerBusy, RequestProfiler
+from app.db.session import AsyncSessionLocal
+from app.db.stats import RequestDBStats, current_db_stats
+
+logger = logging.getLogger(__name__)
+
+
+def route_template(scope: Scope) -> str:
+    """
+    Path template of the matched route ("/api/v1/pois/{poi_id}"), so metrics
+    are not split per id.
+    """
+    route = scope.get("route")
+    return getattr(route, "path", None) or "<unmatched>"
+
+
+class RequestMetricsMiddleware:
+    """
+    Attributes DB work to the request being served.
+
+    Query count, query time and connection hold time accrued before the
+    response starts go out in a Server-Timing header. The full figures,
+    including sessions closed after the response was sent, are recorded as
+    per-route metrics and logged once the request finishes, together with
+    any statement repeated often enough to look like an N+1.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestDBStats()
+        token = current_db_stats.set(stats)
+        started_at = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and (stats.queries or stats.connections):
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={stats.query_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                    f'db-conn;dur={stats.hold_seconds * 1000:.1f};desc="DB connection hold"',
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_db_stats.reset(token)
+            self.record(scope, stats, time.perf_counter() - started_at)
+
+    def record(self, scope: Scope, stats: RequestDBStats, duration: float) -> None:
+        labels = {"method": scope["method"], "route": route_template(scope)}
+        metrics.http_request_duration.observe(duration, **labels)
+        metrics.db_queries_per_request.observe(stats.queries, **labels)
+        metrics.db_time_per_request.observe(stats.query_seconds, **labels)
+        metrics.db_hold_per_request.observe(stats.hold_seconds, **labels)
+
+        repeated = stats.repeated_statements(settings.DB_REPEATED_STATEMENT_THRESHOLD)
+        if repeated:
+            metrics.db_repeated_statements.inc(**labels)
+            for statement, count in repeated:
+                logger.warning(
+                    "Possible N+1 in %s %s: statement ran %d times: %s",
+                    labels["method"],
+                    labels["route"],
+                    count,
+                    " ".join(statement.split())[:200],
+                )
+
+        if stats.connections:
+            level = (
+                logging.WARNING
+                if stats.hold_seconds > settings.DB_HOLD_WARN_SECONDS
+                else logging.DEBUG
+            )
+            logger.log(
+                level,
+                "%s %s: %d queries in %.1fms, held %d DB connection(s) for %.1fms",
+                labels["method"],
+                scope["path"],
+                stats.queries,
+                stats.query_seconds * 1000,
+                stats.connections,
+                stats.hold_seconds * 1000,
+            )
+
+
+# Values of ?profile= and X-Profile that ask for a profile
+PROFILE_FLAG_VALUES = frozenset({"1", "true", "yes"})
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a single request on demand (?profile=1 or X-Profile: 1; true
+    and yes work too). Only superusers can trigger it; anyone else sending
+    the flag is served normally. Requests without the flag pass straight
+    through. Under cProfile a flagged request that arrives while another is
+    being profiled gets 409.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if not await self.is_superuser(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = RequestProfiler()
+        name_holder = {}
+
+        async def send_with_profile_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # The handler is done by the time headers go out.
+                profiler.stop()
+                name_holder["name"] = await run_in_threadpool(
+                    profiler.save, scope["method"], scope["path"]
+                )
+                MutableHeaders(scope=message).append("X-Profile-Id", name_holder["name"])
+            await send(message)
+
+        try:
+            profiler.start()
+        except ProfilerBusy:
+            response = JSONResponse({"detail": "Another request is being profiled"}, status_code=409)
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            if "name" not in name_holder:
+                profiler.stop()
+
+    @staticmethod
+    def requested(scope: Scope) -> bool:
+        # Cheap byte checks first so unflagged requests pay almost nothing.
+        query = scope.get("query_string", b"")
+        if b"profile" in query:
+            value = QueryParams(query.decode("latin-1")).get("profile")
+            if value is not None and value.lower() in PROFILE_FLAG_VALUES:
+                return True
+        return any(
+            key == b"x-profile" and value.strip().decode("latin-1").lower() in PROFILE_FLAG_VALUES
+            for key, value in scope["headers"]
+        )
+
+    @staticmethod
+    async def is_superuser(scope: Scope) -> bool:
+        from app.api import deps
+
+        scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return False
+        try:
+            async with AsyncSessionLocal() as db:
+                principal = await deps.get_principal(db, token)
+        except HTTPException:
+            return False
+        return bool(principal.is_active and principal.is_superuser)
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class BodySizeLimitMiddleware:
+    """
+    Rejects request bodies larger than MAX_UPLOAD_BYTES plus `overhead`
+    (multipart framing and form fields) with 413 before they are spooled.
+
+    A Content-Length over the limit is refused without reading anything;
+    chunked bodies are counted as they arrive and cut off once they pass it.
+    Whatever the app does with the aborted body (FastAPI turns it into a
+    400), the client gets the 413.
+    """
+
+    def __init__(self, app: ASGIApp, overhead: int = 64 * 1024) -> None:
+        self.app = app
+        self.overhead = overhead
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = settings.MAX_UPLOAD_BYTES + self.overhead
+        length = Headers(scope=scope).get("content-length")
+        if length is not None and length.isdigit() and int(length) > max_bytes:
+            await self.reject(scope, receive, send, max_bytes)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    exceeded = True
+                    raise RequestTooLarge()
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            nonlocal started
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except RequestTooLarge:
+            pass
+        if exceeded and not started:
+            await self.reject(scope, receive, send, max_bytes)
+
+    @staticmethod
+    async def reject(scope: Scope, receive: Receive, send: Send, max_bytes: int) -> None:
+        response = JSONResponse(
+            {"detail": f"Request body exceeds the {max_bytes} byte limit"}, status_code=413
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,483 @@
+"""
+Offline city packs.
+
+Tourists download a region's whole catalog before they arrive: one SQLite
+file per region in OFFLINE_PACK_REGIONS with its POIs, the routes through
+them (stops in order) and a thumbnail of every POI image. Afterwards the
+app keeps itself current with GET /sync?since=<the pack's version>.
+
+Packs are built by `python -m app.build_packs`, not by the API workers:
+
+- A mirror of the catalog (catalog.sqlite3 under OFFLINE_PACK_DIR) is
+  brought up to date with the same change feed /sync serves, so a run
+  reads only what changed since the last one. Thumbnails are fetched for
+  image URLs the mirror has none for yet and dropped once unreferenced.
+- Every change records where it happened: the old and new position of a
+  changed POI and of every stop on its routes (a region carries whole
+  routes). Only regions with such a point in their box are cut out of
+  the mirror again, each into a fresh file named after its SHA-256. packs.json lists the
+  current file per region; the previous one is kept so running downloads
+  can finish.
+
+Serving a pack is a static file read (GET /packs/{region}): FileResponse
+sends Content-Length and handles Range/If-Range against the hash ETag,
+so an interrupted download resumes.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.core.catalog import catalog_poi, latest_catalog_version, read_catalog_changes
+from app.core.config import settings
+from app.core.image_proxy import ImageProxyError, image_proxy, is_allowed, select_variant
+from app.core.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+# Bumped on incompatible schema changes; stored as PRAGMA user_version.
+PACK_FORMAT = 1
+MIRROR_FILE = "catalog.sqlite3"
+MANIFEST_FILE = "packs.json"
+TEMP_PREFIX = ".pack-"
+
+# Shared by the mirror and the packs. Image columns hold the catalog's
+# image JSON (size, blurhash, online variants); thumbnail is keyed by the
+# POI's image URL.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS poi (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    historic_image_url TEXT,
+    modern_image_url TEXT,
+    historic_image TEXT,
+    modern_image TEXT,
+    change_version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS route (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT,
+    difficulty TEXT,
+    reward_xp REAL,
+    is_premium INTEGER,
+    change_version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS route_point (
+    route_id INTEGER NOT NULL,
+    poi_id INTEGER NOT NULL,
+    "order" INTEGER,
+    change_version INTEGER NOT NULL,
+    PRIMARY KEY (route_id, poi_id)
+);
+CREATE INDEX IF NOT EXISTS route_point_order ON route_point (route_id, "order");
+CREATE TABLE IF NOT EXISTS thumbnail (
+    url TEXT PRIMARY KEY,
+    content_type TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+# Mirror only: positions changed since the last publish.
+MIRROR_SCHEMA = SCHEMA + """
+CREATE TABLE IF NOT EXISTS touched (
+    longitude REAL NOT NULL,
+    latitude REAL NOT NULL,
+    PRIMARY KEY (longitude, latitude)
+);
+"""
+
+# Where a POI shows up: its own position and, as packs carry whole routes,
+# that of every stop on a route it belongs to.
+TOUCH_POI_SQL = """
+INSERT OR IGNORE INTO touched SELECT longitude, latitude FROM poi
+WHERE id = :id OR id IN (
+    SELECT stop.poi_id FROM route_point stop
+    WHERE stop.route_id IN (SELECT route_id FROM route_point WHERE poi_id = :id)
+)
+"""
+TOUCH_ROUTE_SQL = """
+INSERT OR IGNORE INTO touched SELECT p.longitude, p.latitude
+FROM route_point rp JOIN poi p ON p.id = rp.poi_id WHERE rp.route_id = :id
+"""
+
+POI_COLUMNS = (
+    "id", "title", "description", "latitude", "longitude",
+    "historic_image_url", "modern_image_url", "historic_image", "modern_image", "change_version",
+)
+ROUTE_COLUMNS = ("id", "title", "description", "difficulty", "reward_xp", "is_premium", "change_version")
+ROUTE_POINT_COLUMNS = ("route_id", "poi_id", "order", "change_version")
+
+# A region holds the POIs inside its box plus every stop of a route that
+# passes through it, so no route is cut short.
+REGION_SQL = """
+INSERT INTO poi SELECT * FROM mirror.poi
+WHERE (longitude BETWEEN :min_lon AND :max_lon AND latitude BETWEEN :min_lat AND :max_lat)
+   OR id IN (
+       SELECT stop.poi_id FROM mirror.route_point stop WHERE stop.route_id IN (
+           SELECT rp.route_id FROM mirror.route_point rp JOIN mirror.poi p ON p.id = rp.poi_id
+           WHERE p.longitude BETWEEN :min_lon AND :max_lon AND p.latitude BETWEEN :min_lat AND :max_lat
+       )
+   );
+INSERT INTO route_point SELECT rp.* FROM mirror.route_point rp WHERE rp.poi_id IN (SELECT id FROM poi);
+INSERT INTO route SELECT r.* FROM mirror.route r WHERE r.id IN (SELECT route_id FROM route_point);
+INSERT INTO thumbnail SELECT t.* FROM mirror.thumbnail t
+WHERE t.url IN (SELECT historic_image_url FROM poi UNION SELECT modern_image_url FROM poi);
+"""
+
+
+class Thumbnail(NamedTuple):
+    content_type: str
+    width: int
+    height: int
+    data: bytes
+
+
+ThumbnailFetcher = Callable[[str, Optional[Dict[str, Any]]], Awaitable[Optional[Thumbnail]]]
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def _read_upload(name: str) -> bytes:
+    directory = default_storage.local_directory
+    if directory is not None:
+        return await run_in_threadpool(_read_file, os.path.join(directory, *name.split("/")))
+    fd, path = tempfile.mkstemp(prefix=TEMP_PREFIX)
+    os.close(fd)
+    try:
+        await default_storage.download(name, path)
+        return await run_in_threadpool(_read_file, path)
+    finally:
+        os.unlink(path)
+
+
+async def fetch_thumbnail(url: str, image: Optional[Dict[str, Any]]) -> Optional[Thumbnail]:
+    """
+    The smallest derivative of a POI image at least
+    OFFLINE_PACK_THUMBNAIL_WIDTH wide, from upload storage or the image
+    proxy's cache; None while there is none (derivatives pending, remote
+    host failing), to be tried again on the next run.
+    """
+    width, formats = settings.OFFLINE_PACK_THUMBNAIL_WIDTH, settings.OFFLINE_PACK_THUMBNAIL_FORMATS
+    if image and image.get("variants"):
+        variant = select_variant(image["variants"], width, formats)
+        name = default_storage.name_from_url(variant["url"]) if variant else None
+        if name is None:
+            return None
+        data = await _read_upload(name)
+    elif settings.IMAGE_PROXY_ENABLED and is_allowed(url, settings.IMAGE_PROXY_ALLOWED_HOSTS):
+        try:
+            entry = await image_proxy.get(url)
+        except ImageProxyError as e:
+            logger.warning("No thumbnail for %s: %s", url, e.detail)
+            return None
+        variant = select_variant(entry.variants, width, formats)
+        if variant is None:
+            return None
+        data = await run_in_threadpool(_read_file, image_proxy.path(variant["name"]))
+    else:
+        return None
+    return Thumbnail(f"image/{variant['format']}", variant["width"], variant["height"], data)
+
+
+def read_manifest(directory: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Published packs by region ({} before the first build).
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_manifest(directory: str, manifest: Dict[str, Dict[str, Any]]) -> None:
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=TEMP_PREFIX)
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(directory, MANIFEST_FILE))
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _upsert(db: sqlite3.Connection, table: str, columns: Sequence[str], row: Dict[str, Any]) -> None:
+    names = ", ".join(f'"{name}"' for name in columns)
+    db.execute(
+        f"INSERT OR REPLACE INTO {table} ({names}) VALUES ({', '.join('?' * len(columns))})",
+        [row[name] for name in columns],
+    )
+
+
+class PackBuilder:
+    """
+    Catalog mirror and pack publisher. The SQLite methods block; `refresh`
+    runs them on the thread pool. One builder per directory at a time.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        regions: Dict[str, Sequence[float]],
+        fetch_thumbnail: ThumbnailFetcher = fetch_thumbnail,
+    ) -> None:
+        self.directory = directory
+        self.regions = regions
+        self.fetch_thumbnail = fetch_thumbnail
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, MIRROR_FILE), check_same_thread=False)
+        self._db.executescript(MIRROR_SCHEMA)
+
+    def _meta(self, key: str) -> int:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def _set_meta(self, key: str, value: Any) -> None:
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def version(self) -> int:
+        """Catalog version the mirror is at."""
+        return self._meta("version")
+
+    def _touch_poi(self, poi_id: int) -> None:
+        self._db.execute(TOUCH_POI_SQL, {"id": poi_id})
+
+    def _touch_route(self, route_id: int) -> None:
+        self._db.execute(TOUCH_ROUTE_SQL, {"id": route_id})
+
+    def reset(self) -> None:
+        with self._db:
+            self._db.execute("INSERT OR IGNORE INTO touched SELECT longitude, latitude FROM poi")
+            for table in ("poi", "route", "route_point", "thumbnail"):
+                self._db.execute(f"DELETE FROM {table}")
+            self._set_meta("version", 0)
+
+    def apply(self, changes: Iterable[Tuple[int, str, Dict[str, Any]]]) -> int:
+        """
+        Apply (version, kind, row) changes as read_catalog_changes orders
+        them, POI rows already in catalog_poi's shape, and record the
+        positions they touch before and after. Returns how many.
+        """
+        count, version = 0, None
+        with self._db:
+            for version, kind, row in changes:
+                count += 1
+                if kind == "poi":
+                    self._touch_poi(row["id"])
+                    row = dict(
+                        row,
+                        historic_image=json.dumps(row["historic_image"]) if row["historic_image"] else None,
+                        modern_image=json.dumps(row["modern_image"]) if row["modern_image"] else None,
+                        change_version=version,
+                    )
+                    _upsert(self._db, "poi", POI_COLUMNS, row)
+                    self._touch_poi(row["id"])
+                elif kind == "route":
+                    _upsert(self._db, "route", ROUTE_COLUMNS, row)
+                    self._touch_route(row["id"])
+                elif kind == "route_point":
+                    self._touch_route(row["route_id"])
+                    _upsert(self._db, "route_point", ROUTE_POINT_COLUMNS, row)
+                    self._touch_route(row["route_id"])
+                elif row["table_name"] == "point_of_interest":
+                    self._touch_poi(row["row_id"])
+                    self._db.execute("DELETE FROM poi WHERE id = ?", (row["row_id"],))
+                    self._db.execute("DELETE FROM route_point WHERE poi_id = ?", (row["row_id"],))
+                elif row["table_name"] == "route":
+                    self._touch_route(row["row_id"])
+                    self._db.execute("DELETE FROM route WHERE id = ?", (row["row_id"],))
+                    self._db.execute("DELETE FROM route_point WHERE route_id = ?", (row["row_id"],))
+                else:
+                    self._touch_route(row["row_id"])
+                    self._db.execute(
+                        "DELETE FROM route_point WHERE route_id = ? AND poi_id = ?", (row["row_id"], row["poi_id"])
+                    )
+            if count:
+                self._set_meta("version", version)
+        return count
+
+    def missing_thumbnails(self) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        (url, image JSON) of POI images without a thumbnail. The image JSON
+        is current: the catalog re-stamps a POI when its upload's
+        derivatives finish (app.db.sync), and apply() replaces the row.
+        """
+        rows = self._db.execute(
+            """
+            SELECT url, max(image) FROM (
+                SELECT historic_image_url AS url, historic_image AS image FROM poi
+                UNION ALL
+                SELECT modern_image_url, modern_image FROM poi
+            )
+            WHERE url IS NOT NULL AND url NOT IN (SELECT url FROM thumbnail)
+            GROUP BY url
+            """
+        ).fetchall()
+        return [(url, json.loads(image) if image else None) for url, image in rows]
+
+    def store_thumbnails(self, thumbnails: Dict[str, Thumbnail]) -> None:
+        """
+        Add fetched thumbnails and drop those no POI uses any more. Only
+        additions touch a region: the POIs that dropped an image were
+        touched when their change was applied.
+        """
+        with self._db:
+            for url, thumbnail in thumbnails.items():
+                self._db.execute("INSERT OR REPLACE INTO thumbnail VALUES (?, ?, ?, ?, ?)", (url, *thumbnail))
+                users = self._db.execute(
+                    "SELECT id FROM poi WHERE historic_image_url = ? OR modern_image_url = ?", (url, url)
+                ).fetchall()
+                for (poi_id,) in users:
+                    self._touch_poi(poi_id)
+            self._db.execute(
+                """
+                DELETE FROM thumbnail WHERE url NOT IN (
+                    SELECT historic_image_url FROM poi WHERE historic_image_url IS NOT NULL
+                    UNION SELECT modern_image_url FROM poi WHERE modern_image_url IS NOT NULL
+                )
+                """
+            )
+
+    async def fetch_thumbnails(self) -> int:
+        fetched = {}
+        for url, image in await run_in_threadpool(self.missing_thumbnails):
+            thumbnail = await self.fetch_thumbnail(url, image)
+            if thumbnail is not None:
+                fetched[url] = thumbnail
+        await run_in_threadpool(self.store_thumbnails, fetched)
+        return len(fetched)
+
+    def _build(self, region: str, bbox: Sequence[float], path: str) -> None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        pack = sqlite3.connect(path)
+        try:
+            pack.executescript(SCHEMA)
+            pack.execute(f"PRAGMA user_version = {PACK_FORMAT}")
+            pack.execute("ATTACH DATABASE ? AS mirror", (os.path.join(self.directory, MIRROR_FILE),))
+            with pack:
+                params = {"min_lon": min_lon, "min_lat": min_lat, "max_lon": max_lon, "max_lat": max_lat}
+                for statement in REGION_SQL.split(";"):
+                    if statement.strip():
+                        pack.execute(statement, params)
+                pack.executemany(
+                    "INSERT INTO meta VALUES (?, ?)",
+                    [("region", region), ("version", str(self.version)), ("bbox", json.dumps(list(bbox)))],
+                )
+            pack.execute("DETACH DATABASE mirror")
+            pack.execute("VACUUM")
+        finally:
+            pack.close()
+
+    def publish(self, force: bool = False) -> List[str]:
+        """
+        Rebuild the packs that are missing or have a touched position in
+        their box (every pack with `force`), and return their regions.
+        """
+        manifest = read_manifest(self.directory)
+        published = []
+        for region, bbox in self.regions.items():
+            current = manifest.get(region)
+            if (
+                not force
+                and current is not None
+                and current["bbox"] == list(bbox)
+                and os.path.exists(os.path.join(self.directory, current["file"]))
+                and not self._touched(bbox)
+            ):
+                continue
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=TEMP_PREFIX)
+            os.close(fd)
+            try:
+                self._build(region, bbox, tmp)
+                sha256 = _sha256(tmp)
+                file = f"{region}-{sha256[:16]}.sqlite3"
+                os.replace(tmp, os.path.join(self.directory, file))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            manifest[region] = {
+                "region": region,
+                "file": file,
+                "previous": current["file"] if current and current["file"] != file else None,
+                "version": self.version,
+                "bbox": list(bbox),
+                "size": os.path.getsize(os.path.join(self.directory, file)),
+                "sha256": sha256,
+                "built_at": datetime.now(timezone.utc).isoformat(),
+            }
+            published.append(region)
+            logger.info("Published %s pack %s at version %d", region, file, self.version)
+
+        dropped = [region for region in manifest if region not in self.regions]
+        for region in dropped:
+            del manifest[region]
+        if published or dropped:
+            _write_manifest(self.directory, manifest)
+            self._remove_stale(manifest)
+        # Every region with a touched position has just been rebuilt.
+        with self._db:
+            self._db.execute("DELETE FROM touched")
+        return published
+
+    def _touched(self, bbox: Sequence[float]) -> bool:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        row = self._db.execute(
+            "SELECT EXISTS (SELECT 1 FROM touched WHERE longitude BETWEEN ? AND ? AND latitude BETWEEN ? AND ?)",
+            (min_lon, max_lon, min_lat, max_lat),
+        ).fetchone()
+        return bool(row[0])
+
+    def _remove_stale(self, manifest: Dict[str, Dict[str, Any]]) -> None:
+        keep = {MIRROR_FILE, MANIFEST_FILE}
+        keep.update(name for entry in manifest.values() for name in (entry["file"], entry["previous"]) if name)
+        for name in os.listdir(self.directory):
+            if name.endswith(".sqlite3") and name not in keep:
+                os.unlink(os.path.join(self.directory, name))
+
+    async def refresh(self, db: AsyncSession) -> List[str]:
+        """
+        Catch the mirror up with the catalog, fetch missing thumbnails and
+        republish what changed.
+        """
+        # A mirror ahead of the catalog belongs to another database (e.g.
+        # restored from a backup); start over as /sync clients do.
+        if self.version > await latest_catalog_version(db):
+            logger.info("Mirror is ahead of the catalog; rebuilding from scratch")
+            await run_in_threadpool(self.reset)
+        while True:
+            changes, more = await read_catalog_changes(db, self.version, settings.SYNC_PAGE_SIZE)
+            plain = [
+                (version, kind, catalog_poi(row) if kind == "poi" else row._asdict())
+                for version, kind, row in changes
+            ]
+            await run_in_threadpool(self.apply, plain)
+            if not more:
+                break
+        await db.rollback()
+        await self.fetch_thumbnails()
+        return await run_in_threadpool(self.publish)
+
+    def close(self) -> None:
+        self._db.close()
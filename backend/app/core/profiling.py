@@ -0,0 +1,123 @@
+"""
+On-demand request profiling.
+
+A superuser request carrying `X-Profile: 1` (or `?profile=1`) runs under
+pyinstrument when it is installed, cProfile otherwise. The artifact lands
+in PROFILE_DIR and its name is returned in the X-Profile-Id header; admins
+browse them from /admin/profiles. Off unless PROFILING_ENABLED is set.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:  # pragma: no cover - optional dependency
+    SamplingProfiler = None
+
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.(html|pstats)$")
+
+# Only one cProfile profiler can be enabled per interpreter; a second
+# enable() would steal the hook from the first.
+_cprofile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class RequestProfiler:
+    """
+    Wraps whichever profiler is available behind start/stop/save.
+    cProfile sees every coroutine on the thread, so a busy worker mixes in
+    other requests' frames; pyinstrument's async mode only follows this one.
+    cProfile also profiles one request per process at a time: start()
+    raises ProfilerBusy while another is running.
+    """
+
+    def __init__(self) -> None:
+        if SamplingProfiler is not None:
+            self._profiler: Any = SamplingProfiler(
+                interval=settings.PROFILE_SAMPLE_INTERVAL, async_mode="enabled"
+            )
+            self.extension = "html"
+        else:
+            self._profiler = cProfile.Profile()
+            self.extension = "pstats"
+        self._enabled = False
+
+    def start(self) -> None:
+        if self.extension == "html":
+            self._profiler.start()
+            return
+        if not _cprofile_lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        self._enabled = True
+        self._profiler.enable()
+
+    def stop(self) -> None:
+        if self.extension == "html":
+            self._profiler.stop()
+        elif self._enabled:
+            self._profiler.disable()
+            self._enabled = False
+            _cprofile_lock.release()
+
+    def save(self, method: str, path: str) -> str:
+        """
+        Write the artifact and return its name. Blocking; run in a thread.
+        """
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        slug = re.sub(r"[^\w]+", "_", path).strip("_")[:60] or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{method.lower()}-{slug}-{uuid.uuid4().hex[:8]}.{self.extension}"
+        target = os.path.join(settings.PROFILE_DIR, name)
+        if self.extension == "html":
+            with open(target, "w", encoding="utf-8") as f:
+                f.write(self._profiler.output_html())
+        else:
+            self._profiler.dump_stats(target)
+        _prune()
+        return name
+
+
+def _prune() -> None:
+    profiles = list_profiles()
+    for profile in profiles[settings.PROFILE_MAX_FILES:]:
+        os.remove(os.path.join(settings.PROFILE_DIR, profile["name"]))
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """
+    Stored profiles, newest first.
+    """
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    profiles = []
+    for entry in os.scandir(settings.PROFILE_DIR):
+        if entry.is_file() and PROFILE_NAME_RE.match(entry.name):
+            stat = entry.stat()
+            profiles.append({"name": entry.name, "size": stat.st_size, "created_at": stat.st_mtime})
+    profiles.sort(key=lambda p: p["created_at"], reverse=True)
+    return profiles
+
+
+def profile_path(name: str) -> Optional[str]:
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = os.path.join(settings.PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def render_pstats(path: str, limit: int = 80) -> str:
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
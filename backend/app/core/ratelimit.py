@@ -0,0 +1,82 @@
+import threading
+import time
+from typing import Callable, Dict, Tuple
+
+
+class TokenBucketLimiter:
+    """
+    In-process token buckets keyed by an arbitrary string (client IP, account).
+
+    Each key holds a (tokens, updated_at) tuple. A bucket that has been idle
+    long enough to refill completely is indistinguishable from a missing one,
+    so such entries are swept out; max_keys bounds memory under key floods.
+    A rate of 0 disables the limiter. hit() is safe to call from several
+    threads.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        burst: int,
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate_per_minute / 60.0
+        self.burst = float(burst)
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    def hit(self, key: str) -> float:
+        """
+        Take one token for key.
+        Returns 0 if allowed, otherwise the seconds until a token is available.
+        """
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1.0:
+                tokens -= 1.0
+                retry_after = 0.0
+                self.allowed += 1
+            else:
+                retry_after = (1.0 - tokens) / self.rate
+                self.rejected += 1
+            # Re-inserting keeps the dict ordered by last use for eviction.
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._evict(now)
+        return retry_after
+
+    def _evict(self, now: float) -> None:
+        refill_seconds = self.burst / self.rate
+        for key in [k for k, (_, t) in self._buckets.items() if now - t >= refill_seconds]:
+            del self._buckets[key]
+            self.evicted += 1
+        # Still too many live buckets: drop the least recently used ones.
+        while len(self._buckets) > self.max_keys:
+            del self._buckets[next(iter(self._buckets))]
+            self.evicted += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "keys": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,137 @@
+"""
+Static file serving for uploads.
+
+Content-addressed paths (ab/cd/<sha256>.<ext> and the derivatives under
+ab/cd/<sha256>/) never change once written, so they are sent with a
+year-long `immutable` Cache-Control and a strong ETag derived from the
+name. Browsers and CDNs then skip revalidation altogether. Other files,
+such as uploads from before content addressing, keep Starlette's
+mtime-based ETag and must be revalidated.
+
+A `.br` or `.gz` sibling written next to a file is served in its place
+when the client accepts that encoding; image formats that are compressed
+already skip the lookup. Range and If-Range requests and
+HEAD are handled by FileResponse. FileResponse also uses the ASGI
+pathsend extension when the server offers it, so the server streams the
+file itself. Behind nginx, STATIC_ACCEL_REDIRECT hands the transfer over
+with X-Accel-Redirect and the app sends headers only.
+"""
+import os
+import re
+from mimetypes import guess_type
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.core.config import settings
+
+CONTENT_ADDRESSED_RE = re.compile(
+    r"^(?P<a>[0-9a-f]{2})/(?P<b>[0-9a-f]{2})/(?P<sha>(?P=a)(?P=b)[0-9a-f]{60})(?P<rest>\.\w+|/w\d+\.\w+)$"
+)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Preferred first.
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+# Not worth looking for siblings of these.
+COMPRESSED_TYPES = frozenset({"image/png", "image/jpeg", "image/gif", "image/webp", "image/avif"})
+
+
+def accepted_encodings(header: Optional[str]) -> FrozenSet[str]:
+    """
+    Content codings an Accept-Encoding header allows (q > 0).
+    """
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding)
+    if "*" in accepted:
+        accepted.update(coding for coding, _ in PRECOMPRESSED)
+    return frozenset(accepted)
+
+
+def _find_precompressed(full_path: str) -> Dict[str, Tuple[str, os.stat_result]]:
+    found = {}
+    for coding, suffix in PRECOMPRESSED:
+        try:
+            found[coding] = (full_path + suffix, os.stat(full_path + suffix))
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+    return found
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles with immutable caching for content-addressed uploads and
+    precompressed siblings.
+    """
+
+    def __init__(self, *, directory: str, accel_redirect: Optional[str] = None, **kwargs) -> None:
+        super().__init__(directory=directory, **kwargs)
+        self.root = os.path.realpath(directory)
+        self.accel_redirect = accel_redirect.rstrip("/") + "/" if accel_redirect else None
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        # Conditional handling moves to cached_response, once the
+        # representation (and so the ETag) is known.
+        return FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if isinstance(response, FileResponse) and response.status_code == 200:
+            return await self.cached_response(str(response.path), response.stat_result, scope)
+        return response
+
+    async def cached_response(self, full_path: str, stat_result: os.stat_result, scope: Scope) -> Response:
+        request_headers = Headers(scope=scope)
+        relative = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+        match = CONTENT_ADDRESSED_RE.match(relative)
+        headers: Dict[str, str] = {}
+        media_type = guess_type(full_path)[0]
+        coding = None
+
+        if media_type not in COMPRESSED_TYPES:
+            siblings = await run_in_threadpool(_find_precompressed, full_path)
+            if siblings:
+                # Caches must key on Accept-Encoding even when serving identity.
+                headers["vary"] = "Accept-Encoding"
+                accepted = accepted_encodings(request_headers.get("accept-encoding"))
+                coding = next((c for c, _ in PRECOMPRESSED if c in siblings and c in accepted), None)
+            if coding is not None:
+                headers["content-encoding"] = coding
+                full_path, stat_result = siblings[coding]
+                relative += dict(PRECOMPRESSED)[coding]
+
+        if match:
+            headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+            # Strong: the bytes are fixed by the name. Each encoding is a
+            # different representation and gets its own tag.
+            tag = match.group("sha") + match.group("rest").replace("/", "-")
+            if coding is not None:
+                tag += "." + coding
+            headers["etag"] = f'"{tag}"'
+        else:
+            headers["cache-control"] = f"public, max-age={settings.STATIC_MAX_AGE}, must-revalidate"
+
+        response = FileResponse(full_path, stat_result=stat_result, headers=headers, media_type=media_type)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        if self.accel_redirect:
+            # nginx sends the body (sendfile, ranges) from an internal
+            # location mapped onto UPLOAD_DIR; only the headers come from here.
+            redirect = Response(headers={k: v for k, v in response.headers.items() if k != "content-length"})
+            redirect.headers["x-accel-redirect"] = self.accel_redirect + relative
+            return redirect
+        return response
@@ -0,0 +1,334 @@
+"""
+Where upload blobs and their derivatives live.
+
+Two drivers share one interface and the same object names
+(ab/cd/<sha256>.<ext>, ab/cd/<sha256>/w480.webp):
+
+- LocalStorage writes under UPLOAD_DIR and is served by the /static mount.
+- S3Storage targets any S3-compatible store (AWS, MinIO, R2) through
+  boto3, an optional dependency needed only when STORAGE_BACKEND=s3.
+
+Either driver can hand out a presigned PUT, so clients send the bytes
+straight to storage and the API only records the result. For S3 that is
+a real presigned URL whose signature covers the content type and the
+SHA-256 checksum, so the store refuses any other bytes. LocalStorage
+signs a short-lived token for PUT /files/direct/{token} instead. The
+body still passes through the app there, but clients follow the same
+protocol either way.
+
+All blocking calls run on the thread pool.
+"""
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from typing import IO, Any, Dict, NamedTuple, Optional
+
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.static import IMMUTABLE_CACHE_CONTROL
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - optional dependency
+    boto3 = None
+
+TEMP_PREFIX = ".upload-"
+DIRECT_UPLOAD_TOKEN_TYPE = "direct-upload"
+
+
+class ObjectInfo(NamedTuple):
+    size: int
+    # First bytes, for sniffing the type of a directly uploaded object
+    head: bytes
+    # Hex SHA-256 as verified by the store, when it keeps one
+    sha256: Optional[str]
+
+
+class PresignedPut(NamedTuple):
+    url: str
+    # Must be sent unchanged with the PUT
+    headers: Dict[str, str]
+    expires_in: int
+
+
+class Storage:
+    """
+    Object storage interface. Names are relative paths using "/".
+    """
+
+    # Set when objects are plain files, so they can be processed in place.
+    local_directory: Optional[str] = None
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url.rstrip("/")
+
+    def url(self, name: str) -> str:
+        return f"{self.base_url}/{name}"
+
+    def name_from_url(self, url: Optional[str]) -> Optional[str]:
+        """
+        Object name behind one of our URLs; None for anything else.
+        """
+        prefix = self.base_url + "/"
+        if url and url.startswith(prefix):
+            return url[len(prefix):]
+        return None
+
+    async def exists(self, name: str) -> bool:
+        raise NotImplementedError
+
+    async def save(self, name: str, file: IO[bytes], content_type: str) -> None:
+        """
+        Store the contents of `file` (from its current position) as `name`.
+        """
+        raise NotImplementedError
+
+    async def save_path(self, name: str, path: str, content_type: str) -> None:
+        f = await run_in_threadpool(open, path, "rb")
+        try:
+            await self.save(name, f, content_type)
+        finally:
+            f.close()
+
+    async def download(self, name: str, path: str) -> None:
+        raise NotImplementedError
+
+    async def info(self, name: str, head_bytes: int = 16) -> Optional[ObjectInfo]:
+        raise NotImplementedError
+
+    async def delete(self, name: str) -> None:
+        """
+        Delete an object and everything under `<name without extension>/`,
+        i.e. its derivatives.
+        """
+        raise NotImplementedError
+
+    async def presign_put(self, name: str, content_type: str, size: int, sha256: str) -> PresignedPut:
+        raise NotImplementedError
+
+
+class LocalStorage(Storage):
+    def __init__(self, directory: str, base_url: str = "/static") -> None:
+        super().__init__(base_url)
+        self.local_directory = directory
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.local_directory, *name.split("/"))
+
+    async def exists(self, name: str) -> bool:
+        return await run_in_threadpool(os.path.exists, self.path(name))
+
+    def _save(self, name: str, file: IO[bytes]) -> None:
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Same directory as the target, so the final rename is atomic and
+        # readers never see a partial file.
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(file, out, settings.UPLOAD_CHUNK_SIZE)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    async def save(self, name: str, file: IO[bytes], content_type: str) -> None:
+        await run_in_threadpool(self._save, name, file)
+
+    async def download(self, name: str, path: str) -> None:
+        await run_in_threadpool(shutil.copyfile, self.path(name), path)
+
+    def _info(self, name: str, head_bytes: int) -> Optional[ObjectInfo]:
+        try:
+            with open(self.path(name), "rb") as f:
+                return ObjectInfo(os.fstat(f.fileno()).st_size, f.read(head_bytes), None)
+        except FileNotFoundError:
+            return None
+
+    async def info(self, name: str, head_bytes: int = 16) -> Optional[ObjectInfo]:
+        return await run_in_threadpool(self._info, name, head_bytes)
+
+    def _delete(self, name: str) -> None:
+        path = self.path(name)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(os.path.splitext(path)[0], ignore_errors=True)
+
+    async def delete(self, name: str) -> None:
+        await run_in_threadpool(self._delete, name)
+
+    async def presign_put(self, name: str, content_type: str, size: int, sha256: str) -> PresignedPut:
+        expires_in = settings.UPLOAD_PRESIGN_EXPIRE_SECONDS
+        token = jwt.encode(
+            {
+                "typ": DIRECT_UPLOAD_TOKEN_TYPE,
+                "sub": name,
+                "sha256": sha256,
+                "size": size,
+                "exp": datetime.utcnow() + timedelta(seconds=expires_in),
+            },
+            settings.SECRET_KEY,
+            algorithm=settings.ALGORITHM,
+        )
+        return PresignedPut(
+            f"{settings.API_V1_STR}/files/direct/{token}", {"Content-Type": content_type}, expires_in
+        )
+
+
+def decode_direct_upload_token(token: str) -> Optional[Dict[str, Any]]:
+    """
+    Claims of a LocalStorage presigned PUT token, or None if it is invalid
+    or expired.
+    """
+    try:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    if claims.get("typ") != DIRECT_UPLOAD_TOKEN_TYPE:
+        return None
+    return claims
+
+
+def _checksum(sha256: str) -> str:
+    # S3 wants the base64 of the raw digest.
+    return base64.b64encode(bytes.fromhex(sha256)).decode()
+
+
+class S3Storage(Storage):
+    def __init__(
+        self,
+        bucket: str,
+        base_url: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+    ) -> None:
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 installed")
+        super().__init__(base_url)
+        self.bucket = bucket
+        # boto3 clients are thread-safe; one is shared by all pool threads.
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=BotoConfig(signature_version="s3v4", max_pool_connections=32),
+        )
+
+    async def exists(self, name: str) -> bool:
+        try:
+            await run_in_threadpool(self.client.head_object, Bucket=self.bucket, Key=name)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    async def save(self, name: str, file: IO[bytes], content_type: str) -> None:
+        # upload_fileobj switches to a parallel multipart upload for large files.
+        await run_in_threadpool(
+            self.client.upload_fileobj,
+            file,
+            self.bucket,
+            name,
+            ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL},
+        )
+
+    async def download(self, name: str, path: str) -> None:
+        await run_in_threadpool(self.client.download_file, self.bucket, name, path)
+
+    def _info(self, name: str, head_bytes: int) -> Optional[ObjectInfo]:
+        try:
+            meta = self.client.head_object(Bucket=self.bucket, Key=name, ChecksumMode="ENABLED")
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        size = meta["ContentLength"]
+        head = b""
+        if size:
+            head = self.client.get_object(Bucket=self.bucket, Key=name, Range=f"bytes=0-{head_bytes - 1}")["Body"].read()
+        checksum = meta.get("ChecksumSHA256")
+        if checksum and "-" not in checksum:
+            sha256 = base64.b64decode(checksum).hex()
+        else:
+            # No whole-object checksum stored (multipart, or a client that
+            # left the header out): hash the object.
+            digest = hashlib.sha256()
+            body = self.client.get_object(Bucket=self.bucket, Key=name)["Body"]
+            for chunk in iter(lambda: body.read(settings.UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+            sha256 = digest.hexdigest()
+        return ObjectInfo(size, head, sha256)
+
+    async def info(self, name: str, head_bytes: int = 16) -> Optional[ObjectInfo]:
+        return await run_in_threadpool(self._info, name, head_bytes)
+
+    def _delete(self, name: str) -> None:
+        keys = [name]
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=os.path.splitext(name)[0] + "/"):
+            keys.extend(item["Key"] for item in page.get("Contents", []))
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True},
+            )
+
+    async def delete(self, name: str) -> None:
+        await run_in_threadpool(self._delete, name)
+
+    async def presign_put(self, name: str, content_type: str, size: int, sha256: str) -> PresignedPut:
+        expires_in = settings.UPLOAD_PRESIGN_EXPIRE_SECONDS
+        headers = {
+            "Content-Type": content_type,
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+            "x-amz-checksum-sha256": _checksum(sha256),
+        }
+        url = await run_in_threadpool(
+            self.client.generate_presigned_url,
+            "put_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": name,
+                "ContentType": content_type,
+                "ContentLength": size,
+                "CacheControl": IMMUTABLE_CACHE_CONTROL,
+                "ChecksumSHA256": headers["x-amz-checksum-sha256"],
+            },
+            ExpiresIn=expires_in,
+        )
+        return PresignedPut(url, headers, expires_in)
+
+
+def create_storage() -> Storage:
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage(
+            bucket=settings.S3_BUCKET,
+            base_url=settings.S3_PUBLIC_URL or f"{settings.S3_ENDPOINT_URL}/{settings.S3_BUCKET}",
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key_id=settings.S3_ACCESS_KEY_ID,
+            secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+        )
+    if settings.STORAGE_BACKEND != "local":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND {settings.STORAGE_BACKEND!r}")
+    return LocalStorage(settings.UPLOAD_DIR)
+
+
+default_storage = create_storage()
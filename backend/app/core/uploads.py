@@ -0,0 +1,184 @@
+"""
+Content-addressed uploads.
+
+Blobs are stored (see app.core.storage) as ab/cd/<sha256>.<ext> and are
+indexed in the `upload` table. An upload is read twice from Starlette's
+spooled copy: first to validate and hash it, then, only if no blob has
+that hash yet, to store it. A duplicate therefore costs one read and no
+write.
+
+Hashing runs in UPLOAD_CHUNK_SIZE chunks on the thread pool.
+"""
+import hashlib
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy import CTE, Select, func, select, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app import models, schemas
+from app.core.config import settings
+from app.core.storage import TEMP_PREFIX, Storage, default_storage
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__(f"File exceeds the {max_bytes} byte limit")
+        self.max_bytes = max_bytes
+
+
+class UnsupportedUpload(UploadError):
+    def __init__(self) -> None:
+        super().__init__("Unsupported file type; upload a PNG, JPEG, GIF, WebP or AVIF image")
+
+
+# Types accepted, by content type; the extension is part of the blob name.
+IMAGE_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/avif": "avif",
+}
+
+
+class UploadInfo(NamedTuple):
+    sha256: str
+    size: int
+    content_type: str
+    extension: str
+
+    @property
+    def name(self) -> str:
+        """
+        Object name, sharded on the first hash bytes.
+        """
+        return f"{self.sha256[:2]}/{self.sha256[2:4]}/{self.sha256}.{self.extension}"
+
+    @property
+    def url(self) -> str:
+        return default_storage.url(self.name)
+
+
+def sniff_image_type(head: bytes) -> Optional[Tuple[str, str]]:
+    """
+    (content type, extension) from the leading bytes, or None.
+    The client's filename and Content-Type are not trusted.
+    """
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        content_type = "image/png"
+    elif head.startswith(b"\xff\xd8\xff"):
+        content_type = "image/jpeg"
+    elif head[:6] in (b"GIF87a", b"GIF89a"):
+        content_type = "image/gif"
+    elif head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        content_type = "image/webp"
+    elif head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        content_type = "image/avif"
+    else:
+        return None
+    return content_type, IMAGE_EXTENSIONS[content_type]
+
+
+async def inspect_upload(
+    file: UploadFile,
+    max_bytes: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+) -> UploadInfo:
+    """
+    Validate and hash an upload without writing it anywhere. Raises
+    UnsupportedUpload on the first chunk and UploadTooLarge as soon as the
+    limit is passed.
+    """
+    max_bytes = max_bytes if max_bytes is not None else settings.MAX_UPLOAD_BYTES
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    await file.seek(0)
+    chunk = await file.read(chunk_size)
+    kind = sniff_image_type(chunk)
+    if kind is None:
+        raise UnsupportedUpload()
+
+    digest = hashlib.sha256()
+    size = 0
+    while chunk:
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        # hashlib drops the GIL for large buffers.
+        await run_in_threadpool(digest.update, chunk)
+        chunk = await file.read(chunk_size)
+    return UploadInfo(digest.hexdigest(), size, *kind)
+
+
+async def store_upload(file: UploadFile, info: UploadInfo, storage: Optional[Storage] = None) -> bool:
+    """
+    Store an inspected upload at its content address. Returns False without
+    writing when the blob already exists: same hash, same bytes.
+    """
+    storage = storage or default_storage
+    if await storage.exists(info.name):
+        return False
+    await file.seek(0)
+    await storage.save(info.name, file.file, info.content_type)
+    return True
+
+
+def adjust_refs(changes: Iterable[Select]) -> CTE:
+    """
+    UPDATE moving upload reference counts by `changes`: SELECTs of
+    (url, delta) rows, normally over the RETURNING rows of a POI write.
+    It comes as a CTE to attach to that write with add_cte(), so the counts
+    move in the same statement. NULL URLs and URLs that aren't uploads match no row;
+    app.gc_uploads recomputes the counts from scratch anyway.
+    """
+    rows = union_all(*changes).subquery()
+    delta = (
+        select(rows.c.url, func.sum(rows.c.delta).label("delta"))
+        .group_by(rows.c.url)
+        .subquery()
+    )
+    table = models.Upload.__table__
+    return (
+        update(table)
+        .where(table.c.url == delta.c.url, delta.c.delta != 0)
+        .values(ref_count=func.greatest(table.c.ref_count + delta.c.delta, 0))
+        .cte("refs")
+    )
+
+
+def image_schema(
+    url: Optional[str],
+    width: Optional[int],
+    height: Optional[int],
+    blurhash: Optional[str],
+    variants: Optional[List[Dict[str, Any]]],
+) -> Optional[schemas.Image]:
+    """
+    Image schema from upload columns; None when `url` isn't an upload.
+    """
+    if url is None:
+        return None
+    return schemas.Image(url=url, width=width, height=height, blurhash=blurhash, variants=variants or [])
+
+
+async def load_images(db: AsyncSession, urls: Iterable[Optional[str]]) -> Dict[str, schemas.Image]:
+    """
+    Image schemas for the given URLs that are uploads, in one query.
+    """
+    wanted = {url for url in urls if default_storage.name_from_url(url)}
+    if not wanted:
+        return {}
+    upload = models.Upload
+    result = await db.execute(
+        select(upload.url, upload.width, upload.height, upload.blurhash, upload.variants)
+        .where(upload.url.in_(wanted))
+    )
+    return {row.url: image_schema(*row) for row in result}
@@ -3,3 +3,5 @@ from app.models.user import User
 from app.models.poi import PointOfInterest
 from app.models.route import Route
 from app.models.progress import UserProgress
+from app.models.upload import Upload
+from app.models.tombstone import CatalogTombstone
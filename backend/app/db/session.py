@@ -1,10 +1,136 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.db.stats import instrument_engine
+
+logger = logging.getLogger(__name__)
+
+
+def create_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        future=True,
+        echo=settings.DB_ECHO,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    instrument_engine(engine)
+    return engine
+
 
-engine = create_async_engine(settings.DATABASE_URL, future=True, echo=True)
+engine = create_engine(settings.DATABASE_URL)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# Optional read replica for catalog and leaderboard reads.
+read_engine = create_engine(settings.READ_DATABASE_URL) if settings.READ_DATABASE_URL else None
+ReadSessionLocal = (
+    sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    if read_engine is not None
+    else None
+)
+
+# Zero on a primary (or a plain second instance standing in for a replica)
+# and on a standby that has replayed everything it received; otherwise the
+# age of the last replayed transaction.
+REPLICA_LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class ReplicaMonitor:
+    """
+    Decides whether reads may go to the replica: it must answer within the
+    check timeout and lag by no more than max_lag seconds. The result is
+    reused for check_interval seconds so requests never wait on it twice.
+    """
+
+    def __init__(self, engine: AsyncEngine, max_lag: float, check_interval: float) -> None:
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.available = False
+        self.lag: Optional[float] = None
+        self._next_check = 0.0
+        self._lock = asyncio.Lock()
+
+    async def is_available(self) -> bool:
+        if time.monotonic() < self._next_check:
+            return self.available
+        async with self._lock:
+            # Another request may have refreshed it while we waited.
+            if time.monotonic() >= self._next_check:
+                self.available = await self._check()
+                self._next_check = time.monotonic() + self.check_interval
+        return self.available
+
+    async def _check(self) -> bool:
+        try:
+            async with asyncio.timeout(self.check_interval):
+                async with self.engine.connect() as conn:
+                    self.lag = float((await conn.execute(REPLICA_LAG_SQL)).scalar() or 0)
+        except Exception as e:
+            logger.warning("Read replica unavailable, using primary: %r", e)
+            self.lag = None
+            return False
+        if self.lag > self.max_lag:
+            logger.warning("Read replica lagging %.1fs, using primary", self.lag)
+            return False
+        return True
+
+
+replica_monitor = (
+    ReplicaMonitor(
+        read_engine,
+        max_lag=settings.REPLICA_MAX_LAG_SECONDS,
+        check_interval=settings.REPLICA_CHECK_INTERVAL_SECONDS,
+    )
+    if read_engine is not None
+    else None
+)
+
+
 async def get_db():
+    """
+    Request-scoped session. It checks out a connection only on its first
+    query and returns it to the pool on commit, rollback or close.
+    """
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def get_read_db():
+    """
+    Session for read-only queries. Uses the replica when one is configured
+    and healthy, the primary otherwise.
+    """
+    factory = AsyncSessionLocal
+    if replica_monitor is not None and await replica_monitor.is_available():
+        factory = ReadSessionLocal
+    async with factory() as session:
+        yield session
+
+
+async def release_connection(session: AsyncSession) -> None:
+    """
+    Hand the session's connection back to the pool now instead of when the
+    request ends. Read-only handlers call this after their last query so the
+    connection is not held through response validation and serialization.
+    Loaded objects stay readable; the session checks out a new connection if
+    it is used again.
+    """
+    await session.close()
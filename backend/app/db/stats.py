@@ -0,0 +1,78 @@
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+class RequestDBStats:
+    """
+    Database usage attributed to a single request.
+    """
+
+    __slots__ = ("connections", "hold_seconds", "queries", "query_seconds", "statements")
+
+    def __init__(self) -> None:
+        self.connections = 0
+        self.hold_seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.statements: Counter = Counter()
+
+    def repeated_statements(self, threshold: int) -> List[Tuple[str, int]]:
+        """
+        Statements run at least `threshold` times, the usual N+1 signature
+        (the same parametrized SELECT once per parent row).
+        """
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+# Set per request by DBStatsMiddleware. SQLAlchemy runs pool events in a
+# greenlet that shares the caller's context, so the listeners below see it.
+current_db_stats: ContextVar[Optional[RequestDBStats]] = ContextVar(
+    "current_db_stats", default=None
+)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Charge every statement and every pooled-connection checkout to the
+    current request.
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started_at = conn.info["query_started_at"].pop()
+        stats = current_db_stats.get()
+        if stats is None:
+            return
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - started_at
+        stats.statements[statement] += 1
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        # after_cursor_execute is skipped for failed statements.
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started_at"):
+            conn.info["query_started_at"].pop()
+
+    @event.listens_for(sync_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        stats = current_db_stats.get()
+        if checked_out_at is None or stats is None:
+            return
+        stats.connections += 1
+        stats.hold_seconds += time.perf_counter() - checked_out_at
@@ -0,0 +1,126 @@
+"""
+Change tracking for the catalog (POIs, routes and their route_poi links),
+which the mobile apps sync incrementally (GET /sync).
+
+Each tracked row carries created_at, updated_at and a change_version drawn
+from one global sequence, catalog_change_seq. Deletes leave a row in
+catalog_tombstone with a version from the same sequence. Triggers do all
+of the stamping, so every write path (ORM, the RETURNING/CTE endpoints,
+bulk actions, raw SQL) is covered without the endpoints taking part.
+
+Sequence values are handed out at write time but become visible at
+commit, so two concurrent writers could commit out of order and a client
+that synced in between would skip the lower version for good. The
+triggers therefore take a transaction-scoped advisory lock before drawing
+a version: catalog writes are rare admin actions, and serializing them
+makes version order match commit order.
+
+A POI's image sizes, blurhash and variants live on its upload row, which
+the derivative pipeline fills in after the POI was saved. When they change,
+a trigger on upload re-stamps the POIs showing that image, so clients that
+synced the POI earlier receive the finished image info.
+"""
+from typing import List
+
+from sqlalchemy import DDL, BigInteger, Column, DateTime, FetchedValue, Sequence, event, func
+
+from app.db.base_class import Base
+
+TRACKED_TABLES = ("point_of_interest", "route", "route_poi")
+
+change_sequence = Sequence("catalog_change_seq", metadata=Base.metadata)
+
+# pg_advisory_xact_lock key shared by all catalog writers
+CHANGE_LOCK_KEY = 0x63617467  # "catg"
+
+
+def change_columns() -> List[Column]:
+    """
+    The tracking columns, for tables declared with Table().
+    """
+    return [
+        Column("created_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+        Column(
+            "updated_at", DateTime(timezone=True), nullable=False,
+            server_default=func.now(), server_onupdate=FetchedValue(),
+        ),
+        # Set by the catalog_stamp trigger on every insert and update
+        Column(
+            "change_version", BigInteger, nullable=False, unique=True, index=True,
+            server_default=FetchedValue(), server_onupdate=FetchedValue(),
+        ),
+    ]
+
+
+class ChangeTracked:
+    """
+    Declarative mixin adding the tracking columns.
+    """
+
+    created_at, updated_at, change_version = change_columns()
+
+
+CATALOG_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION catalog_stamp() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM pg_advisory_xact_lock({CHANGE_LOCK_KEY});
+        NEW.change_version := nextval('catalog_change_seq');
+        IF TG_OP = 'UPDATE' THEN
+            NEW.created_at := OLD.created_at;
+            NEW.updated_at := now();
+        END IF;
+        RETURN NEW;
+    END
+    $$
+    """,
+    # Statement level, so a bulk delete writes its tombstones in one INSERT.
+    f"""
+    CREATE OR REPLACE FUNCTION catalog_tombstones() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM pg_advisory_xact_lock({CHANGE_LOCK_KEY});
+        IF TG_TABLE_NAME = 'route_poi' THEN
+            INSERT INTO catalog_tombstone (table_name, row_id, poi_id)
+            SELECT TG_TABLE_NAME, route_id, poi_id FROM gone;
+        ELSE
+            INSERT INTO catalog_tombstone (table_name, row_id)
+            SELECT TG_TABLE_NAME, id FROM gone;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    # Touching the rows is enough: catalog_stamp gives them a new version.
+    """
+    CREATE OR REPLACE FUNCTION catalog_touch_images() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE point_of_interest SET updated_at = now()
+        WHERE historic_image_url = NEW.url OR modern_image_url = NEW.url;
+        RETURN NULL;
+    END
+    $$
+    """,
+    # Not on ref_count or last_uploaded_at updates, which every POI write
+    # and duplicate upload makes.
+    """
+    CREATE TRIGGER upload_touch_pois AFTER UPDATE OF width, height, blurhash, variants ON upload
+    FOR EACH ROW
+    WHEN ((OLD.width, OLD.height, OLD.blurhash, OLD.variants) IS DISTINCT FROM
+          (NEW.width, NEW.height, NEW.blurhash, NEW.variants))
+    EXECUTE FUNCTION catalog_touch_images()
+    """,
+]
+for _table in TRACKED_TABLES:
+    CATALOG_DDL += [
+        f"""
+        CREATE TRIGGER {_table}_stamp BEFORE INSERT OR UPDATE ON {_table}
+        FOR EACH ROW EXECUTE FUNCTION catalog_stamp()
+        """,
+        f"""
+        CREATE TRIGGER {_table}_tombstones AFTER DELETE ON {_table}
+        REFERENCING OLD TABLE AS gone FOR EACH STATEMENT EXECUTE FUNCTION catalog_tombstones()
+        """,
+    ]
+
+for _statement in CATALOG_DDL:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
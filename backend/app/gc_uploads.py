@@ -0,0 +1,127 @@
+"""
+Garbage-collect content-addressed uploads no POI references any more.
+
+    python -m app.gc_uploads                  # delete
+    python -m app.gc_uploads --dry-run        # only report
+
+1. Recompute every upload's ref_count from the POI image columns.
+2. Delete index rows with no references whose last upload is older than
+   the grace period, then their blobs and derivatives from storage. The
+   grace period keeps images an admin has just uploaded but not yet saved
+   on a POI.
+3. With local storage, sweep blobs, derivative directories and leftover
+   temp files in the sharded tree that have no index row (an interrupted
+   upload) and are older than the grace period. For object storage, expire
+   abandoned direct uploads with a bucket lifecycle rule instead.
+
+Files outside the ab/cd/ shards, such as uploads made before content
+addressing, are never touched.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import shutil
+import time
+from typing import List, Set
+
+from sqlalchemy import text
+
+from app.core.storage import TEMP_PREFIX, default_storage
+from app.db.session import AsyncSessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SHARD_RE = re.compile(r"^[0-9a-f]{2}$")
+BLOB_RE = re.compile(r"^([0-9a-f]{64})(\.\w+)?$")
+
+RECOUNT_SQL = """
+WITH refs AS (
+    SELECT url, count(*) AS n FROM (
+        SELECT historic_image_url AS url FROM point_of_interest WHERE historic_image_url IS NOT NULL
+        UNION ALL
+        SELECT modern_image_url FROM point_of_interest WHERE modern_image_url IS NOT NULL
+    ) images
+    GROUP BY url
+)
+UPDATE upload SET ref_count = coalesce(refs.n, 0)
+FROM upload u LEFT JOIN refs ON refs.url = u.url
+WHERE upload.id = u.id AND upload.ref_count <> coalesce(refs.n, 0)
+"""
+
+UNREFERENCED_WHERE = "ref_count = 0 AND last_uploaded_at < now() - make_interval(secs => :grace)"
+
+
+def sweep_orphans(directory: str, known: Set[str], grace: float, dry_run: bool) -> int:
+    """
+    Remove unindexed blobs, derivative directories and temp files older
+    than `grace` seconds.
+    """
+    cutoff = time.time() - grace
+    removed = 0
+    for top in os.listdir(directory):
+        top_path = os.path.join(directory, top)
+        if not SHARD_RE.match(top) or not os.path.isdir(top_path):
+            continue
+        for sub in os.listdir(top_path):
+            sub_path = os.path.join(top_path, sub)
+            if not SHARD_RE.match(sub) or not os.path.isdir(sub_path):
+                continue
+            for name in os.listdir(sub_path):
+                match = BLOB_RE.match(name)
+                orphan = name.startswith(TEMP_PREFIX) or (match and match.group(1) not in known)
+                path = os.path.join(sub_path, name)
+                if orphan and os.path.getmtime(path) < cutoff:
+                    logger.info("Removing orphan %s", path)
+                    if not dry_run:
+                        if os.path.isdir(path):
+                            shutil.rmtree(path, ignore_errors=True)
+                        else:
+                            os.unlink(path)
+                    removed += 1
+    return removed
+
+
+async def collect(grace: float, dry_run: bool) -> None:
+    storage = default_storage
+    async with AsyncSessionLocal() as db:
+        recounted = (await db.execute(text(RECOUNT_SQL))).rowcount
+        logger.info("Corrected %d reference counts", recounted)
+
+        if dry_run:
+            query = f"SELECT url FROM upload WHERE {UNREFERENCED_WHERE}"
+        else:
+            # Rows go before blobs: a blob without a row is swept on the next
+            # run, a row without a blob would be a broken URL.
+            query = f"DELETE FROM upload WHERE {UNREFERENCED_WHERE} RETURNING url"
+        urls: List[str] = list((await db.execute(text(query), {"grace": grace})).scalars())
+        if dry_run:
+            await db.rollback()
+        else:
+            await db.commit()
+        known = set((await db.execute(text("SELECT sha256 FROM upload"))).scalars())
+
+    for url in urls:
+        name = storage.name_from_url(url)
+        logger.info("Removing unreferenced %s", url)
+        if name and not dry_run:
+            await storage.delete(name)
+
+    directory = storage.local_directory
+    orphans = sweep_orphans(directory, known, grace, dry_run) if directory and os.path.isdir(directory) else 0
+    logger.info(
+        "%s %d unreferenced uploads and %d orphan files",
+        "Would remove" if dry_run else "Removed",
+        len(urls),
+        orphans,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grace-hours", type=float, default=24.0)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(collect(args.grace_hours * 3600, args.dry_run))
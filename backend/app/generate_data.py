@@ -0,0 +1,351 @@
+"""
+Synthetic large-scale dataset for load, benchmark and query plan tests.
+
+    python -m app.generate_data --pois 1000000 --routes 50000 \
+        --users 5000000 --progress 20000000 --workers 8 --seed 42
+
+Rows are generated in fixed-size chunks, each from its own RNG derived
+from (seed, table, chunk), and streamed into PostgreSQL with COPY by a
+pool of worker processes. The same seed and sizes always give the same
+data, whatever the worker count. New ids start after the current
+maximum, so the generator can also top up a non-empty database.
+
+Catalog chunks are copied with session_replication_role = replica, which
+skips the change-tracking triggers (app.db.sync) and their advisory lock
+that would otherwise serialize the workers; the chunk stamps its own
+change_version values from catalog_change_seq instead. This also skips
+foreign key checks, which the generated rows satisfy by construction, and
+needs a superuser connection.
+
+Distributions:
+- POIs cluster around well-known Moscow landmarks, with a share scattered
+  over the whole city bounding box. Each chunk of POIs belongs to one
+  hotspot, so routes drawn from a chunk stay walkable.
+- Routes have 3-15 points, mostly "easy", about 15% premium.
+- User XP is log-normal (a few power users, a long tail); level follows it.
+- Progress rows per user are geometric around the requested mean, and
+  routes are picked with a strong popularity skew.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import logging
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import asyncpg
+
+from app.core.config import settings
+from app.core.security import get_password_hash
+from app.db.sync import TRACKED_TABLES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# lon_min, lat_min, lon_max, lat_max
+MOSCOW_BBOX = (37.32, 55.55, 37.95, 55.92)
+HOTSPOTS = [
+    (37.6176, 55.7520),  # Kremlin / Red Square
+    (37.5915, 55.7495),  # Arbat
+    (37.6040, 55.7290),  # Gorky Park
+    (37.5370, 55.7490),  # Moscow City
+    (37.6330, 55.8260),  # VDNKh
+    (37.6680, 55.6670),  # Kolomenskoye
+    (37.6860, 55.6150),  # Tsaritsyno
+    (37.5570, 55.7100),  # Sparrow Hills
+    (37.7500, 55.7900),  # Izmailovo
+    (37.5560, 55.7260),  # Novodevichy
+    (37.6290, 55.7510),  # Zaryadye
+    (37.6050, 55.7650),  # Tverskaya
+]
+HOTSPOT_SHARE = 0.7
+HOTSPOT_SIGMA = 0.012  # degrees, roughly 1 km
+
+DIFFICULTIES = ["easy", "medium", "hard"]
+DIFFICULTY_WEIGHTS = [50, 35, 15]
+
+COLUMNS = {
+    "point_of_interest": ["id", "title", "description", "location", "historic_image_url", "modern_image_url"],
+    "route": ["id", "title", "description", "difficulty", "reward_xp", "is_premium"],
+    "route_poi": ["route_id", "poi_id", "order"],
+    "user": ["id", "username", "email", "hashed_password", "is_active", "is_superuser",
+             "token_version", "level", "xp", "bio"],
+    "user_progress": ["id", "user_id", "route_id", "status", "completed_points_count"],
+}
+
+
+def asyncpg_dsn(url: str) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+def chunk_rng(seed: int, table: str, chunk: int) -> random.Random:
+    return random.Random(f"{seed}:{table}:{chunk}")
+
+
+def route_point_count(seed: int, route_id: int) -> int:
+    # Cheap deterministic hash so progress rows can know a route's size
+    # without looking at the route chunk that generated it.
+    return 3 + ((route_id * 2654435761) ^ seed) % 13
+
+
+class Plan:
+    """
+    Sizes, id offsets and chunking shared by every worker.
+    """
+
+    def __init__(self, args: argparse.Namespace, offsets: Dict[str, int], password_hash: str) -> None:
+        self.seed = args.seed
+        self.chunk_size = args.chunk_size
+        self.sizes = {
+            "point_of_interest": args.pois,
+            "route": args.routes,
+            "user": args.users,
+        }
+        self.progress = args.progress
+        self.offsets = offsets
+        self.password_hash = password_hash
+
+    def chunks(self, table: str) -> int:
+        return math.ceil(self.sizes[table] / self.chunk_size)
+
+    def id_range(self, table: str, chunk: int) -> range:
+        start = chunk * self.chunk_size
+        end = min(start + self.chunk_size, self.sizes[table])
+        base = self.offsets[table] + 1
+        return range(base + start, base + end)
+
+
+def generate_pois(plan: Plan, chunk: int) -> Iterator[Sequence]:
+    rng = chunk_rng(plan.seed, "point_of_interest", chunk)
+    hotspot_lon, hotspot_lat = HOTSPOTS[chunk % len(HOTSPOTS)]
+    lon_min, lat_min, lon_max, lat_max = MOSCOW_BBOX
+    for poi_id in plan.id_range("point_of_interest", chunk):
+        if rng.random() < HOTSPOT_SHARE:
+            lon = min(lon_max, max(lon_min, rng.gauss(hotspot_lon, HOTSPOT_SIGMA)))
+            lat = min(lat_max, max(lat_min, rng.gauss(hotspot_lat, HOTSPOT_SIGMA * 0.6)))
+        else:
+            lon = rng.uniform(lon_min, lon_max)
+            lat = rng.uniform(lat_min, lat_max)
+        has_images = rng.random() < 0.7
+        yield (
+            poi_id,
+            f"Place {poi_id}",
+            ("Historic site. " * rng.randint(1, 20)).rstrip(),
+            f"SRID=4326;POINT({lon:.6f} {lat:.6f})",
+            f"https://example.com/historic/{poi_id}.jpg" if has_images else None,
+            f"https://example.com/modern/{poi_id}.jpg" if has_images and rng.random() < 0.8 else None,
+        )
+
+
+def generate_routes(plan: Plan, chunk: int) -> Iterator[Sequence]:
+    rng = chunk_rng(plan.seed, "route", chunk)
+    for route_id in plan.id_range("route", chunk):
+        points = route_point_count(plan.seed, route_id)
+        yield (
+            route_id,
+            f"Walk {route_id}",
+            ("A walk through history. " * rng.randint(1, 10)).rstrip(),
+            rng.choices(DIFFICULTIES, DIFFICULTY_WEIGHTS)[0],
+            float(25 * points),
+            rng.random() < 0.15,
+        )
+
+
+def generate_route_pois(plan: Plan, chunk: int) -> Iterator[Sequence]:
+    rng = chunk_rng(plan.seed, "route_poi", chunk)
+    poi_chunks = plan.chunks("point_of_interest")
+    if not poi_chunks:
+        # No POIs: the routes stay empty.
+        return
+    for route_id in plan.id_range("route", chunk):
+        # All points from one POI chunk, i.e. around one hotspot.
+        poi_ids = plan.id_range("point_of_interest", rng.randrange(poi_chunks))
+        count = min(route_point_count(plan.seed, route_id), len(poi_ids))
+        for order, poi_id in enumerate(rng.sample(poi_ids, count)):
+            yield (route_id, poi_id, order)
+
+
+def generate_progress(plan: Plan, chunk: int) -> Iterator[Sequence]:
+    rng = chunk_rng(plan.seed, "user_progress", chunk)
+    routes = plan.sizes["route"]
+    mean_per_user = plan.progress / max(plan.sizes["user"], 1)
+    p = 1 / (1 + mean_per_user)
+    # A fixed block of ids per user keeps chunks from colliding; the gaps
+    # left by users with fewer rows are harmless.
+    per_user = min(routes, math.ceil(mean_per_user * 10) + 1)
+    for user_id in plan.id_range("user", chunk):
+        next_id = plan.offsets["user_progress"] + 1 + (user_id - plan.offsets["user"] - 1) * per_user
+        # Geometric count around the requested mean.
+        count = min(int(math.log(1 - rng.random()) / math.log(1 - p)) if p < 1 else 0, per_user)
+        taken = set()
+        while len(taken) < count:
+            # Cubed uniform: low route ids are far more popular.
+            taken.add(int(routes * rng.random() ** 3))
+        for index in taken:
+            route_id = plan.offsets["route"] + 1 + index
+            completed = rng.random() < 0.4
+            points = route_point_count(plan.seed, route_id)
+            yield (
+                next_id,
+                user_id,
+                route_id,
+                "completed" if completed else "started",
+                points if completed else rng.randint(0, points - 1),
+            )
+            next_id += 1
+
+
+def generate_users(plan: Plan, chunk: int) -> Iterator[Sequence]:
+    rng = chunk_rng(plan.seed, "user", chunk)
+    for user_id in plan.id_range("user", chunk):
+        xp = min(round(rng.lognormvariate(5.5, 1.6)), 1_000_000)
+        yield (
+            user_id,
+            f"user{user_id}",
+            f"user{user_id}@example.com",
+            plan.password_hash,
+            rng.random() > 0.02,
+            False,
+            0,
+            1 + int(math.sqrt(xp / 100)),
+            float(xp),
+            "Chrono walker" if rng.random() < 0.1 else None,
+        )
+
+
+GENERATORS = {
+    "point_of_interest": generate_pois,
+    "route": generate_routes,
+    "route_poi": generate_route_pois,
+    "user": generate_users,
+    "user_progress": generate_progress,
+}
+
+
+def _to_csv(rows: Sequence[Sequence]) -> io.BytesIO:
+    text = io.StringIO()
+    writer = csv.writer(text)
+    for row in rows:
+        # Empty unquoted field is NULL in COPY csv.
+        writer.writerow(["" if v is None else v for v in row])
+    return io.BytesIO(text.getvalue().encode())
+
+
+async def _copy_chunk(dsn: str, table: str, plan: Plan, chunk: int) -> int:
+    rows = list(GENERATORS[table](plan, chunk))
+    if not rows:
+        return 0
+    columns = COLUMNS[table]
+    conn = await asyncpg.connect(dsn)
+    try:
+        if table in TRACKED_TABLES:
+            await conn.execute("SET session_replication_role = replica")
+            versions = await conn.fetch(
+                "SELECT nextval('catalog_change_seq') FROM generate_series(1, $1)", len(rows)
+            )
+            rows = [(*row, version[0]) for row, version in zip(rows, versions)]
+            columns = columns + ["change_version"]
+        await conn.copy_to_table(table, source=_to_csv(rows), columns=columns, format="csv")
+    finally:
+        await conn.close()
+    return len(rows)
+
+
+def copy_chunk(dsn: str, table: str, plan: Plan, chunk: int) -> int:
+    """
+    Worker process entry point: generate one chunk and COPY it.
+    """
+    return asyncio.run(_copy_chunk(dsn, table, plan, chunk))
+
+
+def chunk_count(plan: Plan, table: str) -> int:
+    # Link tables follow the chunking of their parent.
+    parent = {"route_poi": "route", "user_progress": "user"}.get(table, table)
+    return plan.chunks(parent)
+
+
+async def current_offsets(conn: asyncpg.Connection) -> Dict[str, int]:
+    offsets = {}
+    for table in ("point_of_interest", "route", "user", "user_progress"):
+        offsets[table] = await conn.fetchval(f'SELECT coalesce(max(id), 0) FROM "{table}"')
+    return offsets
+
+
+async def main(args: argparse.Namespace) -> None:
+    dsn = asyncpg_dsn(args.database_url or settings.DATABASE_URL)
+    conn = await asyncpg.connect(dsn)
+    try:
+        if args.truncate:
+            logger.info("Truncating catalog, user and progress tables")
+            await conn.execute(
+                'TRUNCATE user_progress, route_poi, route, point_of_interest, "user" RESTART IDENTITY CASCADE'
+            )
+        offsets = await current_offsets(conn)
+    finally:
+        await conn.close()
+
+    # One hash shared by every generated user; hashing millions would take days.
+    plan = Plan(args, offsets, get_password_hash(args.password))
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    # Parents before children so foreign keys hold at every COPY.
+    phases: List[List[str]] = [["point_of_interest", "user"], ["route"], ["route_poi", "user_progress"]]
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for tables in phases:
+            jobs = [
+                loop.run_in_executor(pool, copy_chunk, dsn, table, plan, chunk)
+                for table in tables
+                for chunk in range(chunk_count(plan, table))
+            ]
+            rows = sum(await asyncio.gather(*jobs))
+            logger.info("Loaded %s: %d rows (%.1fs)", ", ".join(tables), rows, time.perf_counter() - started)
+
+    conn = await asyncpg.connect(dsn)
+    try:
+        for table in ("point_of_interest", "route", "user", "user_progress"):
+            await conn.execute(
+                f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                f'(SELECT coalesce(max(id), 1) FROM "{table}"))'
+            )
+        logger.info("Analyzing")
+        await conn.execute("ANALYZE")
+    finally:
+        await conn.close()
+    logger.info("Done in %.1fs", time.perf_counter() - started)
+
+
+def non_negative(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} is negative")
+    return number
+
+
+def positive(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not positive")
+    return number
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pois", type=non_negative, default=100_000)
+    parser.add_argument("--routes", type=non_negative, default=5_000)
+    parser.add_argument("--users", type=non_negative, default=100_000)
+    parser.add_argument("--progress", type=non_negative, default=400_000, help="approximate total progress rows")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=positive, default=4)
+    parser.add_argument("--chunk-size", type=positive, default=50_000)
+    parser.add_argument("--password", default="password", help="password of every generated user")
+    parser.add_argument("--database-url", help="defaults to DATABASE_URL")
+    parser.add_argument("--truncate", action="store_true", help="empty the tables first")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
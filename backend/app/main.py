@@ -1,8 +1,11 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
+from fastapi.responses import PlainTextResponse
 from app.core.config import settings
 from app.api.v1.api import api_router
-
-from fastapi.staticfiles import StaticFiles
+from app.core import metrics
+from app.core.compression import CompressionMiddleware
+from app.core.middleware import BodySizeLimitMiddleware, ProfilingMiddleware, RequestMetricsMiddleware
+from app.core.static import CachedStaticFiles
 import os
 
 app = FastAPI(
@@ -11,11 +14,22 @@ app = FastAPI(
     version="0.1.0"
 )
 
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+app.add_middleware(BodySizeLimitMiddleware)
+app.add_middleware(RequestMetricsMiddleware)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 # Ensure uploads dir exists
-if not os.path.exists("app/uploads"):
-    os.makedirs("app/uploads")
+if not os.path.exists(settings.UPLOAD_DIR):
+    os.makedirs(settings.UPLOAD_DIR)
 
-app.mount("/static", StaticFiles(directory="app/uploads"), name="static")
+app.mount(
+    "/static",
+    CachedStaticFiles(directory=settings.UPLOAD_DIR, accel_redirect=settings.STATIC_ACCEL_REDIRECT),
+    name="static",
+)
 
 from app.web import admin
 app.include_router(admin.router, prefix="/admin", tags=["admin"])
@@ -26,3 +40,82 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 @app.get("/")
 async def root():
     return {"message": "Welcome to Moscow Chrono Walker API"}
+
+
+# Process-wide state exposed at scrape time.
+from app.api import deps
+from app.core import images, security
+from app.core.compression import compressed_body_cache
+from app.core.image_proxy import image_proxy
+from app.db import session
+
+
+def _pool_stats():
+    engines = [("primary", session.engine), ("replica", session.read_engine)]
+    for name, engine in engines:
+        if engine is None:
+            continue
+        pool = engine.sync_engine.pool
+        yield (name, "size"), pool.size()
+        yield (name, "checked_out"), pool.checkedout()
+        yield (name, "overflow"), pool.overflow()
+        yield (name, "capacity"), pool.size() + settings.DB_MAX_OVERFLOW
+
+
+metrics.GaugeCallback(
+    "db_pool_connections", "Connection pool state.", _pool_stats, ("engine", "state")
+)
+metrics.GaugeCallback(
+    "password_hasher",
+    "bcrypt thread pool queue and totals.",
+    lambda: (((k,), v) for k, v in security.password_hasher.stats().items()),
+    ("stat",),
+)
+metrics.GaugeCallback(
+    "login_rate_limiter",
+    "Login token bucket counters.",
+    lambda: (
+        ((name, k), v)
+        for name, limiter in (("ip", deps.login_ip_limiter), ("account", deps.login_account_limiter))
+        for k, v in limiter.stats().items()
+    ),
+    ("limiter", "stat"),
+)
+metrics.GaugeCallback(
+    "image_derivatives",
+    "Image derivative pipeline jobs.",
+    lambda: (((k,), v) for k, v in images.derivative_pipeline.stats().items()),
+    ("stat",),
+)
+metrics.GaugeCallback(
+    "image_proxy",
+    "Remote image cache counters.",
+    lambda: (((k,), v) for k, v in image_proxy.stats().items()),
+    ("stat",),
+)
+metrics.GaugeCallback(
+    "principal_cache",
+    "Authenticated-principal cache.",
+    lambda: [
+        (("size",), len(deps.principal_cache)),
+        (("hits",), deps.principal_cache.hits),
+        (("misses",), deps.principal_cache.misses),
+    ],
+    ("stat",),
+)
+
+metrics.GaugeCallback(
+    "compression_cache",
+    "Compressed response bodies cache.",
+    lambda: [
+        (("size",), len(compressed_body_cache)),
+        (("hits",), compressed_body_cache.hits),
+        (("misses",), compressed_body_cache.misses),
+    ],
+    ("stat",),
+)
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(deps.require_metrics_access)])
+async def read_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
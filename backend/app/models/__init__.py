@@ -2,3 +2,5 @@ from .user import User
 from .poi import PointOfInterest
 from .route import Route, route_poi_association
 from .progress import UserProgress
+from .upload import Upload
+from .tombstone import CatalogTombstone
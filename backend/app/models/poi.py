@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, Float, Text
+from sqlalchemy import Column, Index, Integer, String, Float, Text
 from geoalchemy2 import Geometry
 from app.db.base_class import Base
+from app.db.sync import ChangeTracked
 
-class PointOfInterest(Base):
+class PointOfInterest(ChangeTracked, Base):
     __tablename__ = "point_of_interest"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -11,7 +12,14 @@ class PointOfInterest(Base):
     
     # Geospatial data: Point(lon, lat)
     # SRID 4326 is standard GPS lat/lon
-    location = Column(Geometry("POINT", srid=4326), nullable=False)
+    # spatial_index creates the GiST index idx_point_of_interest_location
+    location = Column(Geometry("POINT", srid=4326, spatial_index=True), nullable=False)
     
-    historic_image_url = Column(String, nullable=True)
-    modern_image_url = Column(String, nullable=True)
+    # Indexed for the upload_touch_pois trigger (app.db.sync)
+    historic_image_url = Column(String, nullable=True, index=True)
+    modern_image_url = Column(String, nullable=True, index=True)
+
+    __table_args__ = (
+        # Admin title search (ILIKE '%term%'); needs the pg_trgm extension.
+        Index("ix_point_of_interest_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+    )
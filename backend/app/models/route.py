@@ -1,17 +1,20 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, Table
+from sqlalchemy import Column, Index, Integer, String, Boolean, Float, ForeignKey, Table
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
+from app.db.sync import ChangeTracked, change_columns
 
 # Association table for Route <-> POI (Many-to-Many) with order
 route_poi_association = Table(
     'route_poi',
     Base.metadata,
     Column('route_id', Integer, ForeignKey('route.id'), primary_key=True),
-    Column('poi_id', Integer, ForeignKey('point_of_interest.id'), primary_key=True),
-    Column('order', Integer, default=0)
+    # The PK leads with route_id; POI lookups and FK checks need their own index.
+    Column('poi_id', Integer, ForeignKey('point_of_interest.id'), primary_key=True, index=True),
+    Column('order', Integer, default=0),
+    *change_columns(),
 )
 
-class Route(Base):
+class Route(ChangeTracked, Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True, nullable=False)
     description = Column(String, nullable=True)
@@ -21,3 +24,8 @@ class Route(Base):
     
     # Relationships
     points = relationship("PointOfInterest", secondary=route_poi_association, backref="routes")
+
+    __table_args__ = (
+        # Admin title search (ILIKE '%term%'); needs the pg_trgm extension.
+        Index("ix_route_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+    )
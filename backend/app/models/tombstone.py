@@ -0,0 +1,20 @@
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String, func
+from app.db.base_class import Base
+from app.db.sync import change_sequence
+
+class CatalogTombstone(Base):
+    """
+    A deleted catalog row, written by the catalog_tombstones trigger
+    (see app.db.sync).
+    """
+    __tablename__ = "catalog_tombstone"
+
+    # Drawn from the same sequence as the live rows' change_version
+    change_version = Column(BigInteger, primary_key=True, server_default=change_sequence.next_value())
+    # point_of_interest, route or route_poi
+    table_name = Column(String, nullable=False)
+    # The row's id; the route_id for route_poi
+    row_id = Column(Integer, nullable=False)
+    # The poi_id for route_poi
+    poi_id = Column(Integer, nullable=True)
+    deleted_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -0,0 +1,23 @@
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String, func
+from sqlalchemy.dialects.postgresql import JSONB
+from app.db.base_class import Base
+
+class Upload(Base):
+    """
+    Index of content-addressed blobs under UPLOAD_DIR (ab/cd/<sha256>.<ext>).
+    """
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, index=True, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String, nullable=False)
+    url = Column(String, unique=True, index=True, nullable=False)
+    # POI image fields pointing at `url`; recomputed by app.gc_uploads
+    ref_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Bumped by duplicate uploads too, so GC's grace period covers them
+    last_uploaded_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    # Filled in by the derivative pipeline once the variants are written
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    blurhash = Column(String, nullable=True)
+    variants = Column(JSONB, nullable=True)
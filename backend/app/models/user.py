@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float
+from sqlalchemy import Column, Integer, String, Boolean, Float, Index, func
 from app.db.base_class import Base
 
 class User(Base):
@@ -8,8 +8,16 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean(), default=True)
     is_superuser = Column(Boolean(), default=False)
+    # Bumped to revoke every token issued so far (password change, deactivation)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Gamification
     level = Column(Integer, default=1)
-    xp = Column(Float, default=0.0)
+    xp = Column(Float, default=0.0, index=True)  # leaderboard ORDER BY xp DESC
     bio = Column(String, nullable=True)
+
+    # Login and register match identities case-insensitively through these.
+    __table_args__ = (
+        Index("ix_user_username_lower", func.lower(username), unique=True),
+        Index("ix_user_email_lower", func.lower(email), unique=True),
+    )
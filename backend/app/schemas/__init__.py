@@ -1,5 +1,9 @@
 from .token import Token, TokenPayload
-from .user import User, UserCreate, UserInDB, UserUpdate
-from .poi import PointOfInterest, PointOfInterestCreate, PointOfInterestUpdate
+from .user import User, UserCreate, UserInDB, UserPrincipal, UserUpdate
+from .poi import Image, ImageVariant, PointOfInterest, PointOfInterestCreate, PointOfInterestUpdate
 from .route import Route, RouteCreate, RouteUpdate
 from .progress import UserProgress, UserProgressCreate, UserProgressUpdate
+from .upload import PresignedUpload, UploadRequest, UploadResult
+from .bulk import BulkResult, PointOfInterestBulk, PointOfInterestFilter, RouteBulk, RouteFilter
+from .sync import CatalogChanges, RoutePoint, SyncDeleted, SyncRoute
+from .pack import OfflinePack
@@ -0,0 +1,38 @@
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+
+class PointOfInterestFilter(BaseModel):
+    # Same filters as the admin POI list
+    q: Optional[str] = Field(None, max_length=200)
+    images: Literal["any", "with", "without"] = "any"
+
+class RouteFilter(BaseModel):
+    # Same filters as the admin route list
+    q: Optional[str] = Field(None, max_length=200)
+    difficulty: Optional[str] = Field(None, max_length=20)
+    premium: Literal["any", "yes", "no"] = "any"
+
+class PointOfInterestBulk(BaseModel):
+    # Exactly one of ids / filter selects the rows.
+    ids: Optional[List[int]] = Field(None, max_length=10000)
+    filter: Optional[PointOfInterestFilter] = None
+    action: Literal["delete", "move"]
+    # For "move", in degrees
+    offset_latitude: float = 0.0
+    offset_longitude: float = 0.0
+
+class RouteBulk(BaseModel):
+    ids: Optional[List[int]] = Field(None, max_length=10000)
+    filter: Optional[RouteFilter] = None
+    action: Literal["delete", "set_premium", "set_difficulty"]
+    is_premium: Optional[bool] = None
+    difficulty: Optional[str] = Field(None, max_length=20)
+
+class BulkResult(BaseModel):
+    action: str
+    affected: int
+    ids: List[int]
+    # Route links removed along with deleted rows
+    unlinked: int = 0
+    # Selected but left alone, e.g. routes users have progress on
+    skipped: List[int] = []
@@ -0,0 +1,16 @@
+from datetime import datetime
+from typing import List
+from pydantic import BaseModel
+
+class OfflinePack(BaseModel):
+    region: str
+    # Download from here; a SQLite file
+    url: str
+    # Catalog version the pack holds: continue with /sync?since=version
+    version: int
+    # [min longitude, min latitude, max longitude, max latitude]
+    bbox: List[float]
+    size: int
+    # Also the download's ETag
+    sha256: str
+    built_at: datetime
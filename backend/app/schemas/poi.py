@@ -1,6 +1,20 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, ConfigDict
 
+class ImageVariant(BaseModel):
+    url: str
+    width: int
+    height: int
+    format: str
+
+class Image(BaseModel):
+    # Derivatives of an uploaded image; empty until they have been generated.
+    url: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    blurhash: Optional[str] = None
+    variants: List[ImageVariant] = []
+
 class PointOfInterestBase(BaseModel):
     title: str
     description: Optional[str] = None
@@ -33,4 +47,6 @@ class PointOfInterestInDBBase(PointOfInterestBase):
     model_config = ConfigDict(from_attributes=True)
 
 class PointOfInterest(PointOfInterestInDBBase):
-    pass
+    # Set when the matching *_image_url is an upload
+    historic_image: Optional[Image] = None
+    modern_image: Optional[Image] = None
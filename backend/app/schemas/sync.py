@@ -0,0 +1,37 @@
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+from .poi import PointOfInterest
+
+class SyncRoute(BaseModel):
+    # Points come separately, as route_points
+    id: int
+    title: str
+    description: Optional[str] = None
+    difficulty: Optional[str] = None
+    reward_xp: Optional[float] = None
+    is_premium: Optional[bool] = None
+
+class RoutePoint(BaseModel):
+    route_id: int
+    poi_id: int
+    order: Optional[int] = None
+
+class SyncDeleted(BaseModel):
+    pois: List[int] = []
+    routes: List[int] = []
+    # (route_id, poi_id)
+    route_points: List[Tuple[int, int]] = []
+
+class CatalogChanges(BaseModel):
+    # Pass as `since` on the next call
+    version: int
+    # More changes are waiting; call again right away with `version`
+    more: bool = False
+    # `since` is unknown to this server (e.g. restored database): drop the
+    # local catalog and treat this as a sync from scratch
+    reset: bool = False
+    # Inserted or updated since `since`
+    pois: List[PointOfInterest] = []
+    routes: List[SyncRoute] = []
+    route_points: List[RoutePoint] = []
+    deleted: SyncDeleted = SyncDeleted()
@@ -9,3 +9,4 @@ class Token(BaseModel):
 
 class TokenPayload(BaseModel):
     sub: Optional[str] = None
+    ver: Optional[int] = None
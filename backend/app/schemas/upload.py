@@ -0,0 +1,25 @@
+from typing import Dict, Optional
+from pydantic import BaseModel, Field
+
+class UploadRequest(BaseModel):
+    # Client-computed; it is the object's name, so storage checks it.
+    sha256: str = Field(pattern=r"^[0-9a-f]{64}$")
+    size: int = Field(gt=0)
+    content_type: str
+
+class PresignedUpload(BaseModel):
+    # Where the image will be served from once completed
+    url: str
+    sha256: str
+    # None when the image is already stored: skip the PUT and complete.
+    upload_url: Optional[str] = None
+    method: str = "PUT"
+    # Send these unchanged with the PUT; they are covered by the signature.
+    headers: Dict[str, str] = {}
+    expires_in: Optional[int] = None
+
+class UploadResult(BaseModel):
+    url: str
+    sha256: str
+    size: int
+    deduplicated: bool
@@ -1,6 +1,6 @@
 from typing import Optional
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 
 
 # Shared properties
@@ -37,6 +37,14 @@ class User(UserInDBBase):
     xp: float = 0.0
 
 
+# Snapshot of the authenticated user, cached between requests by deps.get_current_user
+class UserPrincipal(User):
+    id: int
+    token_version: int = 0
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+
 # Additional properties stored in DB
 class UserInDB(UserInDBBase):
     hashed_password: str
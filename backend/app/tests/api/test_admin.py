@@ -25,15 +25,88 @@ async def override_superuser_dependency(client: AsyncClient):
     yield
     app.dependency_overrides = {}
 
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    # Keep uploaded test files out of the UPLOAD_DIR checked into the repo.
+    from app.core.storage import default_storage
+    monkeypatch.setattr(default_storage, "local_directory", str(tmp_path))
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
 @pytest.mark.asyncio
 async def test_file_upload(client: AsyncClient, override_superuser_dependency):
     # Prepare a file
-    files = {'file': ('test.txt', b'test content', 'text/plain')}
+    files = {'file': ('test.png', PNG_BYTES, 'image/png')}
     response = await client.post("/api/v1/files/upload", files=files)
     assert response.status_code == 200
     data = response.json()
     assert "url" in data
     assert data["url"].startswith("/static/")
+    assert data["url"].endswith(".png")
+    assert data["size"] == len(PNG_BYTES)
+
+@pytest.mark.asyncio
+async def test_file_upload_deduplicates(client: AsyncClient, override_superuser_dependency):
+    import uuid
+    content = b"\x89PNG\r\n\x1a\n" + uuid.uuid4().bytes
+    first = await client.post("/api/v1/files/upload", files={'file': ('a.png', content, 'image/png')})
+    second = await client.post("/api/v1/files/upload", files={'file': ('b.png', content, 'image/png')})
+    assert first.status_code == second.status_code == 200
+    assert first.json()["deduplicated"] is False
+    assert second.json()["deduplicated"] is True
+    assert second.json()["url"] == first.json()["url"]
+
+@pytest.mark.asyncio
+async def test_file_upload_rejects_non_images(client: AsyncClient, override_superuser_dependency):
+    # The declared type and name don't matter, only the bytes.
+    files = {'file': ('photo.png', b'test content', 'image/png')}
+    response = await client.post("/api/v1/files/upload", files=files)
+    assert response.status_code == 415
+
+@pytest.mark.asyncio
+async def test_file_upload_size_limit(client: AsyncClient, override_superuser_dependency, monkeypatch):
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "MAX_UPLOAD_BYTES", 32)
+    files = {'file': ('test.png', PNG_BYTES, 'image/png')}
+    response = await client.post("/api/v1/files/upload", files=files)
+    assert response.status_code == 413
+
+    # Far over the limit: refused from Content-Length, before the body is read.
+    files = {'file': ('big.png', PNG_BYTES + b"\x00" * 200_000, 'image/png')}
+    response = await client.post("/api/v1/files/upload", files=files)
+    assert response.status_code == 413
+
+@pytest.mark.asyncio
+async def test_direct_upload(client: AsyncClient, override_superuser_dependency):
+    import hashlib
+    import uuid
+    content = b"\x89PNG\r\n\x1a\n" + uuid.uuid4().bytes
+    meta = {"sha256": hashlib.sha256(content).hexdigest(), "size": len(content), "content_type": "image/png"}
+
+    # Nothing stored yet: completing fails, presigning hands out a PUT target.
+    response = await client.post("/api/v1/files/complete", json=meta)
+    assert response.status_code == 400
+    presigned = (await client.post("/api/v1/files/presign", json=meta)).json()
+    assert presigned["upload_url"]
+
+    # The token only accepts the announced bytes.
+    response = await client.put(presigned["upload_url"], content=content[:-1] + b"x", headers=presigned["headers"])
+    assert response.status_code == 400
+    response = await client.put(presigned["upload_url"], content=content, headers=presigned["headers"])
+    assert response.status_code == 204
+
+    response = await client.post("/api/v1/files/complete", json=meta)
+    assert response.status_code == 200
+    assert response.json()["url"] == presigned["url"]
+    assert response.json()["deduplicated"] is False
+    # Already stored: no upload URL the second time.
+    assert (await client.post("/api/v1/files/presign", json=meta)).json()["upload_url"] is None
+
+@pytest.mark.asyncio
+async def test_presign_rejects_unsupported_type(client: AsyncClient, override_superuser_dependency):
+    meta = {"sha256": "0" * 64, "size": 10, "content_type": "image/svg+xml"}
+    response = await client.post("/api/v1/files/presign", json=meta)
+    assert response.status_code == 415
 
 @pytest.mark.asyncio
 async def test_admin_list_users(client: AsyncClient, override_superuser_dependency):
@@ -70,3 +143,157 @@ async def test_admin_poi_lifecycle(client: AsyncClient, override_superuser_depen
     # Verify gone
     response = await client.get(f"/api/v1/pois/{poi_id}")
     assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_admin_poi_rows_paginate(client: AsyncClient, override_superuser_dependency):
+    import re
+    import uuid
+    tag = uuid.uuid4().hex[:8]
+    for i in range(5):
+        response = await client.post(
+            "/api/v1/pois/", json={"title": f"Rows {tag} {i}", "latitude": 55.0, "longitude": 37.0}
+        )
+        assert response.status_code == 200
+
+    seen = []
+    after = ""
+    while True:
+        response = await client.get(
+            "/admin/pois/rows", params={"q": tag, "sort": "title", "order": "desc", "limit": 2, "after": after}
+        )
+        assert response.status_code == 200
+        seen += re.findall(rf"Rows {tag} \d", response.text)
+        after = re.search(r'data-next="([^"]*)"', response.text).group(1)
+        if not after:
+            break
+    assert seen == [f"Rows {tag} {i}" for i in reversed(range(5))]
+
+@pytest.mark.asyncio
+async def test_admin_rows_reject_foreign_cursor(client: AsyncClient, override_superuser_dependency):
+    from app.web.pagination import encode_cursor
+    cursor = encode_cursor("title", False, ["a", 1])
+    response = await client.get("/admin/pois/rows", params={"sort": "id", "after": cursor})
+    assert response.status_code == 400
+    response = await client.get("/admin/routes/rows", params={"after": "not-a-cursor"})
+    assert response.status_code == 400
+
+@pytest.mark.parametrize(
+    "sort, values, valid",
+    [
+        ("id", [5], True),
+        ("id", ["5"], False),
+        ("id", [True], False),
+        ("id", [2 ** 40], False),
+        ("id", [{"a": 1}], False),
+        ("title", ["a", 1], True),
+        ("title", [1, 1], False),
+        ("title", [None, 1], False),
+        ("title", ["a\x00", 1], False),
+        ("reward_xp", [300, 1], True),
+        ("reward_xp", [300.5, 1], True),
+        ("reward_xp", ["300", 1], False),
+        ("difficulty", ["", 1], True),
+        ("difficulty", [[1], 1], False),
+    ],
+)
+def test_cursor_values_must_match_key_columns(sort, values, valid):
+    from sqlalchemy import func
+
+    from app import models
+    from app.web.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+    route = models.Route
+    key = {
+        "id": [route.id],
+        "title": [route.title, route.id],
+        "reward_xp": [func.coalesce(route.reward_xp, 0.0), route.id],
+        "difficulty": [func.coalesce(route.difficulty, ""), route.id],
+    }[sort]
+    cursor = encode_cursor(sort, False, values)
+    if valid:
+        assert decode_cursor(cursor, sort, False, key) == tuple(values)
+    else:
+        with pytest.raises(InvalidCursor):
+            decode_cursor(cursor, sort, False, key)
+
+@pytest.mark.asyncio
+async def test_admin_bulk_pois(client: AsyncClient, override_superuser_dependency):
+    import uuid
+    tag = uuid.uuid4().hex[:8]
+    ids = []
+    for i in range(3):
+        response = await client.post(
+            "/api/v1/pois/", json={"title": f"Bulk {tag} {i}", "latitude": 55.0, "longitude": 37.0}
+        )
+        ids.append(response.json()["id"])
+    response = await client.post("/api/v1/routes/", json={"title": f"Bulk {tag}", "poi_ids": ids[:2]})
+    route_id = response.json()["id"]
+
+    response = await client.post(
+        "/api/v1/pois/bulk", json={"action": "move", "ids": ids[:1], "offset_latitude": 1.0}
+    )
+    assert response.json()["affected"] == 1
+    assert (await client.get(f"/api/v1/pois/{ids[0]}")).json()["latitude"] == pytest.approx(56.0)
+
+    response = await client.post("/api/v1/pois/bulk", json={"action": "delete", "filter": {"q": f"Bulk {tag}"}})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["ids"] == sorted(ids)
+    assert data["unlinked"] == 2
+    assert (await client.get(f"/api/v1/routes/{route_id}")).json()["points"] == []
+
+    response = await client.post("/api/v1/pois/bulk", json={"action": "delete"})
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_admin_bulk_routes(client: AsyncClient, override_superuser_dependency, db):
+    import uuid
+    from app import models
+    tag = uuid.uuid4().hex[:8]
+    ids = []
+    for i in range(3):
+        response = await client.post("/api/v1/routes/", json={"title": f"Bulk {tag} {i}", "is_premium": i == 0})
+        ids.append(response.json()["id"])
+    db.add(models.UserProgress(route_id=ids[2]))
+    await db.commit()
+
+    selection = {"filter": {"q": tag}}
+    response = await client.post("/api/v1/routes/bulk", json={"action": "set_premium", "is_premium": True, **selection})
+    # The first one already was
+    assert response.json()["ids"] == ids[1:]
+    response = await client.post("/api/v1/routes/bulk", json={"action": "set_difficulty", **selection})
+    assert response.status_code == 400
+
+    response = await client.post("/api/v1/routes/bulk", json={"action": "delete", "ids": ids})
+    data = response.json()
+    assert data["affected"] == 2
+    assert data["ids"] == ids[:2]
+    assert data["skipped"] == [ids[2]]
+
+@pytest.mark.asyncio
+async def test_admin_route_lifecycle(client: AsyncClient, override_superuser_dependency):
+    poi_ids = []
+    for i in range(3):
+        response = await client.post(
+            "/api/v1/pois/", json={"title": f"Route stop {i}", "latitude": 55.0 + i, "longitude": 37.0}
+        )
+        poi_ids.append(response.json()["id"])
+
+    response = await client.post("/api/v1/routes/", json={"title": "Admin route", "poi_ids": poi_ids[:2]})
+    assert response.status_code == 200
+    route = response.json()
+    assert sorted(p["id"] for p in route["points"]) == poi_ids[:2]
+
+    response = await client.put(f"/api/v1/routes/{route['id']}", json={"difficulty": "hard"})
+    assert response.json()["difficulty"] == "hard"
+    assert len(response.json()["points"]) == 2
+
+    response = await client.put(f"/api/v1/routes/{route['id']}", json={"poi_ids": poi_ids[1:]})
+    assert sorted(p["id"] for p in response.json()["points"]) == poi_ids[1:]
+
+    response = await client.delete(f"/api/v1/routes/{route['id']}")
+    assert response.status_code == 200
+    assert response.json()["title"] == "Admin route"
+    assert sorted(p["id"] for p in response.json()["points"]) == poi_ids[1:]
+    response = await client.delete(f"/api/v1/routes/{route['id']}")
+    assert response.status_code == 404
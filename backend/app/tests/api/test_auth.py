@@ -35,3 +35,102 @@ async def test_login_access_token(client: AsyncClient):
     tokens = response.json()
     assert "access_token" in tokens
     assert tokens["token_type"] == "bearer"
+
+@pytest.mark.asyncio
+async def test_login_is_case_insensitive(client: AsyncClient):
+    uid = str(uuid.uuid4())
+    email = f"Case_{uid}@example.com"
+    username = f"Case_{uid}"
+    await client.post(
+        "/api/v1/register",
+        json={"email": email, "username": username, "password": "testpassword"},
+    )
+
+    for identity in (username.lower(), email.upper()):
+        response = await client.post(
+            "/api/v1/login/access-token",
+            data={"username": identity, "password": "testpassword"},
+        )
+        assert response.status_code == 200
+
+@pytest.mark.asyncio
+async def test_register_duplicate_ignores_case(client: AsyncClient):
+    uid = str(uuid.uuid4())
+    email = f"dup_{uid}@example.com"
+    username = f"dup_{uid}"
+    response = await client.post(
+        "/api/v1/register",
+        json={"email": email, "username": username, "password": "testpassword"},
+    )
+    assert response.status_code == 200
+
+    response = await client.post(
+        "/api/v1/register",
+        json={"email": email.upper(), "username": f"other_{uid}", "password": "testpassword"},
+    )
+    assert response.status_code == 400
+    assert "email" in response.json()["detail"]
+
+    response = await client.post(
+        "/api/v1/register",
+        json={"email": f"other_{uid}@example.com", "username": username.upper(), "password": "testpassword"},
+    )
+    assert response.status_code == 400
+    assert "username" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_login_flood_is_rejected_before_db(client: AsyncClient):
+    from app.api import deps
+
+    username = f"flood_{uuid.uuid4()}"
+    for _ in range(int(deps.login_account_limiter.burst)):
+        deps.login_account_limiter.hit(username)
+
+    response = await client.post(
+        "/api/v1/login/access-token",
+        data={"username": username, "password": "whatever"},
+    )
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+@pytest.mark.asyncio
+async def test_login_limiter_keys_on_forwarded_client(client: AsyncClient, monkeypatch):
+    from app.api import deps
+    from app.core.config import settings
+
+    # The test client connects from 127.0.0.1, standing in for nginx.
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", ["127.0.0.1"])
+    for _ in range(int(deps.login_ip_limiter.burst)):
+        deps.login_ip_limiter.hit("203.0.113.7")
+
+    response = await client.post(
+        "/api/v1/login/access-token",
+        data={"username": f"proxied_{uuid.uuid4()}", "password": "whatever"},
+        headers={"X-Forwarded-For": "198.51.100.1, 203.0.113.7"},
+    )
+    assert response.status_code == 429
+
+
+@pytest.mark.parametrize(
+    "peer, forwarded, expected",
+    [
+        # Not a trusted proxy: the header is the client's word and ignored.
+        ("198.51.100.9", "203.0.113.7", "198.51.100.9"),
+        ("10.0.0.2", "203.0.113.7", "203.0.113.7"),
+        # A client-supplied hop left of the real one doesn't count.
+        ("10.0.0.2", "1.2.3.4, 203.0.113.7", "203.0.113.7"),
+        # Proxies chained inside the trusted network are skipped.
+        ("10.0.0.2", "203.0.113.7, 10.0.0.3", "203.0.113.7"),
+        ("10.0.0.2", None, "10.0.0.2"),
+    ],
+)
+def test_client_address(peer, forwarded, expected, monkeypatch):
+    from starlette.requests import Request
+
+    from app.api import deps
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", ["10.0.0.0/8"])
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    request = Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+    assert deps.client_address(request) == expected
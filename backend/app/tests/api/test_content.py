@@ -1,4 +1,5 @@
 import pytest
+import re
 import uuid
 from httpx import AsyncClient
 
@@ -28,3 +29,63 @@ async def test_public_read_endpoints(client: AsyncClient):
     response = await client.get("/api/v1/routes/")
     assert response.status_code == 200
     assert isinstance(response.json(), list)
+
+@pytest.mark.asyncio
+async def test_read_releases_connection_before_serializing(client: AsyncClient, test_database, monkeypatch):
+    from sqlalchemy import delete
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from app import models
+    from app.api import deps
+    from app.api.v1.endpoints import pois
+    from app.core import middleware
+    from app.db.stats import RequestDBStats
+    from app.main import app
+
+    # Pooled sessions of their own: the shared test connection is never
+    # checked in, so it would show no hold time at all.
+    engine = await test_database.engine()
+    pool = engine.sync_engine.pool
+
+    async def read_db():
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+
+    seen = []
+
+    class RecordedStats(RequestDBStats):
+        __slots__ = ()
+
+        def __init__(self):
+            super().__init__()
+            seen.append(self)
+
+    checked_out = []
+    catalog_poi = pois.catalog_poi
+
+    def serialize(row):
+        checked_out.append(pool.checkedout())
+        return catalog_poi(row)
+
+    app.dependency_overrides[deps.get_read_db] = read_db
+    monkeypatch.setattr(middleware, "RequestDBStats", RecordedStats)
+    monkeypatch.setattr(pois, "catalog_poi", serialize)
+
+    async with AsyncSession(engine) as session:
+        poi = models.PointOfInterest(title=f"Hold {uuid.uuid4()}", location="POINT(37.6 55.7)")
+        session.add(poi)
+        await session.commit()
+        try:
+            idle = pool.checkedout()
+            response = await client.get("/api/v1/pois/")
+        finally:
+            await session.execute(delete(models.PointOfInterest).where(models.PointOfInterest.id == poi.id))
+            await session.commit()
+
+    assert response.status_code == 200
+    # The handler gave its connection back before building the response.
+    assert checked_out and set(checked_out) == {idle}
+    [stats] = seen
+    assert stats.connections == 1 and stats.hold_seconds > 0
+    hold_ms = re.search(r"db-conn;dur=([\d.]+)", response.headers["server-timing"]).group(1)
+    assert float(hold_ms) == pytest.approx(stats.hold_seconds * 1000, abs=0.1)
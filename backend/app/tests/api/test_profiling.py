@@ -0,0 +1,98 @@
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from app import schemas
+from app.api import deps
+from app.core import profiling
+from app.core.config import settings
+from app.core.middleware import ProfilingMiddleware
+
+
+def principal(is_superuser: bool) -> schemas.UserPrincipal:
+    return schemas.UserPrincipal(
+        id=1, email="admin@example.com", username="admin", is_superuser=is_superuser
+    )
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILE_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+async def client():
+    # PROFILING_ENABLED is off by default, so app.main has no middleware.
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware)
+
+    @app.get("/")
+    async def root():
+        return {"ok": True}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_superuser_request_is_profiled(client: AsyncClient, profile_dir, monkeypatch):
+    async def get_principal(db, token):
+        return principal(is_superuser=True)
+
+    monkeypatch.setattr(deps, "get_principal", get_principal)
+    response = await client.get("/?profile=1", headers={"Authorization": "Bearer x"})
+    assert response.status_code == 200
+    name = response.headers["X-Profile-Id"]
+    assert (profile_dir / name).exists()
+
+
+@pytest.mark.asyncio
+async def test_profile_flag_ignored_for_regular_users(client: AsyncClient, profile_dir, monkeypatch):
+    async def get_principal(db, token):
+        return principal(is_superuser=False)
+
+    monkeypatch.setattr(deps, "get_principal", get_principal)
+    response = await client.get("/", headers={"Authorization": "Bearer x", "X-Profile": "1"})
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert list(profile_dir.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_cprofile_request_conflicts(client: AsyncClient, profile_dir, monkeypatch):
+    async def get_principal(db, token):
+        return principal(is_superuser=True)
+
+    monkeypatch.setattr(deps, "get_principal", get_principal)
+    monkeypatch.setattr(profiling, "SamplingProfiler", None)
+    running = profiling.RequestProfiler()
+    running.start()
+    try:
+        response = await client.get("/?profile=1", headers={"Authorization": "Bearer x"})
+        assert response.status_code == 409
+        assert "X-Profile-Id" not in response.headers
+    finally:
+        running.stop()
+
+    response = await client.get("/?profile=1", headers={"Authorization": "Bearer x"})
+    assert response.status_code == 200
+    assert response.headers["X-Profile-Id"].endswith(".pstats")
+
+
+@pytest.mark.parametrize(
+    "query, headers, expected",
+    [
+        (b"profile=1", [], True),
+        (b"profile=TRUE", [], True),
+        (b"profile=0", [], False),
+        (b"", [(b"x-profile", b"yes")], True),
+        (b"", [(b"x-profile", b" 1")], True),
+        (b"", [(b"x-profile", b"0")], False),
+        (b"", [(b"x-profile", b"false")], False),
+        (b"", [(b"x-profile", b"")], False),
+        (b"", [], False),
+    ],
+)
+def test_profile_flag_must_be_truthy(query, headers, expected):
+    assert ProfilingMiddleware.requested({"query_string": query, "headers": headers}) is expected
@@ -4,18 +4,20 @@ from httpx import AsyncClient
 from app.core.config import settings
 
 @pytest.mark.asyncio
-async def test_leaderboard(client: AsyncClient):
+async def test_leaderboard(client: AsyncClient, db):
     # Leaderboard is public in our implementation
-    response = await client.get("/api/v1/users/leaderboard")
+    from app.models import User
+
+    # The test transaction is rolled back, so seeded rows never leak.
+    for xp in (10.0, 30.0, 20.0):
+        uid = uuid.uuid4().hex
+        db.add(User(email=f"lb_{uid}@example.com", username=f"lb_{uid}", hashed_password="x", xp=xp))
+    await db.commit()
+
+    response = await client.get("/api/v1/users/leaderboard?limit=3")
     assert response.status_code == 200
     data = response.json()
-    assert isinstance(data, list)
-    # If we had seeded data, we could check order. 
-    # Since DB is fresh per test function (due to our conftest), it might be empty or contain just created users.
-    # Let's create users via header/auth if possilbe, or we need a way to seed XP.
-    # Currently we can't easily set XP via API (it's internal).
-    # We can trust the SQL `order_by` for now or need a backdoor/fixture to seed users with XP.
-    # Given the constraints, a 200 OK and list response is a basic smoke test.
+    assert [u["xp"] for u in data] == [30.0, 20.0, 10.0]
 
 @pytest.mark.asyncio
 async def test_nearby_pois(client: AsyncClient):
@@ -33,3 +35,41 @@ async def test_nearby_pois(client: AsyncClient):
     assert response.status_code == 200
     data = response.json()
     assert isinstance(data, list)
+
+@pytest.mark.asyncio
+async def test_progress_lifecycle(client: AsyncClient, db):
+    from app.models import Route
+
+    route = Route(title="Progress route")
+    db.add(route)
+    await db.commit()
+
+    headers = {}
+    for name in ("owner", "other"):
+        uid = uuid.uuid4().hex
+        username = f"{name}_{uid}"
+        await client.post(
+            "/api/v1/register",
+            json={"email": f"{username}@example.com", "username": username, "password": "password"},
+        )
+        login_resp = await client.post(
+            "/api/v1/login/access-token", data={"username": username, "password": "password"}
+        )
+        headers[name] = {"Authorization": f"Bearer {login_resp.json()['access_token']}"}
+
+    progress_in = {"route_id": route.id, "status": "started"}
+    response = await client.post("/api/v1/progress/", headers=headers["owner"], json=progress_in)
+    assert response.status_code == 200
+    progress_id = response.json()["id"]
+    response = await client.post("/api/v1/progress/", headers=headers["owner"], json=progress_in)
+    assert response.status_code == 400
+
+    update = {"completed_points_count": 2}
+    response = await client.put(f"/api/v1/progress/{progress_id}", headers=headers["owner"], json=update)
+    assert response.status_code == 200
+    assert response.json()["completed_points_count"] == 2
+    assert response.json()["status"] == "started"
+    response = await client.put(f"/api/v1/progress/{progress_id}", headers=headers["other"], json=update)
+    assert response.status_code == 403
+    response = await client.put("/api/v1/progress/0", headers=headers["owner"], json=update)
+    assert response.status_code == 404
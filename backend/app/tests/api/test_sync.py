@@ -0,0 +1,82 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import delete, update
+
+from app import models
+
+
+@pytest.mark.asyncio
+async def test_sync_returns_changes_since_version(client: AsyncClient, db):
+    start = (await client.get("/api/v1/sync/", params={"since": 0, "limit": 1})).json()
+    # Rows may already exist; page through to the current version.
+    version = start["version"]
+    while True:
+        page = (await client.get("/api/v1/sync/", params={"since": version})).json()
+        version = page["version"]
+        if not page["more"]:
+            break
+
+    poi = models.PointOfInterest(title="Sync POI", location="POINT(37.6 55.7)")
+    route = models.Route(title="Sync route", points=[poi])
+    db.add(route)
+    await db.commit()
+
+    changes = (await client.get("/api/v1/sync/", params={"since": version})).json()
+    assert [p["id"] for p in changes["pois"]] == [poi.id]
+    assert changes["pois"][0]["latitude"] == pytest.approx(55.7)
+    assert [r["id"] for r in changes["routes"]] == [route.id]
+    assert [(rp["route_id"], rp["poi_id"]) for rp in changes["route_points"]] == [(route.id, poi.id)]
+    assert changes["version"] > version
+    version = changes["version"]
+
+    # Nothing new: an empty page at the same version.
+    changes = (await client.get("/api/v1/sync/", params={"since": version})).json()
+    assert changes["version"] == version
+    assert not changes["pois"] and not changes["routes"] and not changes["deleted"]["routes"]
+
+    await db.execute(update(models.PointOfInterest).where(models.PointOfInterest.id == poi.id).values(title="Renamed"))
+    await db.execute(delete(models.route_poi_association).where(models.route_poi_association.c.route_id == route.id))
+    await db.execute(delete(models.Route).where(models.Route.id == route.id))
+    await db.commit()
+
+    changes = (await client.get("/api/v1/sync/", params={"since": version})).json()
+    assert [p["title"] for p in changes["pois"]] == ["Renamed"]
+    assert changes["routes"] == []
+    assert changes["deleted"] == {"pois": [], "routes": [route.id], "route_points": [[route.id, poi.id]]}
+
+    # One change per page, with `more` until the last.
+    page = (await client.get("/api/v1/sync/", params={"since": version, "limit": 1})).json()
+    assert page["more"] and len(page["pois"]) + len(page["deleted"]["route_points"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_sync_resets_unknown_version(client: AsyncClient):
+    changes = (await client.get("/api/v1/sync/", params={"since": 10**15, "limit": 1})).json()
+    assert changes["reset"] is True
+
+
+@pytest.mark.asyncio
+async def test_sync_returns_poi_again_when_derivatives_finish(client: AsyncClient, db):
+    upload = models.Upload(sha256="d" * 64, size=1, content_type="image/jpeg", url="/static/uploads/dd/dd/sync.jpg")
+    poi = models.PointOfInterest(title="Sync image", location="POINT(37.6 55.7)", historic_image_url=upload.url)
+    db.add_all([upload, poi])
+    await db.commit()
+    version = (await client.get("/api/v1/sync/", params={"since": 0, "limit": 1})).json()["version"]
+    while True:
+        page = (await client.get("/api/v1/sync/", params={"since": version})).json()
+        version = page["version"]
+        if not page["more"]:
+            break
+
+    # What DerivativePipeline._run writes once the variants exist.
+    variant = {"url": "/static/uploads/dd/dd/sync-320.webp", "width": 320, "height": 240, "format": "webp"}
+    await db.execute(
+        update(models.Upload).where(models.Upload.id == upload.id)
+        .values(width=640, height=480, blurhash="LEHV6nWB", variants=[variant])
+    )
+    await db.commit()
+
+    changes = (await client.get("/api/v1/sync/", params={"since": version})).json()
+    assert [p["id"] for p in changes["pois"]] == [poi.id]
+    image = changes["pois"][0]["historic_image"]
+    assert image["blurhash"] == "LEHV6nWB" and image["variants"] == [variant]
@@ -57,3 +57,56 @@ async def test_update_user_me(client: AsyncClient):
     assert response.status_code == 200
     data = response.json()
     assert data["bio"] == new_bio
+
+@pytest.mark.asyncio
+async def test_password_change_revokes_old_token(client: AsyncClient):
+    import uuid
+    uid = str(uuid.uuid4())
+    username = f"pwd_{uid}"
+    await client.post(
+        "/api/v1/register",
+        json={"email": f"pwd_{uid}@example.com", "username": username, "password": "password"},
+    )
+    login_resp = await client.post(
+        "/api/v1/login/access-token",
+        data={"username": username, "password": "password"}
+    )
+    headers = {"Authorization": f"Bearer {login_resp.json()['access_token']}"}
+
+    response = await client.put("/api/v1/users/me", headers=headers, json={"password": "newpassword"})
+    assert response.status_code == 200
+
+    response = await client.get("/api/v1/users/me", headers=headers)
+    assert response.status_code == 403
+
+@pytest.mark.asyncio
+async def test_change_in_another_process_revokes_cached_principal(client: AsyncClient, db):
+    import uuid
+    from sqlalchemy import update
+    from app import models
+    from app.api import deps
+    uid = str(uuid.uuid4())
+    username = f"ext_{uid}"
+    await client.post(
+        "/api/v1/register",
+        json={"email": f"ext_{uid}@example.com", "username": username, "password": "password"},
+    )
+    login_resp = await client.post(
+        "/api/v1/login/access-token",
+        data={"username": username, "password": "password"}
+    )
+    headers = {"Authorization": f"Bearer {login_resp.json()['access_token']}"}
+    assert (await client.get("/api/v1/users/me", headers=headers)).status_code == 200
+
+    # Another worker bumps the version; this process's cache isn't told.
+    await db.execute(
+        update(models.User).where(models.User.username == username)
+        .values(token_version=models.User.token_version + 1)
+    )
+    await db.commit()
+    assert (await client.get("/api/v1/users/me", headers=headers)).status_code == 200
+
+    # Once the revalidation window has passed the token is rejected.
+    deps.principal_checked.clear()
+    response = await client.get("/api/v1/users/me", headers=headers)
+    assert response.status_code == 403
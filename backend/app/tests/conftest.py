@@ -1,34 +1,186 @@
-import asyncio
+"""
+Test database fixtures.
+
+Each pytest worker (pytest -n auto with pytest-xdist, or the single
+"master" process) gets its own database, cloned from a template that holds
+the schema. The template is rebuilt only when the models change, so
+starting a worker costs one CREATE DATABASE ... TEMPLATE.
+
+Every test runs inside one transaction on one connection that is rolled
+back at the end. The app's get_db/get_read_db overrides open a fresh
+session per request on that connection with
+join_transaction_mode="create_savepoint", so endpoint commits and
+rollbacks only touch a SAVEPOINT and nothing outlives the test. Requests
+within a test share the connection and must not run concurrently.
+
+The connection is opened on first use, so tests that never reach the
+database don't need PostgreSQL at all.
+"""
+import hashlib
+import os
+from typing import AsyncGenerator, Optional
+
 import pytest
-from typing import AsyncGenerator
 from httpx import AsyncClient, ASGITransport
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.schema import CreateIndex, CreateTable
+
 from app.main import app
 from app.core.config import settings
 from app.api import deps
+from app.db import sync
+from app.db.base import Base
+from app.db.stats import instrument_engine
+
+# Server to create the per-worker databases on; its database name is the prefix.
+TEST_DATABASE_URL = make_url(os.environ.get("TEST_DATABASE_URL", settings.DATABASE_URL))
+# Serializes template builds and clones across workers.
+TEMPLATE_LOCK_KEY = 0x63687263  # "chrc"
+
+
+def schema_fingerprint() -> str:
+    dialect = postgresql.dialect()
+    ddl = []
+    for table in Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+        ddl.extend(str(CreateIndex(index).compile(dialect=dialect)) for index in sorted(table.indexes, key=lambda i: i.name))
+    ddl.extend(sync.CATALOG_DDL)
+    return hashlib.sha1("\n".join(ddl).encode()).hexdigest()
+
+
+class TestDatabase:
+    """
+    This worker's database, created from the template on first use.
+    """
+
+    __test__ = False
+
+    def __init__(self, worker: str) -> None:
+        self.template = f"{TEST_DATABASE_URL.database}_test_template"
+        self.name = f"{TEST_DATABASE_URL.database}_test_{worker}"
+        self._engine: Optional[AsyncEngine] = None
+
+    def _admin_engine(self) -> AsyncEngine:
+        # CREATE/DROP DATABASE can't run in a transaction or while connected to the target.
+        return create_async_engine(
+            TEST_DATABASE_URL.set(database="postgres"), isolation_level="AUTOCOMMIT", poolclass=NullPool
+        )
+
+    async def _build_template(self) -> None:
+        engine = create_async_engine(TEST_DATABASE_URL.set(database=self.template), poolclass=NullPool)
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            await conn.run_sync(Base.metadata.create_all)
+        await engine.dispose()
 
-# Use existing DB for now
-TEST_DATABASE_URL = settings.DATABASE_URL
+    async def engine(self) -> AsyncEngine:
+        if self._engine is not None:
+            return self._engine
+        fingerprint = schema_fingerprint()
+        admin = self._admin_engine()
+        async with admin.connect() as conn:
+            await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": TEMPLATE_LOCK_KEY})
+            try:
+                current = await conn.scalar(
+                    text("SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = :name"),
+                    {"name": self.template},
+                )
+                if current != fingerprint:
+                    await conn.execute(text(f'DROP DATABASE IF EXISTS "{self.template}"'))
+                    await conn.execute(text(f'CREATE DATABASE "{self.template}"'))
+                    await self._build_template()
+                    await conn.execute(text(f"COMMENT ON DATABASE \"{self.template}\" IS '{fingerprint}'"))
+                await conn.execute(text(f'DROP DATABASE IF EXISTS "{self.name}" WITH (FORCE)'))
+                await conn.execute(text(f'CREATE DATABASE "{self.name}" TEMPLATE "{self.template}"'))
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": TEMPLATE_LOCK_KEY})
+        await admin.dispose()
+
+        self._engine = create_async_engine(TEST_DATABASE_URL.set(database=self.name), echo=False)
+        instrument_engine(self._engine)
+        return self._engine
+
+    async def drop(self) -> None:
+        if self._engine is None:
+            return
+        await self._engine.dispose()
+        admin = self._admin_engine()
+        async with admin.connect() as conn:
+            await conn.execute(text(f'DROP DATABASE IF EXISTS "{self.name}" WITH (FORCE)'))
+        await admin.dispose()
+
+
+class TestTransaction:
+    """
+    One connection and outer transaction per test, rolled back at teardown.
+    """
+
+    __test__ = False
+
+    def __init__(self, database: TestDatabase) -> None:
+        self.database = database
+        self.connection: Optional[AsyncConnection] = None
+
+    async def session(self) -> AsyncSession:
+        if self.connection is None:
+            engine = await self.database.engine()
+            self.connection = await engine.connect()
+            await self.connection.begin()
+        return AsyncSession(
+            bind=self.connection, join_transaction_mode="create_savepoint", expire_on_commit=False
+        )
+
+    async def rollback(self) -> None:
+        if self.connection is not None:
+            await self.connection.rollback()
+            await self.connection.close()
+            self.connection = None
+
+
+@pytest.fixture(scope="session")
+async def test_database() -> AsyncGenerator[TestDatabase, None]:
+    database = TestDatabase(os.environ.get("PYTEST_XDIST_WORKER", "master"))
+    yield database
+    await database.drop()
 
-# Removed manual event_loop fixture to let pytest-asyncio handle it, or strict function scope.
-# Session scope caused issues with loop mismatch.
 
 @pytest.fixture(scope="function")
-async def test_engine():
-    engine = create_async_engine(TEST_DATABASE_URL, echo=False)
-    yield engine
-    await engine.dispose()
+async def test_transaction(test_database) -> AsyncGenerator[TestTransaction, None]:
+    transaction = TestTransaction(test_database)
+    yield transaction
+    await transaction.rollback()
+
 
 @pytest.fixture(scope="function")
-async def client(test_engine) -> AsyncGenerator[AsyncClient, None]:
-    async_session_factory = sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+async def db(test_transaction) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Session inside the test transaction, for seeding and checking rows.
+    """
+    session = await test_transaction.session()
+    yield session
+    await session.close()
+
 
+@pytest.fixture(scope="function")
+async def client(test_transaction) -> AsyncGenerator[AsyncClient, None]:
     async def override_get_db():
-        async with async_session_factory() as session:
+        session = await test_transaction.session()
+        try:
             yield session
+        finally:
+            await session.close()
 
     app.dependency_overrides[deps.get_db] = override_get_db
+    app.dependency_overrides[deps.get_read_db] = override_get_db
+    deps.principal_cache.clear()
+    deps.principal_checked.clear()
+    deps.login_ip_limiter.clear()
+    deps.login_account_limiter.clear()
     async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as c:
         yield c
     app.dependency_overrides.clear()
@@ -0,0 +1,126 @@
+import gzip
+import json
+import zlib
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from app.core.compression import CODECS, CompressionMiddleware, compressed_body_cache, negotiate
+
+CATALOG = [{"id": i, "title": f"POI {i}", "description": "Historic building " * 5} for i in range(200)]
+
+
+async def catalog(request):
+    return JSONResponse(CATALOG, headers={"ETag": '"v1"'})
+
+
+async def small(request):
+    return JSONResponse({"ok": True})
+
+
+async def private(request):
+    return JSONResponse(CATALOG, headers={"Cache-Control": "private"})
+
+
+async def encoded(request):
+    return Response(gzip.compress(b"x" * 5000), media_type="text/plain", headers={"Content-Encoding": "gzip"})
+
+
+async def streamed(request):
+    async def lines():
+        for item in CATALOG:
+            yield json.dumps(item).encode() + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson+json")
+
+
+def make_client() -> AsyncClient:
+    app = Starlette(routes=[
+        Route("/catalog", catalog),
+        Route("/small", small),
+        Route("/private", private),
+        Route("/encoded", encoded),
+        Route("/streamed", streamed),
+    ])
+    return AsyncClient(
+        transport=ASGITransport(app=CompressionMiddleware(app, minimum_size=500)), base_url="http://test"
+    )
+
+
+def test_negotiate():
+    assert negotiate("gzip, deflate", ["zstd", "br", "gzip"]) == "gzip"
+    assert negotiate("gzip;q=0, identity", ["gzip"]) is None
+    assert negotiate(None, ["gzip"]) is None
+    if "br" in CODECS:
+        assert negotiate("gzip, br", ["zstd", "br", "gzip"]) == "br"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_compresses_and_caches_catalog():
+    compressed_body_cache.clear()
+    async with make_client() as client:
+        response = await client.get("/catalog", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.headers["etag"] == 'W/"v1"'
+        assert int(response.headers["content-length"]) * 4 < len(json.dumps(CATALOG))
+        assert response.json() == CATALOG
+
+        hits = compressed_body_cache.hits
+        again = await client.get("/catalog", headers={"Accept-Encoding": "gzip"})
+        assert compressed_body_cache.hits == hits + 1
+        assert again.json() == CATALOG
+
+        # Per-user answers are compressed but not kept.
+        size = len(compressed_body_cache)
+        assert (await client.get("/private", headers={"Accept-Encoding": "gzip"})).json() == CATALOG
+        assert (await client.get("/catalog", headers={"Accept-Encoding": "gzip", "Authorization": "x"})).json()
+        assert len(compressed_body_cache) == size
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_passes_through():
+    async with make_client() as client:
+        identity = await client.get("/catalog", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in identity.headers
+        assert identity.headers["vary"] == "Accept-Encoding"
+        assert identity.headers["etag"] == '"v1"'
+
+        small = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small.headers
+
+        encoded = await client.get("/encoded", headers={"Accept-Encoding": "gzip"})
+        assert encoded.content == b"x" * 5000
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_streams_with_a_flush_per_part():
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        # ASGI 2.4: StreamingResponse doesn't poll receive for a disconnect.
+        "type": "http", "asgi": {"spec_version": "2.4"}, "method": "GET", "path": "/", "query_string": b"",
+        "headers": [(b"accept-encoding", b"gzip")],
+    }
+    async def endpoint(scope, receive, send):
+        await (await streamed(None))(scope, receive, send)
+
+    await CompressionMiddleware(endpoint, minimum_size=500)(scope, receive, send)
+
+    headers = dict(sent[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip" and b"content-length" not in headers
+    bodies = [message["body"] for message in sent[1:]]
+    # Each part can be decoded as soon as it arrives.
+    first = zlib.decompressobj(31).decompress(bodies[0])
+    assert json.loads(first) == CATALOG[0]
+    lines = gzip.decompress(b"".join(bodies)).splitlines()
+    assert [json.loads(line) for line in lines] == CATALOG
@@ -0,0 +1,141 @@
+import asyncio
+import io
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.core.image_proxy import ImageProxy, ImageProxyError, is_allowed, proxied_image, select_variant
+from app.core.images import DerivativePipeline
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 500
+
+
+class Origin(BaseHTTPRequestHandler):
+    """
+    Stand-in for a remote image host. Paths map to `files`; every GET is
+    counted and answered slowly enough for concurrent misses to overlap.
+    """
+
+    files = {}
+    hits = {}
+
+    def do_GET(self):
+        type(self).hits[self.path] = type(self).hits.get(self.path, 0) + 1
+        body = self.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        time.sleep(0.05)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def origin():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Origin)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def make_proxy(tmp_path, **kwargs) -> ImageProxy:
+    options = {"max_bytes": 10_000, "allowed_hosts": ["127.0.0.1"], "max_fetches": 2}
+    options.update(kwargs)
+    return ImageProxy(str(tmp_path), **options)
+
+
+def test_is_allowed():
+    hosts = ["upload.wikimedia.org"]
+    assert is_allowed("https://upload.wikimedia.org/a.jpg", hosts)
+    assert not is_allowed("https://upload.wikimedia.org.evil.com/a.jpg", hosts)
+    assert not is_allowed("file:///etc/passwd", hosts)
+    assert not is_allowed("http://169.254.169.254/latest", hosts)
+
+
+def test_proxied_image_is_memoized():
+    url = "https://upload.wikimedia.org/wikipedia/commons/a/ab/Kremlin.jpg"
+    image = proxied_image(url)
+    assert image.url.startswith("/api/v1/images/proxy?url=https%3A")
+    assert proxied_image(url) is image
+    assert proxied_image("/static/ab/cd/kremlin.jpg") is None
+    assert proxied_image("https://example.com/a.jpg") is None
+    assert proxied_image(None) is None
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_concurrent_misses_share_one_fetch(tmp_path, origin):
+    Origin.files["/coalesce.png"] = PNG
+    proxy = make_proxy(tmp_path)
+    url = origin + "/coalesce.png"
+
+    entries = await asyncio.gather(*(proxy.get(url) for _ in range(5)))
+    assert Origin.hits["/coalesce.png"] == 1
+    assert len({entry.name for entry in entries}) == 1
+    with open(proxy.path(entries[0].name), "rb") as f:
+        assert f.read() == PNG
+
+    # Served from disk afterwards, also by a fresh instance (the index persists).
+    await proxy.close()
+    again = make_proxy(tmp_path)
+    assert (await again.get(url)).sha256 == entries[0].sha256
+    assert Origin.hits["/coalesce.png"] == 1
+    await again.close()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_evicts_least_recently_used(tmp_path, origin):
+    for name in ("a", "b", "c"):
+        Origin.files[f"/lru-{name}.png"] = PNG
+    proxy = make_proxy(tmp_path, max_bytes=len(PNG) * 2)
+
+    a = await proxy.get(origin + "/lru-a.png")
+    await proxy.get(origin + "/lru-b.png")
+    await proxy.get(origin + "/lru-c.png")
+    assert proxy.evicted == 1
+    assert not os.path.exists(proxy.path(a.name))
+    assert proxy.stats()["bytes"] == len(PNG) * 2
+    await proxy.close()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_rejections(tmp_path, origin):
+    Origin.files["/page.html"] = b"<html></html>"
+    proxy = make_proxy(tmp_path)
+    for url, status in (
+        (origin + "/page.html", 415),
+        (origin + "/missing.png", 404),
+        ("http://example.com/a.png", 403),
+    ):
+        with pytest.raises(ImageProxyError) as e:
+            await proxy.get(url)
+        assert e.value.status_code == status
+    await proxy.close()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_generates_derivatives(tmp_path, origin):
+    Image = pytest.importorskip("PIL.Image")
+    photo = io.BytesIO()
+    Image.new("RGB", (800, 400), (10, 120, 200)).save(photo, format="PNG")
+    Origin.files["/photo.png"] = photo.getvalue()
+    proxy = make_proxy(tmp_path, max_bytes=10_000_000, derivatives=DerivativePipeline(max_workers=1))
+
+    await proxy.get(origin + "/photo.png")
+    await proxy.drain()
+    entry = await proxy.get(origin + "/photo.png")
+    assert entry.variants
+    variant = select_variant(entry.variants, 200, ["webp"])
+    assert variant["format"] == "webp" and variant["width"] >= 200
+    assert os.path.exists(proxy.path(variant["name"]))
+    proxy.derivatives.shutdown()
+    await proxy.close()
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from app.core import images
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def make_photo(path, size=(1000, 600)):
+    photo = Image.new("RGB", size, (120, 80, 40))
+    exif = Image.Exif()
+    exif[0x010F] = "CameraMaker"  # Make
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees
+    photo.save(path, format="JPEG", exif=exif)
+
+
+def test_generate_derivatives(tmp_path):
+    name = "ab/cd/" + "ab" * 32 + ".jpg"
+    source = tmp_path / name
+    source.parent.mkdir(parents=True)
+    make_photo(source)
+
+    result = images.generate_derivatives(str(source), str(tmp_path), name, [160, 480, 2000], ["webp", "avif"])
+
+    # Orientation applied: the 1000x600 landscape is stored as a portrait.
+    assert (result["width"], result["height"]) == (600, 1000)
+    assert sorted({v["width"] for v in result["variants"]}) == [160, 480, 600]
+    assert {v["format"] for v in result["variants"]} == {"webp", "avif"}
+    for variant in result["variants"]:
+        path = tmp_path / variant["name"]
+        assert os.path.getsize(path) == variant["size"]
+        with Image.open(path) as derived:
+            assert derived.width == variant["width"]
+            assert not derived.getexif()
+    assert len(result["blurhash"]) == 28
+
+
+def test_blurhash_matches_reference_encoder():
+    # Expected values from the reference implementation (blurhash-python).
+    pixels = [(255, 0, 0)] * 16
+    assert images.encode_blurhash(pixels, 4, 4, 4, 3) == "L~TI:j|cfQ|c|c$5fQ$5fQfQfQfQ"
+
+
+def test_unwritable_format_is_skipped(tmp_path):
+    name = "ab/cd/" + "cd" * 32 + ".jpg"
+    source = tmp_path / name
+    source.parent.mkdir(parents=True)
+    make_photo(source)
+
+    # A format Pillow can't save costs only its own variants.
+    result = images.generate_derivatives(str(source), str(tmp_path), name, [160], ["nosuch", "webp"])
+    assert {v["format"] for v in result["variants"]} == {"webp"}
+    assert len(result["blurhash"]) == 28
+
+
+def test_pipeline_drops_formats_the_build_lacks(monkeypatch):
+    monkeypatch.setattr(images.settings, "IMAGE_VARIANT_FORMATS", ["webp", "avif", "jpeg"])
+    monkeypatch.setattr(images.features, "check_module", lambda feature: feature != "avif")
+    assert images.DerivativePipeline(max_workers=1).formats == ["webp", "jpeg"]
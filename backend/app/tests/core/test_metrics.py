@@ -0,0 +1,49 @@
+import pytest
+from httpx import AsyncClient
+
+from app.core.metrics import Counter, Histogram
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_latency_seconds", "Test.", ("route",), buckets=(0.1, 1.0), registry=[])
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(5, route="/a")
+    lines = list(histogram.samples())
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{route="/a"} 3' in lines
+
+
+def test_counter_labels_are_escaped():
+    counter = Counter("test_total", "Test.", ("route",), registry=[])
+    counter.inc(route='/a"b')
+    assert list(counter.samples()) == ['test_total{route="/a\\"b"} 1.0']
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_uses_route_templates(client: AsyncClient):
+    await client.get("/")
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{method="GET",route="/"}' in response.text
+    assert "db_pool_connections" in response.text
+
+
+@pytest.mark.asyncio
+async def test_metrics_need_allowed_network_or_token(client: AsyncClient, monkeypatch):
+    from app.core.config import settings
+
+    # The test client connects from 127.0.0.1.
+    monkeypatch.setattr(settings, "METRICS_ALLOWED_NETWORKS", ["10.0.0.0/8"])
+    monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+    assert (await client.get("/metrics")).status_code == 403
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+    assert (await client.get("/metrics", headers={"Authorization": "Bearer wrong"})).status_code == 403
+    response = await client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200 and "db_pool_connections" in response.text
+
+    monkeypatch.setattr(settings, "METRICS_ALLOWED_NETWORKS", ["127.0.0.0/8"])
+    assert (await client.get("/metrics")).status_code == 200
@@ -0,0 +1,201 @@
+import json
+import os
+import sqlite3
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from app.api.v1.endpoints import packs as packs_endpoint
+from app.core.config import settings
+from app.core.packs import PACK_FORMAT, PackBuilder, Thumbnail, read_manifest
+
+MOSCOW = [37.3, 55.5, 37.9, 56.0]
+SPB = [29.9, 59.7, 30.6, 60.1]
+
+
+def poi(id, lon, lat, image=None, variants=None):
+    if image and variants is None:
+        variants = [{"url": image + ".webp", "width": 320, "height": 240, "format": "webp"}]
+    return {
+        "id": id, "title": f"POI {id}", "description": None,
+        "latitude": lat, "longitude": lon,
+        "historic_image_url": image, "modern_image_url": None,
+        "historic_image": {"url": image, "variants": variants} if image else None, "modern_image": None,
+    }
+
+
+def route(id):
+    return {"id": id, "title": f"Route {id}", "description": None, "difficulty": "Easy",
+            "reward_xp": 100.0, "is_premium": False, "change_version": 0}
+
+
+def point(route_id, poi_id, order, version):
+    return {"route_id": route_id, "poi_id": poi_id, "order": order, "change_version": version}
+
+
+def tombstone(table, row_id, poi_id=None):
+    return {"table_name": table, "row_id": row_id, "poi_id": poi_id}
+
+
+async def fake_thumbnail(url, image):
+    # Like fetch_thumbnail: nothing until the derivatives exist.
+    if not image or not image["variants"]:
+        return None
+    return Thumbnail("image/webp", 160, 120, url.encode())
+
+
+def open_pack(builder, region):
+    entry = read_manifest(builder.directory)[region]
+    return sqlite3.connect(os.path.join(builder.directory, entry["file"])), entry
+
+
+@pytest.fixture
+def builder(tmp_path):
+    builder = PackBuilder(str(tmp_path), {"moscow": MOSCOW}, fetch_thumbnail=fake_thumbnail)
+    yield builder
+    builder.close()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_pack_holds_region_with_whole_routes(builder):
+    builder.apply([
+        (1, "poi", poi(1, 37.6, 55.75, "http://img/kremlin.jpg")),
+        (2, "poi", poi(2, 37.62, 55.76, "http://img/pending.jpg", variants=[])),
+        # Outside the box, but a stop on route 10
+        (3, "poi", poi(3, 39.0, 57.0)),
+        (4, "poi", poi(4, 30.3, 59.9)),
+        (5, "route", route(10)),
+        (6, "route", route(11)),
+        (7, "route_point", point(10, 2, 0, 7)),
+        (8, "route_point", point(10, 3, 1, 8)),
+        (9, "route_point", point(10, 1, 2, 9)),
+        (10, "route_point", point(11, 4, 0, 10)),
+    ])
+    assert await builder.fetch_thumbnails() == 1
+    assert builder.publish() == ["moscow"]
+
+    pack, entry = open_pack(builder, "moscow")
+    assert pack.execute("PRAGMA user_version").fetchone()[0] == PACK_FORMAT
+    assert dict(pack.execute("SELECT key, value FROM meta"))["version"] == "10"
+    assert [r[0] for r in pack.execute("SELECT id FROM poi ORDER BY id")] == [1, 2, 3]
+    assert [r[0] for r in pack.execute("SELECT id FROM route")] == [10]
+    stops = pack.execute('SELECT poi_id FROM route_point WHERE route_id = 10 ORDER BY "order"').fetchall()
+    assert [r[0] for r in stops] == [2, 3, 1]
+    assert pack.execute("SELECT url, data FROM thumbnail").fetchall() == [
+        ("http://img/kremlin.jpg", b"http://img/kremlin.jpg")
+    ]
+    image = json.loads(pack.execute("SELECT historic_image FROM poi WHERE id = 1").fetchone()[0])
+    assert image["url"] == "http://img/kremlin.jpg"
+    pack.close()
+    assert entry["size"] == os.path.getsize(os.path.join(builder.directory, entry["file"]))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_fetches_thumbnail_once_derivatives_finish(builder):
+    builder.apply([(1, "poi", poi(1, 37.6, 55.75, "http://img/pending.jpg", variants=[]))])
+    assert await builder.fetch_thumbnails() == 0
+    assert builder.missing_thumbnails() == [("http://img/pending.jpg", {"url": "http://img/pending.jpg", "variants": []})]
+
+    # The catalog re-stamps the POI when its upload gets variants.
+    builder.apply([(2, "poi", poi(1, 37.6, 55.75, "http://img/pending.jpg"))])
+    assert await builder.fetch_thumbnails() == 1
+    assert builder.missing_thumbnails() == []
+    builder.publish()
+    pack, _ = open_pack(builder, "moscow")
+    assert pack.execute("SELECT url FROM thumbnail").fetchall() == [("http://img/pending.jpg",)]
+    image = json.loads(pack.execute("SELECT historic_image FROM poi WHERE id = 1").fetchone()[0])
+    assert image["variants"][0]["format"] == "webp"
+    pack.close()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_rebuilds_only_on_change(builder):
+    builder.apply([(1, "poi", poi(1, 37.6, 55.75)), (2, "poi", poi(2, 37.61, 55.75))])
+    builder.publish()
+    first = read_manifest(builder.directory)["moscow"]
+
+    assert builder.apply([]) == 0
+    assert builder.publish() == []
+
+    builder.apply([(3, "tombstone", tombstone("point_of_interest", 2))])
+    assert builder.publish() == ["moscow"]
+    second = read_manifest(builder.directory)["moscow"]
+    assert second["version"] == 3 and second["previous"] == first["file"]
+    pack, _ = open_pack(builder, "moscow")
+    assert [r[0] for r in pack.execute("SELECT id FROM poi")] == [1]
+    pack.close()
+
+    # The file before the previous one is removed.
+    builder.apply([(4, "poi", poi(3, 37.62, 55.75))])
+    builder.publish()
+    assert not os.path.exists(os.path.join(builder.directory, first["file"]))
+    assert os.path.exists(os.path.join(builder.directory, second["file"]))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_rebuilds_only_touched_regions(tmp_path):
+    builder = PackBuilder(str(tmp_path), {"moscow": MOSCOW, "spb": SPB}, fetch_thumbnail=fake_thumbnail)
+    builder.apply([
+        (1, "poi", poi(1, 37.6, 55.75)),
+        (2, "poi", poi(2, 30.3, 59.9)),
+        (3, "poi", poi(3, 37.62, 55.76)),
+        (4, "poi", poi(4, 30.31, 59.91)),
+    ])
+    assert sorted(builder.publish()) == ["moscow", "spb"]
+
+    builder.apply([(5, "poi", dict(poi(1, 37.6, 55.75), title="Renamed"))])
+    assert builder.publish() == ["moscow"]
+
+    # Moving a POI changes the region it leaves and the one it enters.
+    builder.apply([(6, "poi", poi(3, 30.32, 59.92))])
+    assert sorted(builder.publish()) == ["moscow", "spb"]
+
+    # A route from Moscow to St Petersburg is in both packs, so a stop
+    # changing in one region rebuilds the other too.
+    builder.apply([(7, "route", route(10)), (8, "route_point", point(10, 1, 0, 8)), (9, "route_point", point(10, 2, 1, 9))])
+    assert sorted(builder.publish()) == ["moscow", "spb"]
+    builder.apply([(10, "poi", dict(poi(2, 30.3, 59.9), title="Renamed"))])
+    assert sorted(builder.publish()) == ["moscow", "spb"]
+    builder.apply([(11, "tombstone", tombstone("route", 10))])
+    assert sorted(builder.publish()) == ["moscow", "spb"]
+    builder.apply([(12, "tombstone", tombstone("point_of_interest", 4))])
+    assert builder.publish() == ["spb"]
+
+    # So does a thumbnail, once the POI's derivatives exist.
+    builder.apply([(13, "poi", poi(1, 37.6, 55.75, "http://img/kremlin.jpg"))])
+    builder.publish()
+    builder.store_thumbnails({"http://img/kremlin.jpg": Thumbnail("image/webp", 160, 120, b"x")})
+    assert builder.publish() == ["moscow"]
+    assert builder.publish() == []
+    builder.close()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_download_resumes_with_range(builder, monkeypatch):
+    builder.apply([(1, "poi", poi(1, 37.6, 55.75))])
+    builder.publish()
+    monkeypatch.setattr(settings, "OFFLINE_PACK_DIR", builder.directory)
+    app = FastAPI()
+    app.include_router(packs_endpoint.router, prefix="/packs")
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        listing = (await client.get("/packs/")).json()
+        assert [pack["region"] for pack in listing] == ["moscow"]
+
+        full = await client.get("/packs/moscow")
+        assert full.status_code == 200
+        etag = full.headers["etag"]
+        assert etag == f'"{listing[0]["sha256"]}"'
+        assert int(full.headers["content-length"]) == listing[0]["size"] == len(full.content)
+
+        rest = await client.get("/packs/moscow", headers={"Range": "bytes=100-", "If-Range": etag})
+        assert rest.status_code == 206
+        assert rest.content == full.content[100:]
+
+        # A stale If-Range gets the whole file.
+        stale = await client.get("/packs/moscow", headers={"Range": "bytes=100-", "If-Range": '"old"'})
+        assert stale.status_code == 200 and stale.content == full.content
+
+        assert (await client.get("/packs/moscow", headers={"If-None-Match": etag})).status_code == 304
+        assert (await client.get("/packs/paris")).status_code == 404
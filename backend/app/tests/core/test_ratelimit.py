@@ -0,0 +1,63 @@
+import sys
+import threading
+
+from app.core.ratelimit import TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_burst_then_rejects_with_retry_after():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate_per_minute=60, burst=3, clock=clock)
+    assert [limiter.hit("ip") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.hit("ip") == 1.0
+    assert limiter.hit("other") == 0.0
+
+    clock.now += 1.0
+    assert limiter.hit("ip") == 0.0
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_idle_buckets_are_evicted():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate_per_minute=60, burst=1, max_keys=2, clock=clock)
+    limiter.hit("a")
+    limiter.hit("b")
+    clock.now += 5
+    limiter.hit("c")
+    assert limiter.stats()["keys"] == 1
+    assert limiter.stats()["evicted"] == 2
+
+
+def test_zero_rate_disables_limiter():
+    limiter = TokenBucketLimiter(rate_per_minute=0, burst=0)
+    assert all(limiter.hit("ip") == 0.0 for _ in range(100))
+
+
+def test_concurrent_burst_allows_only_burst():
+    limiter = TokenBucketLimiter(rate_per_minute=60, burst=5, clock=lambda: 0.0)
+    start = threading.Barrier(8)
+
+    def hammer():
+        start.wait()
+        for _ in range(200):
+            limiter.hit("ip")
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert limiter.stats()["allowed"] == 5
+    assert limiter.stats()["rejected"] == 8 * 200 - 5
@@ -0,0 +1,22 @@
+import pytest
+from passlib.context import CryptContext
+
+from app.core import security
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_in_pool():
+    hashed = await security.hash_password("secret")
+    assert await security.verify_and_update_password("secret", hashed) == (True, None)
+    valid, new_hash = await security.verify_and_update_password("wrong", hashed)
+    assert not valid and new_hash is None
+    assert security.password_hasher.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_outdated_hash_is_rehashed():
+    weak = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4).hash("secret")
+    valid, new_hash = await security.verify_and_update_password("secret", weak)
+    assert valid
+    assert new_hash is not None
+    assert security.verify_password("secret", new_hash)
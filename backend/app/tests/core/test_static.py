@@ -0,0 +1,75 @@
+import gzip
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from app.core.static import IMMUTABLE_CACHE_CONTROL, CachedStaticFiles, accepted_encodings
+
+SHA = "ab" + "cd" + "0" * 60
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(100))
+
+
+def make_client(directory, **kwargs) -> AsyncClient:
+    app = Starlette(routes=[Mount("/static", CachedStaticFiles(directory=str(directory), **kwargs))])
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    shard = tmp_path / "ab" / "cd"
+    shard.mkdir(parents=True)
+    (shard / f"{SHA}.png").write_bytes(PNG)
+    (tmp_path / "legacy.png").write_bytes(PNG)
+    (tmp_path / "notes.txt").write_text("hello " * 100)
+    (tmp_path / "notes.txt.gz").write_bytes(gzip.compress(b"hello " * 100))
+    return tmp_path
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, br;q=0.5, zstd;q=0") == {"gzip", "br"}
+    assert accepted_encodings("*") >= {"br", "gzip"}
+    assert accepted_encodings(None) == frozenset()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_content_addressed_is_immutable(upload_dir):
+    async with make_client(upload_dir) as client:
+        response = await client.get(f"/static/ab/cd/{SHA}.png")
+        assert response.content == PNG
+        assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert response.headers["etag"] == f'"{SHA}.png"'
+
+        response = await client.get(f"/static/ab/cd/{SHA}.png", headers={"If-None-Match": f'"{SHA}.png"'})
+        assert response.status_code == 304
+
+        response = await client.get(f"/static/ab/cd/{SHA}.png", headers={"Range": "bytes=0-7"})
+        assert response.status_code == 206
+        assert response.content == PNG[:8]
+
+        legacy = await client.get("/static/legacy.png")
+        assert "immutable" not in legacy.headers["cache-control"]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_precompressed_sibling(upload_dir):
+    async with make_client(upload_dir) as client:
+        response = await client.get("/static/notes.txt", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-type"].startswith("text/plain")
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.text == "hello " * 100
+
+        response = await client.get("/static/notes.txt", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.headers["vary"] == "Accept-Encoding"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_accel_redirect(upload_dir):
+    async with make_client(upload_dir, accel_redirect="/_uploads") as client:
+        response = await client.get(f"/static/ab/cd/{SHA}.png")
+        assert response.headers["x-accel-redirect"] == f"/_uploads/ab/cd/{SHA}.png"
+        assert response.headers["content-type"] == "image/png"
+        assert response.content == b""
@@ -0,0 +1,62 @@
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+
+from app.core import uploads
+from app.core.storage import LocalStorage
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+
+def test_sniff_image_type():
+    assert uploads.sniff_image_type(PNG) == ("image/png", "png")
+    assert uploads.sniff_image_type(b"\xff\xd8\xff\xe0rest") == ("image/jpeg", "jpg")
+    assert uploads.sniff_image_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == ("image/webp", "webp")
+    assert uploads.sniff_image_type(b"<svg xmlns=...") is None
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_store_upload_is_content_addressed(tmp_path):
+    file = UploadFile(io.BytesIO(PNG), filename="x.txt")
+    info = await uploads.inspect_upload(file, max_bytes=1000, chunk_size=16)
+    sha = hashlib.sha256(PNG).hexdigest()
+    assert info.size == len(PNG)
+    assert info.name == f"{sha[:2]}/{sha[2:4]}/{sha}.png"
+
+    storage = LocalStorage(str(tmp_path))
+    assert await uploads.store_upload(file, info, storage) is True
+    with open(tmp_path / info.name, "rb") as f:
+        assert f.read() == PNG
+    # Same bytes again: nothing written.
+    again = UploadFile(io.BytesIO(PNG))
+    assert await uploads.store_upload(again, await uploads.inspect_upload(again), storage) is False
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_inspect_upload_over_limit(tmp_path):
+    with pytest.raises(uploads.UploadTooLarge):
+        await uploads.inspect_upload(UploadFile(io.BytesIO(PNG)), max_bytes=50, chunk_size=16)
+
+
+def test_sweep_orphans_keeps_indexed_and_recent_blobs(tmp_path):
+    from app.gc_uploads import sweep_orphans
+
+    shard = tmp_path / "ab" / "cd"
+    shard.mkdir(parents=True)
+    known, orphan, fresh = "ab" + "1" * 62, "ab" + "2" * 62, "ab" + "3" * 62
+    for sha in (known, orphan, fresh):
+        (shard / f"{sha}.png").write_bytes(PNG)
+    (shard / f"{uploads.TEMP_PREFIX}xyz").write_bytes(b"partial")
+    (shard / orphan).mkdir()  # its derivatives
+    (shard / orphan / "w160.webp").write_bytes(b"webp")
+    (tmp_path / "legacy.png").write_bytes(PNG)
+    old = os.path.getmtime(shard / f"{fresh}.png") - 7200
+    for name in (f"{known}.png", f"{orphan}.png", f"{uploads.TEMP_PREFIX}xyz", orphan):
+        os.utime(shard / name, (old, old))
+
+    assert sweep_orphans(str(tmp_path), {known}, grace=3600, dry_run=False) == 3
+    assert sorted(os.listdir(shard)) == sorted([f"{known}.png", f"{fresh}.png"])
+    assert (tmp_path / "legacy.png").exists()
@@ -0,0 +1,28 @@
+import argparse
+
+from app.generate_data import GENERATORS, Plan, chunk_count
+
+OFFSETS = {"point_of_interest": 0, "route": 0, "user": 0, "user_progress": 0}
+
+
+def generate(**sizes):
+    args = argparse.Namespace(seed=42, chunk_size=10, **{"pois": 30, "routes": 5, "users": 8, "progress": 20, **sizes})
+    plan = Plan(args, OFFSETS, "hash")
+    return {
+        table: [row for chunk in range(chunk_count(plan, table)) for row in generate_rows(plan, chunk)]
+        for table, generate_rows in GENERATORS.items()
+    }
+
+
+def test_routes_link_only_existing_pois():
+    rows = generate()
+    poi_ids = {row[0] for row in rows["point_of_interest"]}
+    assert rows["route_poi"] and {row[1] for row in rows["route_poi"]} <= poi_ids
+
+
+def test_empty_tables_generate_nothing():
+    rows = generate(pois=0)
+    assert len(rows["route"]) == 5 and rows["route_poi"] == []
+
+    rows = generate(routes=0)
+    assert rows["route_poi"] == [] and rows["user_progress"] == []
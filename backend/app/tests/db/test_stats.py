@@ -0,0 +1,9 @@
+from app.db.stats import RequestDBStats
+
+
+def test_repeated_statements_flag_n_plus_one():
+    stats = RequestDBStats()
+    stats.statements["SELECT * FROM route"] += 1
+    for _ in range(6):
+        stats.statements["SELECT * FROM route_poi WHERE route_id = $1"] += 1
+    assert stats.repeated_statements(5) == [("SELECT * FROM route_poi WHERE route_id = $1", 6)]
@@ -0,0 +1,36 @@
+import argparse
+import json
+
+from benchmarks import micro
+
+ROUTE = "schema.route_12_points"
+
+
+def run(baseline, slowdown, monkeypatch):
+    """
+    `python -m benchmarks.micro -k route_12` against `baseline`, with
+    measurements `slowdown` times the baseline's (no real timing).
+    """
+    def measure(func, repeats, min_time):
+        return {"min": 2e-4 * slowdown, "median": 2e-4 * slowdown, "relative": 1.5 * slowdown, "iterations": 1}
+
+    monkeypatch.setattr(micro, "measure", measure)
+    args = argparse.Namespace(k="route_12", save=False, baseline=baseline, threshold=0.2, repeats=1, min_time=0)
+    return micro.main(args)
+
+
+def test_thirty_percent_slowdown_fails(tmp_path, monkeypatch):
+    baseline = tmp_path / "micro.json"
+    # A noisy baseline: the spread must not widen the margin past 30%.
+    entry = {"relative": 1.5, "min": 2e-4, "spread": 0.4, "runs": 7, "iterations": 1}
+    baseline.write_text(json.dumps({"results": {ROUTE: entry}}))
+
+    assert run(str(baseline), 1.1, monkeypatch) == 0
+    assert run(str(baseline), 1.3, monkeypatch) == 1
+
+
+def test_stored_baseline_allows_less_than_thirty_percent():
+    results = micro.load_baseline(micro.BASELINE_PATH)["results"]
+    assert set(results) == set(micro.BENCHMARKS)
+    for name, base in results.items():
+        assert micro.allowed_slowdown(base, threshold=0.2) < 0.3, name
@@ -0,0 +1,171 @@
+"""
+Query plan regression suite.
+
+Every scenario drives one endpoint against the seeded database, records
+the statements it sends and runs EXPLAIN (ANALYZE, FORMAT JSON) on each.
+Requests and EXPLAINs share one transaction that is rolled back after the
+scenario, so writes don't change the seeded rows. A plan fails when it sequentially scans
+a large table or its estimated cost exceeds MAX_PLAN_COST.
+"""
+import json
+from typing import Any, Dict, Iterator, List
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.db.base import Base
+from app.web.pagination import encode_cursor
+from app.tests.perf.conftest import SEED_PASSWORD, SEED_ROWS
+
+MAX_PLAN_COST = 5_000
+LARGE_TABLES = {name for name, rows in SEED_ROWS.items() if rows >= 10_000} | {"route_poi"}
+
+# Endpoints whose job is to return a whole table; a scan is the right plan.
+FULL_SCAN_ALLOWED = {
+    "read_pois": "returns the whole POI catalog",
+    "read_routes": "returns the whole route catalog",
+}
+
+
+def auth(ids: dict) -> dict:
+    return {"Authorization": f"Bearer {ids['token']}"}
+
+
+SCENARIOS = {
+    "read_pois": lambda c, ids: c.get("/api/v1/pois/"),
+    "read_poi": lambda c, ids: c.get(f"/api/v1/pois/{ids['poi']}"),
+    "read_routes": lambda c, ids: c.get("/api/v1/routes/"),
+    "read_route": lambda c, ids: c.get(f"/api/v1/routes/{ids['route']}"),
+    "read_leaderboard": lambda c, ids: c.get("/api/v1/users/leaderboard"),
+    "read_user_me": lambda c, ids: c.get("/api/v1/users/me", headers=auth(ids)),
+    "login": lambda c, ids: c.post(
+        "/api/v1/login/access-token",
+        data={"username": ids["username"].upper(), "password": SEED_PASSWORD},
+    ),
+    "read_user_progress": lambda c, ids: c.get("/api/v1/progress/", headers=auth(ids)),
+    "create_progress": lambda c, ids: c.post(
+        "/api/v1/progress/",
+        headers=auth(ids),
+        json={"route_id": ids["max_route"], "status": "started"},
+    ),
+    "update_progress": lambda c, ids: c.put(
+        f"/api/v1/progress/{ids['progress']}",
+        headers=auth(ids),
+        json={"completed_points_count": 3},
+    ),
+    "update_poi": lambda c, ids: c.put(
+        f"/api/v1/pois/{ids['poi']}", headers=auth(ids), json={"title": "renamed"}
+    ),
+    "update_route": lambda c, ids: c.put(
+        f"/api/v1/routes/{ids['route']}", headers=auth(ids), json={"title": "renamed"}
+    ),
+    "delete_poi": lambda c, ids: c.delete(f"/api/v1/pois/{ids['unrouted_poi']}", headers=auth(ids)),
+    "sync_first_page": lambda c, ids: c.get("/api/v1/sync/"),
+    "sync_delta": lambda c, ids: c.get(f"/api/v1/sync/?since={ids['sync_version']}"),
+    "admin_poi_rows": lambda c, ids: c.get("/admin/pois/rows?sort=title", headers=auth(ids)),
+    "admin_poi_rows_deep": lambda c, ids: c.get(
+        "/admin/pois/rows",
+        headers=auth(ids),
+        params={"sort": "id", "order": "desc", "after": encode_cursor("id", True, [ids["poi"]])},
+    ),
+    "admin_route_rows": lambda c, ids: c.get("/admin/routes/rows?sort=title", headers=auth(ids)),
+}
+
+# Writes build their response from RETURNING: one statement each.
+WRITE_SCENARIOS = ["create_progress", "update_progress", "update_poi", "update_route", "delete_poi"]
+
+
+def walk(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from walk(child)
+
+
+async def explain(conn: AsyncConnection, statement: str, parameters: tuple) -> Dict[str, Any]:
+    savepoint = await conn.begin_nested()
+    try:
+        result = await conn.exec_driver_sql(
+            "EXPLAIN (ANALYZE, FORMAT JSON) " + statement, parameters
+        )
+        output = result.scalar()
+    finally:
+        await savepoint.rollback()
+    if isinstance(output, str):
+        output = json.loads(output)
+    return output[0]["Plan"]
+
+
+def plan_problems(plan: Dict[str, Any], allow_full_scan: bool) -> List[str]:
+    if allow_full_scan:
+        return []
+    problems = []
+    if plan["Total Cost"] > MAX_PLAN_COST:
+        problems.append(f"estimated cost {plan['Total Cost']:.0f} > {MAX_PLAN_COST}")
+    for node in walk(plan):
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES:
+            problems.append(f"sequential scan on {node['Relation Name']}")
+    return problems
+
+
+@pytest.mark.plans
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("scenario", list(SCENARIOS))
+async def test_endpoint_query_plans(plan_client, plan_conn, plan_ids, scenario):
+    client, recorder = plan_client
+    recorder.statements.clear()
+    recorder.enabled = True
+    try:
+        response = await SCENARIOS[scenario](client, plan_ids)
+    finally:
+        recorder.enabled = False
+    assert response.status_code < 400, response.text
+    assert recorder.statements, "scenario issued no SQL"
+
+    failures = []
+    for statement, parameters in recorder.statements:
+        plan = await explain(plan_conn, statement, parameters)
+        for problem in plan_problems(plan, scenario in FULL_SCAN_ALLOWED):
+            failures.append(f"{problem}: {' '.join(statement.split())[:300]}")
+    assert not failures, "\n".join(failures)
+
+
+@pytest.mark.plans
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("scenario", WRITE_SCENARIOS)
+async def test_write_is_one_statement(plan_client, plan_conn, plan_ids, scenario):
+    client, recorder = plan_client
+    # Authenticate outside the recording; the principal is cached after.
+    await client.get("/api/v1/users/me", headers=auth(plan_ids))
+    recorder.statements.clear()
+    recorder.enabled = True
+    try:
+        response = await SCENARIOS[scenario](client, plan_ids)
+    finally:
+        recorder.enabled = False
+    assert response.status_code == 200, response.text
+    assert len(recorder.statements) == 1, [" ".join(s.split())[:200] for s, _ in recorder.statements]
+
+
+@pytest.mark.plans
+@pytest.mark.asyncio(loop_scope="session")
+async def test_viewport_lookup_uses_gist_index(plan_conn):
+    plan = await explain(
+        plan_conn,
+        "SELECT id FROM point_of_interest "
+        "WHERE location && ST_MakeEnvelope(37.60, 55.74, 37.64, 55.76, 4326)",
+        (),
+    )
+    assert "idx_point_of_interest_location" in json.dumps(plan)
+    assert not plan_problems(plan, allow_full_scan=False)
+
+
+def test_foreign_keys_are_indexed():
+    # Unindexed FK columns turn parent deletes into scans of the child table.
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        leading = {index.columns.values()[0].name for index in table.indexes}
+        leading.add(table.primary_key.columns.values()[0].name)
+        for fk in table.foreign_keys:
+            if fk.parent.name not in leading:
+                missing.append(f"{table.name}.{fk.parent.name}")
+    assert not missing
@@ -1,42 +1,170 @@
-from fastapi import APIRouter, Request
+import os
+from typing import Literal, Optional
+
+import jinja2
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models, schemas
+from app.api import deps
+from app.api.v1.endpoints.pois import poi_filters
+from app.api.v1.endpoints.routes import route_filters
+from app.core.config import settings
+from app.models.route import route_poi_association
+from app.web import pagination
 
-# Adjust path relative to where app runs usually (root of backend)
-templates = Jinja2Templates(directory="app/templates")
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+
+# Templates are compiled once per process, at import, and never re-checked
+# on disk unless ADMIN_TEMPLATES_AUTO_RELOAD is set for development. The
+# bytecode cache (a per-user temp dir by default) lets a restarted worker
+# skip the Jinja compile step too.
+environment = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+    autoescape=True,
+    auto_reload=settings.ADMIN_TEMPLATES_AUTO_RELOAD,
+    cache_size=-1,
+    bytecode_cache=jinja2.FileSystemBytecodeCache(settings.ADMIN_TEMPLATE_CACHE_DIR),
+)
+templates = Jinja2Templates(env=environment)
+for _name in environment.list_templates():
+    environment.get_template(_name)
 
 router = APIRouter()
 
+PAGE_SIZE = Query(50, ge=1, le=200)
+
+
+def render_page(request: Request, template: str, page: pagination.Page, **context) -> HTMLResponse:
+    return templates.TemplateResponse(
+        request, template, {"rows": page.rows, "next_cursor": page.next_cursor, **context}
+    )
+
+
 @router.get("/login", response_class=HTMLResponse)
 async def login(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return templates.TemplateResponse(request, "login.html")
 
 @router.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return templates.TemplateResponse(request, "dashboard.html")
 
 # POIs
 @router.get("/pois", response_class=HTMLResponse)
 async def list_pois(request: Request):
-    return templates.TemplateResponse("pois.html", {"request": request})
+    return templates.TemplateResponse(request, "pois.html")
+
+@router.get("/pois/rows", response_class=HTMLResponse)
+async def poi_rows(
+    request: Request,
+    q: Optional[str] = Query(None, max_length=200),
+    sort: Literal["id", "title"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    images: Literal["any", "with", "without"] = "any",
+    after: Optional[str] = None,
+    limit: int = PAGE_SIZE,
+    db: AsyncSession = Depends(deps.get_read_db),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
+):
+    """
+    One page of the POI table as an HTML fragment, fetched by pois.html
+    with the admin's bearer token.
+    """
+    poi = models.PointOfInterest
+    query = select(
+        poi.id,
+        poi.title,
+        func.ST_Y(poi.location).label("latitude"),
+        func.ST_X(poi.location).label("longitude"),
+        poi.historic_image_url,
+        poi.modern_image_url,
+    )
+    query = query.where(*poi_filters(q, images))
+
+    key = [poi.id] if sort == "id" else [poi.title, poi.id]
+    try:
+        query = pagination.keyset(query, key, sort, order == "desc", after, limit)
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = (await db.execute(query)).all()
+    await deps.release_connection(db)
+
+    names = ["id"] if sort == "id" else ["title", "id"]
+    return render_page(request, "_poi_rows.html", pagination.page(rows, names, sort, order == "desc", limit))
 
 @router.get("/pois/new", response_class=HTMLResponse)
 async def create_poi(request: Request):
-    return templates.TemplateResponse("poi_form.html", {"request": request})
+    return templates.TemplateResponse(request, "poi_form.html")
 
 @router.get("/pois/{poi_id}", response_class=HTMLResponse)
 async def edit_poi(request: Request, poi_id: int):
-    return templates.TemplateResponse("poi_form.html", {"request": request})
+    return templates.TemplateResponse(request, "poi_form.html")
 
 # Routes
 @router.get("/routes", response_class=HTMLResponse)
 async def list_routes(request: Request):
-    return templates.TemplateResponse("routes.html", {"request": request})
+    return templates.TemplateResponse(request, "routes.html")
+
+@router.get("/routes/rows", response_class=HTMLResponse)
+async def route_rows(
+    request: Request,
+    q: Optional[str] = Query(None, max_length=200),
+    sort: Literal["id", "title", "difficulty", "reward_xp"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    difficulty: Optional[str] = Query(None, max_length=20),
+    premium: Literal["any", "yes", "no"] = "any",
+    after: Optional[str] = None,
+    limit: int = PAGE_SIZE,
+    db: AsyncSession = Depends(deps.get_read_db),
+    current_user: schemas.UserPrincipal = Depends(deps.get_current_active_superuser),
+):
+    """
+    One page of the route table as an HTML fragment, fetched by routes.html.
+    """
+    route = models.Route
+    # Per-row count over the route_poi primary key: bounded by the page size.
+    point_count = (
+        select(func.count()).where(route_poi_association.c.route_id == route.id).correlate(route).scalar_subquery()
+    )
+    query = select(
+        route.id, route.title, route.difficulty, route.reward_xp, route.is_premium,
+        point_count.label("point_count"),
+    )
+    query = query.where(*route_filters(q, difficulty, premium))
+
+    # Nullable columns sort through coalesce: NULL would drop out of the
+    # row comparison and end the listing early.
+    sort_value = {
+        "id": None,
+        "title": route.title,
+        "difficulty": func.coalesce(route.difficulty, ""),
+        "reward_xp": func.coalesce(route.reward_xp, 0.0),
+    }[sort]
+    if sort_value is not None:
+        query = query.add_columns(sort_value.label("sort_value"))
+    key = [route.id] if sort_value is None else [sort_value, route.id]
+    try:
+        query = pagination.keyset(query, key, sort, order == "desc", after, limit)
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = (await db.execute(query)).all()
+    await deps.release_connection(db)
+
+    names = ["id"] if sort_value is None else ["sort_value", "id"]
+    return render_page(request, "_route_rows.html", pagination.page(rows, names, sort, order == "desc", limit))
 
 @router.get("/routes/new", response_class=HTMLResponse)
 async def create_route(request: Request):
-    return templates.TemplateResponse("route_form.html", {"request": request})
+    return templates.TemplateResponse(request, "route_form.html")
 
 @router.get("/routes/{route_id}", response_class=HTMLResponse)
 async def edit_route(request: Request, route_id: int):
-    return templates.TemplateResponse("route_form.html", {"request": request})
+    return templates.TemplateResponse(request, "route_form.html")
+
+# Request profiles
+@router.get("/profiles", response_class=HTMLResponse)
+async def list_profiles(request: Request):
+    return templates.TemplateResponse(request, "profiles.html")
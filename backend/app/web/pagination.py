@@ -0,0 +1,107 @@
+"""
+Keyset pagination for the admin lists.
+
+A page continues strictly after the last row of the previous one on the
+sort key (with the id as tiebreaker). Each page is then one index range
+scan however deep the admin pages; OFFSET would read and discard every
+row before it. The position travels as an opaque cursor that also records
+the sort it belongs to.
+"""
+import base64
+import json
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import BigInteger, Select, tuple_
+from sqlalchemy.sql.elements import ColumnElement
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Page(NamedTuple):
+    rows: List[Any]
+    # None on the last page
+    next_cursor: Optional[str]
+
+
+def encode_cursor(sort: str, descending: bool, values: Sequence[Any]) -> str:
+    raw = json.dumps([sort, descending, list(values)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _fits(value: Any, column: ColumnElement) -> bool:
+    # Cursors come from the client: a value the column can't be compared
+    # with would fail in the database instead of as a 400.
+    try:
+        expected = column.type.python_type
+    except NotImplementedError:
+        return value is not None
+    if isinstance(value, bool) or value is None:
+        return False
+    if expected is int:
+        bits = 63 if isinstance(column.type, BigInteger) else 31
+        return isinstance(value, int) and -(2 ** bits) <= value < 2 ** bits
+    if expected is float:
+        return isinstance(value, (int, float))
+    if expected is str:
+        return isinstance(value, str) and "\x00" not in value
+    return isinstance(value, expected)
+
+
+def decode_cursor(cursor: str, sort: str, descending: bool, key: Sequence[ColumnElement]) -> Tuple[Any, ...]:
+    """
+    The key values a cursor continues after, checked against `key`.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, cursor_descending, values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if (cursor_sort, cursor_descending) != (sort, descending):
+        raise InvalidCursor("Cursor belongs to a different sort order")
+    if not isinstance(values, list) or len(values) != len(key):
+        raise InvalidCursor("Malformed cursor")
+    if not all(_fits(value, column) for value, column in zip(values, key)):
+        raise InvalidCursor("Malformed cursor")
+    return tuple(values)
+
+
+def keyset(
+    query: Select,
+    key: Sequence[ColumnElement],
+    sort: str,
+    descending: bool,
+    cursor: Optional[str],
+    limit: int,
+) -> Select:
+    """
+    Order `query` by `key` and start after `cursor`. Fetches one row more
+    than `limit` so the caller can tell whether there is a next page.
+    """
+    if cursor:
+        after = decode_cursor(cursor, sort, descending, key)
+        position = tuple_(*key)
+        query = query.where(position < tuple_(*after) if descending else position > tuple_(*after))
+    order = [column.desc() for column in key] if descending else list(key)
+    return query.order_by(*order).limit(limit + 1)
+
+
+def page(rows: Sequence[Any], key_names: Sequence[str], sort: str, descending: bool, limit: int) -> Page:
+    """
+    Trim the extra row fetched by `keyset` and build the next cursor.
+    """
+    rows = list(rows)
+    if len(rows) <= limit:
+        return Page(rows, None)
+    last = rows[limit - 1]
+    return Page(rows[:limit], encode_cursor(sort, descending, [getattr(last, name) for name in key_names]))
+
+
+def contains(column: ColumnElement, text: str) -> ColumnElement:
+    """
+    Case-insensitive substring match, with LIKE wildcards in `text` escaped.
+    Served by the trigram indexes on the title columns.
+    """
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
@@ -0,0 +1,410 @@
+"""
+End-to-end load test with a weighted traffic mix.
+
+Each virtual user loops over scenarios picked by weight, with a short
+think time between them:
+
+    catalog      anonymous route/POI reads (detail pages mostly, some lists)
+    login        password login with the user's own credentials
+    checkin      progress update on the user's current route
+    leaderboard  leaderboard poll
+    admin        superuser POI create + delete
+
+Pool saturation is sampled from /metrics (db_pool_connections), so it works
+the same in-process and against a running server (pass --metrics-token
+unless the server allows this machine in METRICS_ALLOWED_NETWORKS):
+
+    python -m benchmarks.loadtest --users 50 --duration 60
+    python -m benchmarks.loadtest --base-url http://localhost:8000 \
+        --mix catalog=70,login=2,checkin=15,leaderboard=10,admin=3 --output run.json
+    python -m benchmarks.loadtest --compare baseline.json run.json
+
+In-process runs disable the login rate limiters; against a server, login
+429s are reported as such rather than as errors.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from httpx import AsyncClient, Response
+
+from benchmarks.common import summarize
+
+API = "/api/v1"
+DEFAULT_MIX = "catalog=60,login=5,checkin=15,leaderboard=15,admin=5"
+POOL_SAMPLE_RE = re.compile(r'^db_pool_connections\{engine="(\w+)",state="(\w+)"\} (\S+)$', re.M)
+
+
+class Recorder:
+    """
+    Latencies and status codes per endpoint name, outside the warmup window.
+    """
+
+    def __init__(self, warmup_until: float) -> None:
+        self.warmup_until = warmup_until
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+
+    async def request(self, client: AsyncClient, name: str, method: str, url: str, **kwargs: Any) -> Optional[Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception as exc:
+            if started >= self.warmup_until:
+                self.errors[name][type(exc).__name__] += 1
+            return None
+        if started >= self.warmup_until:
+            self.latencies[name].append((time.perf_counter() - started) * 1000)
+            self.statuses[name][response.status_code] += 1
+        return response
+
+    def report(self, seconds: float) -> Dict[str, Any]:
+        endpoints = {}
+        for name in sorted(set(self.statuses) | set(self.errors)):
+            statuses = self.statuses[name]
+            failed = sum(n for code, n in statuses.items() if code >= 500) + sum(self.errors[name].values())
+            endpoints[name] = {
+                **summarize(self.latencies[name]),
+                "rps": len(self.latencies[name]) / seconds if seconds else 0.0,
+                "failed": failed,
+                "status": {str(code): n for code, n in sorted(statuses.items())},
+                "exceptions": dict(self.errors[name]),
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        return {"requests": total, "rps": total / seconds if seconds else 0.0, "endpoints": endpoints}
+
+
+class PoolSampler:
+    """
+    Polls /metrics and keeps per-engine connection pool samples.
+    """
+
+    def __init__(self, client: AsyncClient, interval: float, token: Optional[str] = None) -> None:
+        self.client = client
+        self.interval = interval
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.samples: Dict[str, List[Dict[str, float]]] = defaultdict(list)
+
+    async def sample(self) -> None:
+        try:
+            response = await self.client.get("/metrics", headers=self.headers)
+        except Exception:
+            return
+        if response.status_code != 200:
+            return
+        current: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for engine, state, value in POOL_SAMPLE_RE.findall(response.text):
+            current[engine][state] = float(value)
+        for engine, states in current.items():
+            self.samples[engine].append(states)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            await self.sample()
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def report(self) -> Dict[str, Any]:
+        result = {}
+        for engine, samples in self.samples.items():
+            checked_out = [s.get("checked_out", 0.0) for s in samples]
+            capacity = max((s.get("capacity", 0.0) for s in samples), default=0.0)
+            result[engine] = {
+                "samples": len(samples),
+                "capacity": capacity,
+                "checked_out_max": max(checked_out, default=0.0),
+                "checked_out_mean": sum(checked_out) / len(checked_out) if checked_out else 0.0,
+                # Share of samples with every connection in use: requests were queueing.
+                "saturated_fraction": (
+                    sum(1 for c in checked_out if capacity and c >= capacity) / len(checked_out)
+                    if checked_out else 0.0
+                ),
+            }
+        return result
+
+
+class VirtualUser:
+    def __init__(self, index: int, username: str, password: str, rng: random.Random) -> None:
+        self.index = index
+        self.username = username
+        self.password = password
+        self.rng = rng
+        self.headers: Dict[str, str] = {}
+        self.progress_id: Optional[int] = None
+        self.completed_points = 0
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace, client: AsyncClient) -> None:
+        self.args = args
+        self.client = client
+        self.mix = parse_mix(args.mix)
+        self.route_ids: List[int] = []
+        self.poi_ids: List[int] = []
+        self.admin_headers: Optional[Dict[str, str]] = None
+        self.recorder = Recorder(warmup_until=0.0)
+        self.scenarios: Dict[str, Callable[[VirtualUser], Awaitable[None]]] = {
+            "catalog": self.catalog,
+            "login": self.login,
+            "checkin": self.checkin,
+            "leaderboard": self.leaderboard,
+            "admin": self.admin,
+        }
+        unknown = set(self.mix) - set(self.scenarios)
+        if unknown:
+            raise SystemExit(f"unknown scenarios in --mix: {', '.join(sorted(unknown))}")
+
+    # -- setup ----------------------------------------------------------
+
+    async def _token(self, username: str, password: str) -> Optional[Dict[str, str]]:
+        response = await self.client.post(
+            f"{API}/login/access-token", data={"username": username, "password": password}
+        )
+        if response.status_code != 200:
+            return None
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def setup(self) -> List[VirtualUser]:
+        response = await self.client.get(f"{API}/routes/")
+        response.raise_for_status()
+        self.route_ids = [r["id"] for r in response.json()][: self.args.max_ids]
+        if not self.route_ids:
+            raise SystemExit("no routes to read; load some data first (python -m app.generate_data)")
+        for route_id in self.route_ids[:20]:
+            response = await self.client.get(f"{API}/routes/{route_id}")
+            if response.status_code == 200:
+                self.poi_ids.extend(p["id"] for p in response.json().get("points", []))
+
+        self.admin_headers = await self._token(self.args.admin_username, self.args.admin_password)
+        if self.admin_headers is None and "admin" in self.mix:
+            print("admin login failed; dropping the admin scenario", file=sys.stderr)
+            del self.mix["admin"]
+
+        run_id = uuid.uuid4().hex[:8]
+        rng = random.Random(self.args.seed)
+        users = []
+        for index in range(self.args.users):
+            username = f"load_{run_id}_{index}"
+            await self.client.post(
+                f"{API}/register",
+                json={"email": f"{username}@example.com", "username": username, "password": self.args.password},
+            )
+            user = VirtualUser(index, username, self.args.password, random.Random(rng.random()))
+            user.headers = await self._token(username, self.args.password) or {}
+            response = await self.client.post(
+                f"{API}/progress/",
+                json={"route_id": rng.choice(self.route_ids), "status": "started", "completed_points_count": 0},
+                headers=user.headers,
+            )
+            if response.status_code == 200:
+                user.progress_id = response.json()["id"]
+            users.append(user)
+        return users
+
+    # -- scenarios ------------------------------------------------------
+
+    async def catalog(self, user: VirtualUser) -> None:
+        roll = user.rng.random()
+        if roll < 0.5 or not self.poi_ids:
+            route_id = user.rng.choice(self.route_ids)
+            await self.recorder.request(self.client, "GET /routes/{id}", "GET", f"{API}/routes/{route_id}")
+        elif roll < 0.8:
+            poi_id = user.rng.choice(self.poi_ids)
+            await self.recorder.request(self.client, "GET /pois/{id}", "GET", f"{API}/pois/{poi_id}")
+        elif roll < 0.95:
+            await self.recorder.request(self.client, "GET /routes/", "GET", f"{API}/routes/")
+        else:
+            await self.recorder.request(self.client, "GET /pois/", "GET", f"{API}/pois/")
+
+    async def login(self, user: VirtualUser) -> None:
+        response = await self.recorder.request(
+            self.client,
+            "POST /login/access-token",
+            "POST",
+            f"{API}/login/access-token",
+            data={"username": user.username, "password": user.password},
+        )
+        if response is not None and response.status_code == 200:
+            user.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def checkin(self, user: VirtualUser) -> None:
+        if user.progress_id is None:
+            return
+        user.completed_points += 1
+        await self.recorder.request(
+            self.client,
+            "PUT /progress/{id}",
+            "PUT",
+            f"{API}/progress/{user.progress_id}",
+            json={"completed_points_count": user.completed_points},
+            headers=user.headers,
+        )
+
+    async def leaderboard(self, user: VirtualUser) -> None:
+        await self.recorder.request(self.client, "GET /users/leaderboard", "GET", f"{API}/users/leaderboard")
+
+    async def admin(self, user: VirtualUser) -> None:
+        response = await self.recorder.request(
+            self.client,
+            "POST /pois/",
+            "POST",
+            f"{API}/pois/",
+            json={
+                "title": f"load {user.username}",
+                "latitude": user.rng.uniform(55.55, 55.92),
+                "longitude": user.rng.uniform(37.32, 37.95),
+            },
+            headers=self.admin_headers,
+        )
+        if response is not None and response.status_code == 200:
+            await self.recorder.request(
+                self.client,
+                "DELETE /pois/{id}",
+                "DELETE",
+                f"{API}/pois/{response.json()['id']}",
+                headers=self.admin_headers,
+            )
+
+    # -- run ------------------------------------------------------------
+
+    async def virtual_user(self, user: VirtualUser, deadline: float) -> None:
+        names = list(self.mix)
+        weights = list(self.mix.values())
+        # Stagger start-up so users don't move in lockstep.
+        await asyncio.sleep(user.rng.uniform(0, self.args.think_time / 1000))
+        while time.perf_counter() < deadline:
+            await self.scenarios[user.rng.choices(names, weights)[0]](user)
+            await asyncio.sleep(user.rng.expovariate(1000 / self.args.think_time) if self.args.think_time else 0)
+
+    async def run(self) -> Dict[str, Any]:
+        users = await self.setup()
+        started = time.perf_counter()
+        self.recorder.warmup_until = started + self.args.warmup
+        deadline = started + self.args.warmup + self.args.duration
+        sampler = PoolSampler(self.client, self.args.pool_interval, self.args.metrics_token)
+        stop = asyncio.Event()
+        sampler_task = asyncio.create_task(sampler.run(stop))
+        await asyncio.gather(*(self.virtual_user(user, deadline) for user in users))
+        stop.set()
+        await sampler_task
+        measured = time.perf_counter() - self.recorder.warmup_until
+        return {
+            "config": {
+                "base_url": self.args.base_url or "in-process",
+                "users": self.args.users,
+                "duration": self.args.duration,
+                "warmup": self.args.warmup,
+                "think_time_ms": self.args.think_time,
+                "mix": self.mix,
+                "seed": self.args.seed,
+            },
+            "seconds": measured,
+            **self.recorder.report(measured),
+            "pool": sampler.report(),
+        }
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if float(weight or 0) > 0:
+            mix[name.strip()] = float(weight)
+    return mix
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(f"{result['requests']} requests in {result['seconds']:.1f}s, {result['rps']:.1f} req/s")
+    print(f"{'endpoint':28} {'count':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'failed':>7}  status")
+    for name, e in result["endpoints"].items():
+        print(
+            f"{name:28} {e['count']:7d} {e['rps']:8.1f} {e['p50']:8.1f} {e['p95']:8.1f} {e['p99']:8.1f} "
+            f"{e['failed']:7d}  {e['status']}"
+        )
+    for engine, p in result["pool"].items():
+        print(
+            f"pool {engine}: capacity={p['capacity']:.0f} checked_out max={p['checked_out_max']:.0f} "
+            f"mean={p['checked_out_mean']:.1f} saturated={p['saturated_fraction']:.0%}"
+        )
+
+
+def compare(baseline_path: str, current_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+
+    def delta(old: float, new: float) -> str:
+        return f"{(new - old) / old:+.0%}" if old else "n/a"
+
+    print(f"throughput {baseline['rps']:.1f} -> {current['rps']:.1f} req/s ({delta(baseline['rps'], current['rps'])})")
+    for name, e in current["endpoints"].items():
+        old = baseline["endpoints"].get(name)
+        if old is None:
+            continue
+        print(
+            f"{name:28} p95 {old['p95']:8.1f} -> {e['p95']:8.1f} ms ({delta(old['p95'], e['p95'])})  "
+            f"p99 {old['p99']:8.1f} -> {e['p99']:8.1f} ms ({delta(old['p99'], e['p99'])})"
+        )
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.base_url:
+        client = AsyncClient(base_url=args.base_url, timeout=args.timeout)
+    else:
+        from httpx import ASGITransport
+
+        from app.api import deps
+        from app.core.ratelimit import TokenBucketLimiter
+        from app.main import app
+
+        # Every virtual user logs in from the same "IP" in-process.
+        deps.login_ip_limiter = TokenBucketLimiter(rate_per_minute=0, burst=0)
+        deps.login_account_limiter = TokenBucketLimiter(rate_per_minute=0, burst=0)
+        client = AsyncClient(transport=ASGITransport(app=app), base_url="http://loadtest", timeout=args.timeout)
+
+    async with client:
+        result = await LoadTest(args, client).run()
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="target server; in-process against DATABASE_URL if omitted")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds excluded from the results")
+    parser.add_argument("--think-time", type=float, default=100.0, help="mean ms between a user's requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,... (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--admin-username", default="admin@example.com")
+    parser.add_argument("--admin-password", default="changethis")
+    parser.add_argument("--max-ids", type=int, default=10_000, help="route ids sampled for catalog reads")
+    parser.add_argument("--pool-interval", type=float, default=0.5, help="seconds between /metrics samples")
+    parser.add_argument("--metrics-token", help="the server's METRICS_TOKEN")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write JSON results here")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="diff two result files and exit")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.compare:
+        compare(*arguments.compare)
+    else:
+        asyncio.run(main(arguments))
@@ -0,0 +1,99 @@
+"""
+Login burst benchmark.
+
+Fires a burst of concurrent logins at the app while polling an unrelated,
+DB-free endpoint (`GET /`) and reports that endpoint's latency percentiles.
+If bcrypt blocks the event loop, the probe latency tracks bcrypt time; with
+password work on the hasher pool it should stay flat.
+
+Runs the ASGI app in-process against DATABASE_URL:
+
+    python -m benchmarks.login_burst --logins 200 --concurrency 50
+    python -m benchmarks.login_burst --inline   # old behaviour, for comparison
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import List
+
+from httpx import ASGITransport, AsyncClient
+
+from app.api import deps
+from app.core import security
+from app.core.ratelimit import TokenBucketLimiter
+from app.main import app
+from benchmarks.common import percentile
+
+
+async def _inline_run(func, *args):
+    # Bypass the pool and run bcrypt on the event loop, as before.
+    return func(*args)
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.inline:
+        security.password_hasher.run = _inline_run
+    # The burst is deliberately one client hammering one account.
+    deps.login_ip_limiter = TokenBucketLimiter(rate_per_minute=0, burst=0)
+    deps.login_account_limiter = TokenBucketLimiter(rate_per_minute=0, burst=0)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        uid = uuid.uuid4().hex
+        username = f"bench_{uid}"
+        password = "benchpassword"
+        await client.post(
+            "/api/v1/register",
+            json={"email": f"{username}@example.com", "username": username, "password": password},
+        )
+
+        probe_latencies: List[float] = []
+        login_latencies: List[float] = []
+        done = asyncio.Event()
+        slots = asyncio.Semaphore(args.concurrency)
+
+        async def probe() -> None:
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/")
+                probe_latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(args.probe_interval / 1000)
+
+        async def login() -> None:
+            async with slots:
+                started = time.perf_counter()
+                await client.post(
+                    "/api/v1/login/access-token",
+                    data={"username": username, "password": password},
+                )
+                login_latencies.append((time.perf_counter() - started) * 1000)
+
+        probe_task = asyncio.create_task(probe())
+        burst_started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(args.logins)))
+        burst_seconds = time.perf_counter() - burst_started
+        done.set()
+        await probe_task
+
+    mode = "inline" if args.inline else f"pool({security.password_hasher.max_workers})"
+    print(f"mode={mode} logins={args.logins} concurrency={args.concurrency} burst={burst_seconds:.2f}s")
+    for name, samples in (("probe GET /", probe_latencies), ("login", login_latencies)):
+        print(
+            f"{name:12} n={len(samples):5d} "
+            f"p50={percentile(samples, 50):8.2f}ms "
+            f"p99={percentile(samples, 99):8.2f}ms "
+            f"max={max(samples, default=0):8.2f}ms "
+            f"mean={statistics.fmean(samples) if samples else 0:8.2f}ms"
+        )
+    if not args.inline:
+        print("hasher stats:", security.password_hasher.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=25)
+    parser.add_argument("--probe-interval", type=float, default=5.0, help="ms between probe requests")
+    parser.add_argument("--inline", action="store_true", help="run bcrypt on the event loop")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,334 @@
+"""
+Microbenchmarks for per-request hot paths, checked against a stored baseline.
+
+    python -m benchmarks.micro                 # run and compare with the baseline
+    python -m benchmarks.micro --save          # record a new baseline
+    python -m benchmarks.micro -k route        # only benchmarks whose name contains "route"
+
+Each benchmark is timed in `--repeats` rounds (garbage collector off), each
+round running enough iterations to last at least `--min-time` seconds and
+followed by a round of a fixed reference workload. What gets compared is
+the benchmark's fastest round divided by the reference's fastest round:
+noise from other processes only ever adds time, so minimums move far less
+than medians, and a machine that is slower this minute (CPU steal,
+frequency scaling) slows the reference just as much. A baseline is
+recorded over `--save-runs` full passes of the suite and stores the median
+of the passes' ratios and their spread (interquartile range / median).
+
+A run fails when its ratio exceeds the baseline's by more than
+`--threshold` plus the baseline's spread, the spread counting for at most
+MAX_SPREAD so a noisy baseline can't hide a real slowdown. Anything over
+that is measured once more, and the faster of the two counts.
+
+Baselines are only comparable on the machine (and Python) that recorded
+them; record one on the CI runner and refresh it when the runner changes.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.schemas.token import TokenPayload
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+# Most of a baseline's spread that is added to the threshold
+MAX_SPREAD = 0.05
+
+# name -> setup function returning the zero-argument callable to time
+BENCHMARKS: Dict[str, Callable[[], Callable[[], Any]]] = {}
+
+
+def benchmark(name: str) -> Callable:
+    def register(setup: Callable[[], Callable[[], Any]]) -> Callable[[], Callable[[], Any]]:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def make_location(lon: float, lat: float):
+    # Same shape as a value loaded from the DB: hex EWKB with the SRID.
+    from geoalchemy2.elements import WKBElement
+    from shapely import wkb
+    from shapely.geometry import Point
+
+    return WKBElement(wkb.dumps(Point(lon, lat), hex=True, srid=4326), srid=4326, extended=True)
+
+
+def make_pois(count: int) -> List[Any]:
+    from app import models
+
+    return [
+        models.PointOfInterest(
+            id=i,
+            title=f"Place {i}",
+            description="Historic site near the river embankment.",
+            location=make_location(37.6 + i * 1e-5, 55.75 + i * 1e-5),
+            historic_image_url=f"https://example.com/historic/{i}.jpg",
+            modern_image_url=f"https://example.com/modern/{i}.jpg",
+        )
+        for i in range(count)
+    ]
+
+
+def make_rows(count: int) -> List[Dict[str, Any]]:
+    # What read_pois builds from its raw SQL rows.
+    return [
+        {
+            "id": i,
+            "title": f"Place {i}",
+            "description": "Historic site near the river embankment.",
+            "historic_image_url": f"https://example.com/historic/{i}.jpg",
+            "modern_image_url": None,
+            "latitude": 55.75 + i * 1e-5,
+            "longitude": 37.6 + i * 1e-5,
+        }
+        for i in range(count)
+    ]
+
+
+@benchmark("jwt.encode")
+def bench_jwt_encode():
+    return lambda: create_access_token(12345, token_version=3)
+
+
+@benchmark("jwt.decode")
+def bench_jwt_decode():
+    from jose import jwt
+
+    token = create_access_token(12345, token_version=3)
+
+    def run():
+        # Mirrors deps.get_principal.
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        return TokenPayload(**payload)
+
+    return run
+
+
+@benchmark("geometry.wkb_to_point")
+def bench_wkb_to_point():
+    from geoalchemy2.shape import to_shape
+
+    location = make_location(37.6176, 55.7520)
+
+    def run():
+        point = to_shape(location)
+        return point.x, point.y
+
+    return run
+
+
+@benchmark("schema.poi")
+def bench_poi_schema():
+    from app.api.v1.endpoints.pois import poi_to_schema
+
+    poi = make_pois(1)[0]
+    return lambda: poi_to_schema(poi)
+
+
+@benchmark("schema.route_12_points")
+def bench_route_schema():
+    from app import models
+    from app.api.v1.endpoints.routes import route_to_schema
+
+    route = models.Route(
+        id=1, title="Walk", description="A walk", difficulty="easy", reward_xp=300.0, is_premium=False,
+        points=make_pois(12),
+    )
+    return lambda: route_to_schema(route)
+
+
+def _bench_json_dicts(count: int):
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    rows = make_rows(count)
+    # Endpoints without a response_model: jsonable_encoder, then JSONResponse.
+    return lambda: JSONResponse(jsonable_encoder(rows)).body
+
+
+def _bench_json_models(count: int):
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+
+    from app import schemas
+
+    adapter = TypeAdapter(List[schemas.PointOfInterest])
+    items = adapter.validate_python(make_rows(count))
+    # Endpoints with a response_model: dump in JSON mode, then JSONResponse.
+    return lambda: JSONResponse(adapter.dump_python(items, mode="json")).body
+
+
+for _count, _label in ((1_000, "1k"), (10_000, "10k")):
+    benchmark(f"json.dicts_{_label}")(lambda count=_count: _bench_json_dicts(count))
+    benchmark(f"json.models_{_label}")(lambda count=_count: _bench_json_models(count))
+
+
+def reference() -> str:
+    # Mix of interpreter work and C calls, like the benchmarks themselves.
+    return json.dumps([{"id": i, "name": "place " * (i % 5), "tags": [i, str(i)]} for i in range(100)])
+
+
+def _calls_per_round(func: Callable[[], Any], min_time: float) -> int:
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return number
+        number = max(number * 2, int(number * min_time * 1.1 / max(elapsed, 1e-9)))
+
+
+def _round(func: Callable[[], Any], number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - started) / number
+
+
+def measure(func: Callable[[], Any], repeats: int, min_time: float) -> Dict[str, float]:
+    """
+    Seconds per call (min and median over `repeats` rounds) and `relative`,
+    the fastest round over the fastest interleaved reference round.
+    """
+    func()  # warm caches and lazy imports
+    number = _calls_per_round(func, min_time)
+    reference_number = _calls_per_round(reference, min_time)
+
+    rounds, reference_rounds = [], []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            rounds.append(_round(func, number))
+            reference_rounds.append(_round(reference, reference_number))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "min": min(rounds),
+        "median": statistics.median(rounds),
+        "relative": min(rounds) / min(reference_rounds),
+        "iterations": number,
+    }
+
+
+def record(names: List[str], runs: int, repeats: int, min_time: float) -> Dict[str, Dict[str, float]]:
+    """
+    Baseline figures from `runs` interleaved passes over `names`: the
+    median of the pass ratios and their relative interquartile range.
+    """
+    passes: Dict[str, List[Dict[str, float]]] = {name: [] for name in names}
+    for run in range(runs):
+        print(f"baseline pass {run + 1}/{runs}", file=sys.stderr)
+        for name in names:
+            passes[name].append(measure(BENCHMARKS[name](), repeats, min_time))
+    results = {}
+    for name, measured in passes.items():
+        ratios = [m["relative"] for m in measured]
+        relative = statistics.median(ratios)
+        q1, _, q3 = statistics.quantiles(ratios, n=4, method="inclusive")
+        results[name] = {
+            "relative": relative,
+            "min": statistics.median(m["min"] for m in measured),
+            "spread": (q3 - q1) / relative,
+            "runs": runs,
+            "iterations": measured[-1]["iterations"],
+        }
+    return results
+
+
+def allowed_slowdown(base: Dict[str, float], threshold: float) -> float:
+    return threshold + min(base.get("spread", 0.0), MAX_SPREAD)
+
+
+def format_seconds(value: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if value >= scale:
+            return f"{value / scale:8.2f}{unit:>2}"
+    return f"{value / 1e-9:8.2f}ns"
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(args: argparse.Namespace) -> int:
+    names = [n for n in BENCHMARKS if not args.k or args.k in n]
+    if args.save:
+        results = record(names, args.save_runs, args.repeats, args.min_time)
+        saved = load_baseline(args.baseline)
+        saved.setdefault("results", {}).update(results)
+        saved["machine"] = {"python": platform.python_version(), "platform": platform.platform()}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(saved, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"{'benchmark':26} {'min':>10} {'spread':>8}")
+        for name in names:
+            print(f"{name:26} {format_seconds(results[name]['min'])} {results[name]['spread']:>8.1%}")
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline).get("results", {})
+    regressions = []
+    print(f"{'benchmark':26} {'min':>10} {'baseline':>10} {'change':>8} {'allowed':>8}")
+    for name in names:
+        result = measure(BENCHMARKS[name](), args.repeats, args.min_time)
+        base = baseline.get(name)
+        change = allowed = ""
+        if base and "relative" in base:
+            margin = allowed_slowdown(base, args.threshold)
+            ratio = result["relative"] / base["relative"] - 1
+            if ratio > margin:
+                # Measure once more before calling it: a single noisy run
+                # (another process waking up) shouldn't fail the build.
+                retry = measure(BENCHMARKS[name](), args.repeats, args.min_time)
+                if retry["relative"] < result["relative"]:
+                    result = retry
+                    ratio = result["relative"] / base["relative"] - 1
+            change, allowed = f"{ratio:+.1%}", f"{margin:+.0%}"
+            if ratio > margin:
+                regressions.append((name, ratio, margin))
+                change += " !"
+        print(
+            f"{name:26} {format_seconds(result['min'])} "
+            f"{format_seconds(base['min']) if base else '':>10} {change:>8} {allowed:>8}"
+        )
+
+    if regressions:
+        for name, ratio, margin in regressions:
+            print(f"REGRESSION {name}: {ratio:+.1%} (allowed {margin:+.0%})", file=sys.stderr)
+        return 1
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeats", type=int, default=15)
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per round")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed slowdown on top of the baseline's spread (at most MAX_SPREAD), 0.2 = 20%%"
+    )
+    parser.add_argument("--save-runs", type=int, default=7, help="passes of the suite a baseline is taken over")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="record results as the new baseline")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))